@@ -1,10 +1,13 @@
 """ Flask API for the search interface """
 
 from os import getenv
+import atexit
 from flask import Flask, request
 from flask_cors import CORS, cross_origin
 from markupsafe import escape
 from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db.pool import open_pool, close_pools
+from biosearch_core.db.surrogate_cache import SurrogateCache
 from biosearch_core.controllers.search_controller import SearchController
 from biosearch_core.controllers.lucene_controller import LuceneController
 
@@ -16,6 +19,8 @@ CORS(app)
 INDEXDIR = getenv("INDEX_PATH")
 ROOT = getenv("FLASK_ROOT")
 SCHEMA = getenv("SCHEMA")
+# read subfigures from the materialized view created with create_tables -v
+SURROGATE_VIEW = getenv("SURROGATE_VIEW", "false") == "true"
 
 
 conn_params = ConnectionParams(
@@ -26,6 +31,18 @@ conn_params = ConnectionParams(
     password=getenv("DBPASSWORD"),
     schema=SCHEMA,
 )
+open_pool(
+    conn_params,
+    min_size=int(getenv("DBPOOL_MIN_SIZE", "1")),
+    max_size=int(getenv("DBPOOL_MAX_SIZE", "10")),
+)
+atexit.register(close_pools)
+
+# surrogates are invalidated by the prediction and offload jobs
+surrogate_cache = SurrogateCache(
+    max_entries=int(getenv("SURROGATE_CACHE_SIZE", "1024"))
+)
+surrogate_cache.listen(conn_params)
 
 
 @cross_origin()
@@ -40,9 +57,11 @@ def hello():
 def get_document_db(doc_id: int):
     """test function"""
     document_id = int(escape(doc_id))
-    controller = SearchController(conn_params)
-    document = controller.fetch_surrogate_data(document_id)
-    return document
+    controller = SearchController(
+        conn_params, cache=surrogate_cache, use_surrogate_view=SURROGATE_VIEW
+    )
+    document = controller.fetch_serialized_surrogate(document_id)
+    return app.response_class(document, mimetype="application/json")
 
 
 @cross_origin()
@@ -13,6 +13,7 @@ tests/bilava/tests_bilava_on_first_finish.py
 run: poetry run pytest -s tests/bilava/tests_bilava_on_first_finish.py 
 """
 from sys import argv
+from collections import defaultdict
 from math import ceil, floor
 from os import listdir, remove
 from typing import List, Dict, Optional, Tuple
@@ -28,6 +29,7 @@ from psycopg.rows import dict_row
 from biosearch_core.data.figure import SubFigureStatus
 from biosearch_core.bilava.session import create_session
 from biosearch_core.db.model import ConnectionParams, params_from_env
+from biosearch_core.db.surrogate_cache import notify_subfigures_changed
 
 
 def fetch_affected_classifiers(cursor: Cursor, schema: str) -> List[str]:
@@ -170,6 +172,12 @@ def update_original_subfigures(cursor: Cursor, subfigures: List[Dict]):
     query = sql.SQL(all_queries.format(*flattened_values))
     cursor.execute(query)
 
+    ids_per_schema = defaultdict(list)
+    for subfigure in subfigures:
+        ids_per_schema[subfigure["schema"]].append(subfigure["id"])
+    for schema, subfigure_ids in ids_per_schema.items():
+        notify_subfigures_changed(cursor, schema, subfigure_ids)
+
 
 def get_parquet_filename(classifier: str, output_folder: str) -> str:
     """Get filename with new version for training file"""
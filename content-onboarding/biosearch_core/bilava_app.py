@@ -1,6 +1,8 @@
 """ Flask API for the search interface """
 
 from os import environ
+import atexit
+from dataclasses import replace
 from pathlib import Path
 from dotenv import load_dotenv
 from flask import Flask, request, jsonify
@@ -8,6 +10,7 @@ from flask_cors import CORS, cross_origin
 from markupsafe import escape
 from werkzeug.exceptions import BadRequest, InternalServerError
 from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db.pool import open_pool, close_pools
 from biosearch_core.controllers import bilava
 
 # initialize Flask
@@ -21,6 +24,22 @@ PROJECTS_DIR = environ.get("PROJECTS_DIR")
 print(PROJECTS_DIR)
 print(ROOT)
 
+# every route shares the same database, only the schema changes
+conn_params = ConnectionParams(
+    host=environ.get("host"),
+    port=environ.get("port"),
+    dbname=environ.get("dbname"),
+    user=environ.get("user"),
+    password=environ.get("password"),
+    schema=environ.get("schema"),
+)
+open_pool(
+    conn_params,
+    min_size=int(environ.get("DBPOOL_MIN_SIZE", "1")),
+    max_size=int(environ.get("DBPOOL_MAX_SIZE", "10")),
+)
+atexit.register(close_pools)
+
 # this should come from the configuration file
 schemas_2_base_img_dir = {
     "training": "curation_data",
@@ -47,15 +66,7 @@ def handle_internal_server_error(e):
 def fetch_taxonomy(project):
     """Retrieve labels from db"""
     project = escape(project)
-    conn_params = ConnectionParams(
-        host=environ.get("host"),
-        port=environ.get("port"),
-        dbname=environ.get("dbname"),
-        user=environ.get("user"),
-        password=environ.get("password"),
-        schema=project,
-    )
-    return bilava.fetch_labels_list(conn_params)
+    return bilava.fetch_labels_list(replace(conn_params, schema=project))
 
 
 @cross_origin
@@ -79,14 +90,6 @@ def fetch_projections(classifier: str, reduction: str, split_set: str):
     classifier = escape(classifier)
     reduction = escape(reduction)
     split_set = escape(split_set)
-    conn_params = ConnectionParams(
-        host=environ.get("host"),
-        port=environ.get("port"),
-        dbname=environ.get("dbname"),
-        user=environ.get("user"),
-        password=environ.get("password"),
-        schema=environ.get("schema"),
-    )
     # pylint: disable=too-many-function-args
     return bilava.fetch_images(
         conn_params,
@@ -107,14 +110,6 @@ def fetch_extra_image_info(img_id: int, classifier: str):
     """Retrieve additional information for image"""
     img_id = escape(img_id)
     classifier = escape(classifier)
-    conn_params = ConnectionParams(
-        host=environ.get("host"),
-        port=environ.get("port"),
-        dbname=environ.get("dbname"),
-        user=environ.get("user"),
-        password=environ.get("password"),
-        schema=environ.get("schema"),
-    )
     return bilava.fetch_image_extras(conn_params, img_id, classifier)
 
 
@@ -129,14 +124,6 @@ def batch_update_labels():
         and len(inputs["ids"]) > 0
         and inputs["label"].strip() != ""
     ):
-        conn_params = ConnectionParams(
-            host=environ.get("host"),
-            port=environ.get("port"),
-            dbname=environ.get("dbname"),
-            user=environ.get("user"),
-            password=environ.get("password"),
-            schema=environ.get("schema"),
-        )
         result = bilava.update_image_labels(conn_params, inputs["ids"], inputs["label"])
         if not result:
             raise InternalServerError("Error executing updates")
@@ -4,9 +4,10 @@ import json
 import logging
 from typing import List, Literal, Dict
 from datetime import datetime
-from psycopg import connect, sql
+from psycopg import sql
 from psycopg.rows import dict_row
 from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db.pool import connection
 from biosearch_core.data.figure import SubFigureStatus
 
 
@@ -33,8 +34,7 @@ def fetch_labels_list(conn_params: ConnectionParams) -> List[str]:
     """Fetch labels from database to fit the taxonomy tree"""
 
     labels = None
-    # pylint: disable=not-context-manager
-    with connect(conninfo=conn_params.conninfo()) as conn:
+    with connection(conn_params) as conn:
         with conn.cursor() as cursor:
             try:
                 query = f"SELECT label from {conn_params.schema}.figures"
@@ -74,9 +74,8 @@ def fetch_images(
     images = None
     lbl_len = len(classifiers_mapper[classifier]) + 4  # . and next level
 
-    # pylint: disable=not-context-manager
-    with connect(conninfo=conn_params.conninfo(), row_factory=dict_row) as conn:
-        with conn.cursor() as cursor:
+    with connection(conn_params) as conn:
+        with conn.cursor(row_factory=dict_row) as cursor:
             try:
                 query = """
                  SELECT id, uri, prediction as prd, 
@@ -154,9 +153,8 @@ def fetch_images(
 
 def fetch_image_extras(conn_params: ConnectionParams, db_id: int, classifier: str):
     """Fetch information for the thumbnail details panel"""
-    # pylint: disable=not-context-manager
-    with connect(conninfo=conn_params.conninfo(), row_factory=dict_row) as conn:
-        with conn.cursor() as cursor:
+    with connection(conn_params) as conn:
+        with conn.cursor(row_factory=dict_row) as cursor:
             try:
                 # pylint: disable=C0209:consider-using-f-string
                 query = """
@@ -208,8 +206,7 @@ def update_image_labels(
     single_query = f"UPDATE {conn_params.schema}.features SET upt_label='{label}', "
     single_query += "upt_date=('{}') WHERE id=({}); "  # the placeholder
 
-    # pylint: disable=not-context-manager
-    with connect(conninfo=conn_params.conninfo(), autocommit=False) as conn:
+    with connection(conn_params) as conn:
         with conn.cursor() as cursor:
             try:
                 all_queries = single_query * len(query_params)
@@ -221,4 +218,5 @@ def update_image_labels(
             except Exception as exc:
                 print("Error updating features in database", exc)
                 logging.error("Error updating features in database", exc_info=True)
+                conn.rollback()
                 return False
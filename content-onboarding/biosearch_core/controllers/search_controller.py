@@ -1,19 +1,34 @@
 """ Controller for the search api"""
-from typing import Dict
+from typing import Dict, Optional
 from collections import defaultdict
-from psycopg import connect, Cursor
+import json
+from psycopg import Cursor
 from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db.pool import connection
+from biosearch_core.db.surrogate_cache import SurrogateCache
 from biosearch_core.data.document import DocumentModel as dmod
 
 
 class SearchController:
     """Process the requests from the search api"""
 
-    def __init__(self, conn_params: ConnectionParams):
+    def __init__(
+        self,
+        conn_params: ConnectionParams,
+        cache: Optional[SurrogateCache] = None,
+        use_surrogate_view: bool = False,
+    ):
         self.conn_params = conn_params
+        self.cache = cache
+        self.use_surrogate_view = use_surrogate_view
 
     def _fetch_subfigures_per_page(self, cursor: Cursor, doc_id: int) -> Dict:
-        subfigures = dmod.fetch_subfigures(cursor, doc_id, self.conn_params.schema)
+        subfigures = dmod.fetch_subfigures(
+            cursor,
+            doc_id,
+            self.conn_params.schema,
+            from_view=self.use_surrogate_view,
+        )
         subfigures_by_page = defaultdict(list)
         for subfigure in subfigures:
             subfigures_by_page[subfigure.page_number].append(subfigure)
@@ -22,10 +37,9 @@ class SearchController:
     def fetch_surrogate_data(self, doc_id: int) -> Dict:
         """Information to populate surrogate cards"""
 
-        # pylint: disable=not-context-manager
         doc_id = int(doc_id)
         schema = self.conn_params.schema
-        with connect(conninfo=self.conn_params.conninfo()) as conn:
+        with connection(self.conn_params) as conn:
             with conn.cursor() as cursor:
                 surrogate_info = dmod.fetch_surrogate_details(cursor, doc_id, schema)
                 subfigures_by_page = self._fetch_subfigures_per_page(cursor, doc_id)
@@ -76,3 +90,14 @@ class SearchController:
             "pmcid": surrogate_info.pmcid,
             "otherid": surrogate_info.otherid,
         }
+
+    def fetch_serialized_surrogate(self, doc_id: int) -> str:
+        """Surrogate data as a JSON string, served from the cache when available"""
+        doc_id = int(doc_id)
+
+        def compute() -> str:
+            return json.dumps(self.fetch_surrogate_data(doc_id))
+
+        if self.cache is None:
+            return compute()
+        return self.cache.get_or_compute(self.conn_params.schema, doc_id, compute)
@@ -5,6 +5,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional, List
 from psycopg import Cursor
+from psycopg.rows import tuple_row
 from biosearch_core.data.figure import FigureType
 
 
@@ -110,17 +111,7 @@ class DocumentModel:
         cursor: Cursor, doc_id: int, schema: str
     ) -> DocSurrogate:
         """Retrieve document surrogate details"""
-        query = """
-            SELECT d.id, d.title, d.authors, d.journal, COUNT(f.id), d.pmcid, d.otherid
-            FROM {schema}.documents d, {schema}.figures f
-            WHERE d.id = {doc_id} 
-                  AND f.doc_id = d.id 
-                  AND f.fig_type = {fig_type}
-            GROUP BY d.id
-        """.format(
-            schema=schema, doc_id=doc_id, fig_type=FigureType.FIGURE.value
-        )
-        cursor.execute(query)
+        cursor.execute(surrogate_details_query(schema, doc_id))
         rows = cursor.fetchall()
 
         if rows:
@@ -136,21 +127,17 @@ class DocumentModel:
         raise ValueError(f"No data found for document {doc_id}")
 
     @staticmethod
-    def fetch_subfigures(cursor: Cursor, doc_id: int, schema: str) -> List[Subfigure]:
-        """Fetch document subfigures"""
+    def fetch_subfigures(
+        cursor: Cursor, doc_id: int, schema: str, from_view: bool = False
+    ) -> List[Subfigure]:
+        """Fetch document subfigures. With from_view, read the precomputed rows
+        from the surrogate_subfigures materialized view instead of joining the
+        figures table to itself"""
         # TODO, captions should be fetched separately to not repeat the data
-        query = """
-            SELECT f.id as figId, sf.id as subfigId, f.caption, f.uri, sf.uri, sf.coordinates, sf.label as prediction, f.width, f.height, f.page
-            FROM {schema}.figures f, 
-                 {schema}.figures sf,
-                 {schema}.documents d
-            WHERE d.id={doc_id} 
-                 AND d.id = f.doc_id 
-                 AND f.fig_type=0  
-                 AND f.id = sf.parent_id 
-        """.format(
-            schema=schema, doc_id=doc_id
-        )
+        if from_view:
+            query = surrogate_view_query(schema, doc_id)
+        else:
+            query = subfigures_query(schema, doc_id)
         cursor.execute(query)
         rows = cursor.fetchall()
 
@@ -171,3 +158,62 @@ class DocumentModel:
                 )
             )
         return results
+
+    @staticmethod
+    def refresh_surrogate_view(cursor: Cursor, schema: str) -> bool:
+        """Refresh the surrogate materialized view if the schema has one. The
+        first refresh populates the view, later ones run concurrently so the
+        search api can keep reading it. Returns whether the view exists."""
+        query = """
+            SELECT ispopulated FROM pg_matviews
+            WHERE schemaname = %s AND matviewname = 'surrogate_subfigures'
+        """
+        with cursor.connection.cursor(row_factory=tuple_row) as view_cursor:
+            row = view_cursor.execute(query, (schema,)).fetchone()
+            if row is None:
+                return False
+            concurrently = "CONCURRENTLY" if row[0] else ""
+            view = f"{schema}.surrogate_subfigures"
+            view_cursor.execute(f"REFRESH MATERIALIZED VIEW {concurrently} {view}")
+        return True
+
+
+def surrogate_details_query(schema: str, doc_id: int) -> str:
+    """Document details and number of figures"""
+    return """
+        SELECT d.id, d.title, d.authors, d.journal, COUNT(f.id), d.pmcid, d.otherid
+        FROM {schema}.documents d, {schema}.figures f
+        WHERE d.id = {doc_id} 
+              AND f.doc_id = d.id 
+              AND f.fig_type = {fig_type}
+        GROUP BY d.id
+    """.format(
+        schema=schema, doc_id=int(doc_id), fig_type=FigureType.FIGURE.value
+    )
+
+
+def subfigures_query(schema: str, doc_id: int) -> str:
+    """Subfigures of a document joined with their parent figure"""
+    return """
+        SELECT f.id as figId, sf.id as subfigId, f.caption, f.uri, sf.uri, sf.coordinates, sf.label as prediction, f.width, f.height, f.page
+        FROM {schema}.figures f, 
+             {schema}.figures sf,
+             {schema}.documents d
+        WHERE d.id={doc_id} 
+             AND d.id = f.doc_id 
+             AND f.fig_type=0  
+             AND f.id = sf.parent_id 
+    """.format(
+        schema=schema, doc_id=int(doc_id)
+    )
+
+
+def surrogate_view_query(schema: str, doc_id: int) -> str:
+    """Same rows as subfigures_query read from the materialized view"""
+    return """
+        SELECT fig_id, subfig_id, caption, fig_uri, subfig_uri, coordinates, prediction, width, height, page
+        FROM {schema}.surrogate_subfigures
+        WHERE doc_id={doc_id}
+    """.format(
+        schema=schema, doc_id=int(doc_id)
+    )
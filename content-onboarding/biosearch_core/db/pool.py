@@ -0,0 +1,82 @@
+""" Shared connection pools for the Flask services.
+Opening a new connection per request adds the TCP + authentication handshake to
+every call. Instead, the data access functions borrow connections from a pool
+that lives for the whole process. Pools are keyed by the connection string, so
+ConnectionParams that only differ on the schema share the same pool.
+"""
+
+from contextlib import contextmanager
+from threading import Lock
+from typing import Dict, Iterator, Optional
+from psycopg import Connection
+from psycopg_pool import ConnectionPool
+from biosearch_core.db.model import ConnectionParams
+
+DEFAULT_MIN_SIZE = 1
+DEFAULT_MAX_SIZE = 10
+# seconds to wait for a free connection before raising PoolTimeout
+DEFAULT_TIMEOUT = 30.0
+# seconds before closing idle connections above min_size
+DEFAULT_MAX_IDLE = 600.0
+
+_pools: Dict[str, ConnectionPool] = {}
+_lock = Lock()
+
+
+def get_pool(
+    conn_params: ConnectionParams,
+    min_size: int = DEFAULT_MIN_SIZE,
+    max_size: Optional[int] = DEFAULT_MAX_SIZE,
+) -> ConnectionPool:
+    """Return the pool for the connection params, creating it on first use.
+    The sizes only apply when the pool is created; later calls reuse the
+    existing pool. Connections are validated before being handed out so that
+    dropped connections (e.g. after a database restart) are replaced.
+    """
+    conninfo = conn_params.conninfo()
+    with _lock:
+        pool = _pools.get(conninfo)
+        if pool is None:
+            pool = ConnectionPool(
+                conninfo=conninfo,
+                min_size=min_size,
+                max_size=max_size,
+                timeout=DEFAULT_TIMEOUT,
+                max_idle=DEFAULT_MAX_IDLE,
+                check=ConnectionPool.check_connection,
+                name=f"{conn_params.host}:{conn_params.port}/{conn_params.dbname}",
+                open=False,
+            )
+            _pools[conninfo] = pool
+    return pool
+
+
+def open_pool(
+    conn_params: ConnectionParams,
+    min_size: int = DEFAULT_MIN_SIZE,
+    max_size: Optional[int] = DEFAULT_MAX_SIZE,
+) -> ConnectionPool:
+    """Create and open the pool at start up, without waiting for the
+    connections to be ready"""
+    pool = get_pool(conn_params, min_size=min_size, max_size=max_size)
+    pool.open(wait=False)
+    return pool
+
+
+@contextmanager
+def connection(conn_params: ConnectionParams) -> Iterator[Connection]:
+    """Borrow a connection from the pool. The transaction is committed when
+    the block exits normally and rolled back on exceptions, then the connection
+    returns to the pool."""
+    pool = get_pool(conn_params)
+    pool.open()  # no-op when already open
+    with pool.connection() as conn:
+        yield conn
+
+
+def close_pools():
+    """Close every pool, used on process shutdown"""
+    with _lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
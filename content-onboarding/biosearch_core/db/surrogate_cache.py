@@ -0,0 +1,190 @@
+""" In-memory cache for the serialized document surrogates served by the search
+api. Surrogates only change when the subfigure labels change, which happens in
+batch processes (prediction and BI-LAVA offload) that run outside the api.
+Those processes call notify_surrogates_changed inside their transactions and
+Postgres delivers the notification on commit to every api process listening on
+the channel, which drops the affected entries.
+
+Payload format: "<schema>" to invalidate every document of a schema or
+"<schema>:<doc_id>,<doc_id>,..." for specific documents.
+"""
+
+from collections import OrderedDict
+from threading import Lock, Thread, Event
+from typing import Callable, Dict, List, Optional, Tuple
+import logging
+from psycopg import Cursor, OperationalError, connect
+from psycopg.rows import tuple_row
+from biosearch_core.db.model import ConnectionParams
+
+CHANNEL = "surrogates"
+# postgres rejects payloads of 8000 bytes or longer
+MAX_PAYLOAD = 7500
+RECONNECT_SECONDS = 5
+
+
+def notify_surrogates_changed(
+    cursor: Cursor, schema: str, doc_ids: Optional[List[int]] = None
+):
+    """Invalidation hook for the processes updating labels. Without doc_ids,
+    every document in the schema is invalidated. The notifications are only
+    delivered if the transaction commits."""
+    if not doc_ids:
+        payloads = [schema]
+    else:
+        payloads = []
+        current = []
+        size = len(schema) + 1
+        for doc_id in sorted(set(int(el) for el in doc_ids)):
+            value = str(doc_id)
+            if current and size + len(value) + 1 > MAX_PAYLOAD:
+                payloads.append(f"{schema}:{','.join(current)}")
+                current = []
+                size = len(schema) + 1
+            current.append(value)
+            size += len(value) + 1
+        payloads.append(f"{schema}:{','.join(current)}")
+
+    for payload in payloads:
+        cursor.execute("SELECT pg_notify(%s, %s)", (CHANNEL, payload))
+
+
+def notify_subfigures_changed(
+    cursor: Cursor, schema: str, subfigure_ids: List[int]
+):
+    """Invalidation hook when the caller knows the updated subfigures but not
+    their documents"""
+    if len(subfigure_ids) == 0:
+        return
+    query = f"SELECT DISTINCT doc_id FROM {schema}.figures WHERE id = ANY(%s)"
+    # callers may use dict_row cursors
+    with cursor.connection.cursor(row_factory=tuple_row) as doc_cursor:
+        rows = doc_cursor.execute(query, ([int(el) for el in subfigure_ids],))
+        doc_ids = [row[0] for row in rows.fetchall() if row[0] is not None]
+        if doc_ids:
+            notify_surrogates_changed(doc_cursor, schema, doc_ids)
+
+
+def parse_payload(payload: str) -> Tuple[str, Optional[List[int]]]:
+    """Return the schema and the document ids (None for the whole schema)"""
+    if ":" not in payload:
+        return payload, None
+    schema, values = payload.split(":", 1)
+    return schema, [int(el) for el in values.split(",") if el != ""]
+
+
+class SurrogateCache:
+    """Bounded LRU cache of serialized surrogates keyed by (schema, doc_id)"""
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int], str]" = OrderedDict()
+        # bumped by every invalidation, payloads computed across a bump are
+        # not stored. clear() bumps the epoch of every schema.
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self._lock = Lock()
+        self._stop = Event()
+        self._listener: Optional[Thread] = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, schema: str, doc_id: int) -> Optional[str]:
+        """Cached payload or None"""
+        key = (schema, int(doc_id))
+        with self._lock:
+            payload = self._entries.get(key)
+            if payload is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, schema: str, doc_id: int, payload: str):
+        """Store payload, evicting the least recently used entry when full"""
+        with self._lock:
+            self._store((schema, int(doc_id)), payload)
+
+    def _store(self, key: Tuple[str, int], payload: str):
+        self._entries[key] = payload
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _generation(self, schema: str) -> Tuple[int, int]:
+        return self._epoch, self._generations.get(schema, 0)
+
+    def get_or_compute(
+        self, schema: str, doc_id: int, compute: Callable[[], str]
+    ) -> str:
+        """Return the cached payload or compute it and cache it. The lock is not
+        held while computing so slow queries do not block other requests. If
+        the schema is invalidated meanwhile, the payload may be stale and is
+        returned without caching it."""
+        payload = self.get(schema, doc_id)
+        if payload is None:
+            with self._lock:
+                generation = self._generation(schema)
+            payload = compute()
+            with self._lock:
+                if self._generation(schema) == generation:
+                    self._store((schema, int(doc_id)), payload)
+        return payload
+
+    def invalidate(self, schema: str, doc_ids: Optional[List[int]] = None):
+        """Drop the documents from the schema, or the whole schema"""
+        with self._lock:
+            self._generations[schema] = self._generations.get(schema, 0) + 1
+            if doc_ids is None:
+                keys = [key for key in self._entries if key[0] == schema]
+            else:
+                keys = [(schema, int(doc_id)) for doc_id in doc_ids]
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        """Counters to monitor the hit rate"""
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+    def listen(self, conn_params: ConnectionParams):
+        """Start a daemon thread that applies the invalidations sent through
+        notify_surrogates_changed"""
+        if self._listener is not None:
+            return
+        self._listener = Thread(
+            target=self._listen, args=(conn_params,), daemon=True, name=CHANNEL
+        )
+        self._listener.start()
+
+    def stop(self):
+        """Ask the listener to finish after the next notification"""
+        self._stop.set()
+
+    def _listen(self, conn_params: ConnectionParams):
+        while not self._stop.is_set():
+            try:
+                conninfo = conn_params.conninfo()
+                # pylint: disable=not-context-manager
+                with connect(conninfo=conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANNEL}")
+                    # notifications sent while disconnected are lost
+                    self.clear()
+                    for notify in conn.notifies():
+                        schema, doc_ids = parse_payload(notify.payload)
+                        self.invalidate(schema, doc_ids)
+                        if self._stop.is_set():
+                            break
+            except OperationalError:
+                logging.error("Surrogate cache listener disconnected", exc_info=True)
+                self.clear()
+                self._stop.wait(RECONNECT_SECONDS)
@@ -1,8 +1,73 @@
 """ Utilities for bounding boxes """
 
-from re import findall
+from re import compile as compile_regex
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import numpy as np
+
+# FigSplit writes ascii decimals, [0-9] avoids matching unicode digits like \d
+_NUMBER = compile_regex(r"[0-9]+\.[0-9]+")
+
+
+def _to_array(lines: List[str], split: Callable[[str], List[str]]) -> np.ndarray:
+    """(lines, 4) array with one bounding box per line. Lines without four
+    values (e.g. figures without subfigures) become rows of NaN."""
+    values = split("\n".join(lines))
+    if len(values) == 4 * len(lines):
+        return np.array(values, dtype=np.float64).reshape(-1, 4)
+
+    # some lines do not have four values, parse them one by one
+    boxes = np.full((len(lines), 4), np.nan)
+    for idx, line in enumerate(lines):
+        row = split(line)
+        if len(row) == 4:
+            boxes[idx] = np.array(row, dtype=np.float64)
+    return boxes
+
+
+def _txt_lines(text: str) -> Tuple[List[str], float]:
+    """Lines with boxes and scale of a FigSplit *.jpg.txt file. When the values
+    need scaling, the first line has the factor (e.g. "1.0e+03 *") followed by
+    an empty line."""
+    lines = text.splitlines()
+    scale = 1.0
+    if lines and "*" in lines[0]:
+        scale = float(lines[0].split()[0])
+        lines = lines[2:]
+    return lines, scale
+
+
+def parse_txt(text: str) -> np.ndarray:
+    """Bounding boxes from a FigSplit *.jpg.txt file"""
+    lines, scale = _txt_lines(text)
+    return _to_array(lines, _NUMBER.findall) * scale
+
+
+def parse_txt_batch(texts: List[str]) -> List[np.ndarray]:
+    """Parse the files of many figures with a single regex pass and array
+    conversion, falling back to parse_txt when a file has incomplete lines"""
+    parsed = [_txt_lines(text) for text in texts]
+    counts = [len(lines) for lines, _ in parsed]
+    values = _NUMBER.findall("\n".join("\n".join(lines) for lines, _ in parsed))
+    if len(values) != 4 * sum(counts):
+        return [parse_txt(text) for text in texts]
+
+    scales = np.repeat([scale for _, scale in parsed], counts)
+    boxes = np.array(values, dtype=np.float64).reshape(-1, 4) * scales[:, None]
+    return np.split(boxes, np.cumsum(counts)[:-1])
+
+
+def parse_csv(text: str) -> np.ndarray:
+    """Bounding boxes from a csv file with x,y,width,height per line"""
+    return _to_array(text.splitlines(), lambda el: el.replace(",", " ").split())
+
+
+def _subfigure_index(stem: str) -> Optional[int]:
+    """001 -> 0, prefix_002 -> 1"""
+    try:
+        return int(stem.rsplit("_", 1)[-1]) - 1
+    except ValueError:
+        return None
 
 
 class BoundingBoxMapper:
@@ -23,70 +88,98 @@ class BoundingBoxMapper:
     where path for a subfigure is given by /document1/3_1/001.jpg. Therefore,
     the file of interest (e.g., 3_1.jpg.txt) is a sibling, and a line from that
     file corresponds to 001.jpg
+
+    The boxes of every loaded figure are stacked in a single (n, 4) array and
+    each figure folder keeps the (start, count) of its rows, so a subfigure is
+    found from its figure folder and index without string keys per subfigure.
     """
 
     def __init__(self, base_path: Optional[Path] = None):
         self.base_path = base_path
-        self.mapping = {}
+        self.boxes = np.empty((0, 4))
+        self.offsets: Dict[str, Tuple[int, int]] = {}
+        self.prefixes: Dict[str, str] = {}
         self.errors = []
 
-    def _extract_from_txt(self, parent_path, lines: List[str], prefix: str = None):
-        mult_factor = 1
-        if "*" in lines[0]:
-            # avoid the first two lines when the values need scaling
-            mult_factor = float(lines[0].strip().split(" ")[0])
-            lines = lines[2:]
-        for idx, line in enumerate(lines):
-            values = findall(r"\d+\.\d+", line)
-            values = [mult_factor * float(x) for x in values]
-            if prefix is not None:
-                key = f"{parent_path}/{prefix}_{str(idx+1).zfill(3)}.jpg"
+    def _read(self, parent_path: str) -> Tuple[Optional[str], Optional[str]]:
+        """File type and content of the bounding boxes for the figure"""
+        folder = self.base_path / parent_path if self.base_path else Path(parent_path)
+        name = Path(parent_path).name
+        try:
+            with open(folder / f"{name}.jpg.txt", "r", encoding="utf8") as file:
+                return "txt", file.read()
+        except FileNotFoundError:
+            pass
+        try:
+            with open(folder / f"{name}.csv", "r", encoding="utf8") as file:
+                return "csv", file.read()
+        except FileNotFoundError:
+            return None, None
+
+    def load_figures(
+        self, figure_paths: Iterable[str], prefix: str = None
+    ) -> "BoundingBoxMapper":
+        """Load the bounding boxes of the figure folders, e.g. every figure from
+        a document. The txt files are parsed together in one pass. Figures
+        without a bounding box file are added to errors and the remaining
+        figures are still loaded."""
+        txt_paths, txt_texts = [], []
+        loaded = {}
+        for parent_path in dict.fromkeys(str(el) for el in figure_paths):
+            if parent_path in self.offsets:
+                continue
+            file_type, text = self._read(parent_path)
+            if file_type is None:
+                self.errors.append(parent_path)
+            elif file_type == "txt":
+                txt_paths.append(parent_path)
+                txt_texts.append(text)
+                loaded[parent_path] = None
             else:
-                key = f"{parent_path}/{str(idx+1).zfill(3)}.jpg"
-            self.mapping[key] = values
+                loaded[parent_path] = parse_csv(text)
+        loaded.update(zip(txt_paths, parse_txt_batch(txt_texts)))
 
-    def _extract_from_csv(self, parent_path, lines: List[str], prefix: str = None):
-        for idx, line in enumerate(lines):
-            values = line.split(",")
+        start = len(self.boxes)
+        for parent_path, boxes in loaded.items():
+            self.offsets[parent_path] = (start, len(boxes))
             if prefix is not None:
-                key = f"{parent_path}/{prefix}_{str(idx+1).zfill(3)}.jpg"
-            else:
-                key = f"{parent_path}/{str(idx+1).zfill(3)}.jpg"
-            self.mapping[key] = values
+                self.prefixes[parent_path] = prefix
+            start += len(boxes)
+        if loaded:
+            self.boxes = np.concatenate([self.boxes] + list(loaded.values()))
+        return self
 
     def load(self, subfig_paths: List[str], prefix: str = None) -> Dict:
         """Load the bounding boxes from the artifacts created by FigSplit."""
         # bboxes is stored in the parent figure file
-        figure_paths = list(set(f"{Path(x).parent}" for x in subfig_paths))
-
-        for parent_path in figure_paths:
-            filename = f"{Path(parent_path).name}.jpg.txt"
-            filename_aux = f"{Path(parent_path).name}.csv"
-            lines = None
-
-            read_from = None
-            try:
-                if self.base_path:
-                    bboxes_path = self.base_path / parent_path / filename
-                else:
-                    bboxes_path = Path(parent_path) / filename
-                with open(bboxes_path, "r", encoding="utf8") as file:
-                    lines = file.readlines()
-                    read_from = "txt"
-            except FileNotFoundError:
-                try:
-                    if self.base_path:
-                        bboxes_path = self.base_path / parent_path / filename_aux
-                    else:
-                        bboxes_path = Path(parent_path) / filename_aux
-                    with open(bboxes_path, "r", encoding="utf8") as file:
-                        lines = file.readlines()
-                        read_from = "csv"
-                except FileNotFoundError:
-                    self.errors.append(parent_path)
-                    return
-
-            if read_from == "txt":
-                self._extract_from_txt(parent_path, lines, prefix=prefix)
-            else:
-                self._extract_from_csv(parent_path, lines, prefix=prefix)
+        figure_paths = dict.fromkeys(f"{Path(x).parent}" for x in subfig_paths)
+        self.load_figures(figure_paths, prefix=prefix)
+        return self.mapping
+
+    def lookup(self, subfig_path: str) -> Optional[List[float]]:
+        """Bounding box of the subfigure, [] when the figure has no subfigures
+        and None when there is no data for the subfigure"""
+        path = Path(subfig_path)
+        entry = self.offsets.get(str(path.parent))
+        idx = _subfigure_index(path.stem)
+        if entry is None or idx is None or not 0 <= idx < entry[1]:
+            return None
+        row = self.boxes[entry[0] + idx]
+        return [] if np.isnan(row).any() else row.tolist()
+
+    @property
+    def mapping(self) -> Dict[str, List[float]]:
+        """Subfigure path -> bounding box for every loaded figure. Built on
+        demand, prefer lookup for single subfigures."""
+        mapping = {}
+        for parent_path, (start, count) in self.offsets.items():
+            prefix = self.prefixes.get(parent_path)
+            for idx in range(count):
+                name = f"{idx + 1:03d}.jpg"
+                if prefix is not None:
+                    name = f"{prefix}_{name}"
+                row = self.boxes[start + idx]
+                mapping[f"{parent_path}/{name}"] = (
+                    [] if np.isnan(row).any() else row.tolist()
+                )
+        return mapping
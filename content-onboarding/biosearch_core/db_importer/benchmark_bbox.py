@@ -0,0 +1,118 @@
+""" Micro-benchmark for reading FigSplit bounding boxes.
+Creates a synthetic tree with FIGURES figure folders, each with a *.jpg.txt file
+in the scaled FigSplit format, and times:
+  - legacy: one regex search and float list per line, a string key per subfigure
+  - batch: one regex pass and array conversion for all the figures of a document
+The parsing is timed on files already in memory, followed by the end to end
+BoundingBoxMapper.load_figures, which is dominated by opening the files.
+
+  python benchmark_bbox.py [--figures 100000] [--per_document 10]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from os import makedirs
+from pathlib import Path
+from re import findall
+from typing import Dict, List
+import random
+import tempfile
+import time
+from rich.console import Console
+from biosearch_core.db_importer.bbox_reader import (
+    BoundingBoxMapper,
+    parse_txt_batch,
+)
+
+console = Console()
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="benchmark bounding box reader")
+    parser.add_argument("--figures", type=int, default=100_000, help="figure folders to create")
+    parser.add_argument("--per_document", type=int, default=10, help="figures per document")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def create_tree(root: Path, num_figures: int, per_document: int) -> List[List[str]]:
+    """Figure folders grouped by document"""
+    random.seed(0)
+    documents = []
+    for fig_idx in range(num_figures):
+        if fig_idx % per_document == 0:
+            documents.append([])
+        folder = root / f"PMC{fig_idx // per_document}" / f"{fig_idx}_1"
+        makedirs(folder)
+        lines = ["   1.0e+03 *", ""]
+        for _ in range(random.randint(1, 8)):
+            values = [random.random() for _ in range(4)]
+            lines.append("".join(f"{el:10.4f}" for el in values))
+        with open(folder / f"{folder.name}.jpg.txt", "w", encoding="utf8") as file:
+            file.write("\n".join(lines))
+        documents[-1].append(str(folder))
+    return documents
+
+
+def legacy_parse(parent_path: str, text: str) -> Dict[str, List[float]]:
+    """Per line parsing used before the batch reader"""
+    mapping = {}
+    lines = text.splitlines(keepends=True)
+    mult_factor = 1
+    if "*" in lines[0]:
+        mult_factor = float(lines[0].strip().split(" ")[0])
+        lines = lines[2:]
+    for idx, line in enumerate(lines):
+        values = [mult_factor * float(x) for x in findall(r"\d+\.\d+", line)]
+        mapping[f"{parent_path}/{str(idx+1).zfill(3)}.jpg"] = values
+    return mapping
+
+
+def read_texts(figure_paths: List[str]) -> List[str]:
+    """Content of the bounding box files"""
+    texts = []
+    for parent_path in figure_paths:
+        filename = Path(parent_path) / f"{Path(parent_path).name}.jpg.txt"
+        with open(filename, "r", encoding="utf8") as file:
+            texts.append(file.read())
+    return texts
+
+
+def main():
+    """Time both readers over the same tree"""
+    args = parse_args(argv[1:])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with console.status(f"[bold green] creating {args.figures} figures..."):
+            documents = create_tree(Path(tmp_dir), args.figures, args.per_document)
+
+        texts = [read_texts(figure_paths) for figure_paths in documents]
+
+        start_time = time.time()
+        legacy_boxes = 0
+        for figure_paths, doc_texts in zip(documents, texts):
+            for parent_path, text in zip(figure_paths, doc_texts):
+                legacy_boxes += len(legacy_parse(parent_path, text))
+        legacy = time.time() - start_time
+
+        start_time = time.time()
+        batch_boxes = 0
+        for doc_texts in texts:
+            batch_boxes += sum(len(el) for el in parse_txt_batch(doc_texts))
+        batch = time.time() - start_time
+
+        start_time = time.time()
+        for figure_paths in documents:
+            BoundingBoxMapper().load_figures(figure_paths)
+        end_to_end = time.time() - start_time
+
+    console.log(f"{args.figures} figures, {batch_boxes} bounding boxes")
+    console.log(f"legacy parse: {legacy:.3f}s ({legacy_boxes} boxes)")
+    console.log(f"batch parse: {batch:.3f}s")
+    console.log(f"load_figures with file reads: {end_to_end:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
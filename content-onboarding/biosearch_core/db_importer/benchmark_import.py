@@ -0,0 +1,157 @@
+""" Benchmark the figure id mapping of the importer on a large schema.
+The script creates a throwaway schema, fills it with PREFILL figures and times
+inserting a batch of figures with:
+  - legacy: COPY into the figures table and select every IMPORTED figure to
+    build the uri -> id dictionary, which grows with the table.
+  - staging: COPY into a temporary table and INSERT ... SELECT ... RETURNING,
+    which only returns the rows of the batch.
+Each run is rolled back so the table size stays constant.
+
+  python benchmark_import.py DB_ENV [--prefill 1000000] [--batch 5000]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from dataclasses import replace
+from typing import Callable, Dict, List
+import tempfile
+import time
+from psycopg import Cursor, connect
+from rich.console import Console
+from biosearch_core.data.figure import DBFigure, FigureStatus, FigureType
+from biosearch_core.db.model import params_from_env
+from biosearch_core.db_importer.importer import FIGURE_COLUMNS, ImportManager
+from biosearch_core.db_importer.tables import (
+    create_documents_table,
+    create_figures_table,
+    create_indexes,
+)
+
+console = Console()
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="benchmark importer id mapping")
+    parser.add_argument("db", type=str, help="path to .env with db conn")
+    parser.add_argument("--schema", type=str, default="bench_import", help="schema to create and drop")
+    parser.add_argument("--prefill", type=int, default=1_000_000, help="figures in the table before importing")
+    parser.add_argument("--batch", type=int, default=5000, help="figures imported per run")
+    parser.add_argument("--runs", type=int, default=3)
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def prefill(cursor: Cursor, schema: str, owner: str, num_figures: int):
+    """Tables with one document per 10 figures"""
+    num_docs = max(1, num_figures // 10)
+    cursor.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+    cursor.execute(f"CREATE SCHEMA {schema}")
+    cursor.execute(create_documents_table(schema, owner))
+    cursor.execute(create_figures_table(schema, owner))
+    cursor.execute(create_indexes(schema))
+    cursor.execute(
+        f"""INSERT INTO {schema}.documents (title, project, import_date, status, pmcid)
+            SELECT 'doc ' || i, 'bench', now(), 'IMPORTED', 'PMC' || i
+            FROM generate_series(1, {num_docs}) i"""
+    )
+    cursor.execute(
+        f"""INSERT INTO {schema}.figures
+              (name, fig_type, doc_id, status, uri, width, height, source)
+            SELECT 'fig' || i, {FigureType.FIGURE.value}, doc_id,
+                   {FigureStatus.IMPORTED.value}, 'PMC' || doc_id || '/fig' || i || '.jpg',
+                   100, 100, 'bench'
+            FROM (
+              SELECT i, 1 + i % {num_docs} AS doc_id
+              FROM generate_series(1, {num_figures}) i
+            ) AS series"""
+    )
+    cursor.execute(f"ANALYZE {schema}.figures")
+
+
+def fake_figures(batch: int) -> List[DBFigure]:
+    """Figures to insert, attached to the first document"""
+    return [
+        DBFigure(
+            status=FigureStatus.IMPORTED.value,
+            uri=f"NEW1/fig{idx}.jpg",
+            width=100,
+            height=100,
+            type=FigureType.FIGURE.value,
+            source="bench",
+            name=f"fig{idx}",
+            caption="caption",
+            num_panes=0,
+            doc_id=1,
+            parent_id=None,
+            coordinates=[0, 0, 100, 100],
+            page=1,
+        )
+        for idx in range(batch)
+    ]
+
+
+def legacy_insert(cursor: Cursor, schema: str, figures: List[DBFigure]) -> Dict:
+    """COPY followed by the full table scan the importer used before"""
+    sql = f"COPY {schema}.figures ({FIGURE_COLUMNS}) FROM STDIN"
+    with cursor.copy(sql) as copy:
+        for elem in figures:
+            copy.write_row(elem.to_tuple())
+    status = FigureStatus.IMPORTED.value
+    cursor.execute(f"SELECT id, uri FROM {schema}.figures WHERE status = {status}")
+    return {r[1]: r[0] for r in cursor.fetchall()}
+
+
+def time_runs(conninfo: str, runs: int, insert: Callable[[Cursor], Dict]) -> float:
+    """Average seconds per run, rolling back every run"""
+    elapsed = []
+    # pylint: disable=not-context-manager
+    with connect(conninfo=conninfo, autocommit=False) as conn:
+        for _ in range(runs):
+            with conn.cursor() as cursor:
+                start_time = time.time()
+                insert(cursor)
+                elapsed.append(time.time() - start_time)
+            conn.rollback()
+    return sum(elapsed) / len(elapsed)
+
+
+def main():
+    """Compare both insert strategies"""
+    args = parse_args(argv[1:])
+    conn_params = replace(params_from_env(args.db), schema=args.schema)
+    conninfo = conn_params.conninfo()
+
+    with console.status(f"[bold green] inserting {args.prefill} figures..."):
+        # pylint: disable=not-context-manager
+        with connect(conninfo=conninfo, autocommit=False) as conn:
+            with conn.cursor() as cursor:
+                prefill(cursor, args.schema, conn_params.user, args.prefill)
+            conn.commit()
+
+    figures = fake_figures(args.batch)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        manager = ImportManager(tmp_dir, "bench", conn_params)
+        # pylint: disable=protected-access
+        staging = time_runs(
+            conninfo,
+            args.runs,
+            lambda cursor: manager._insert_figures_to_db(cursor, figures),
+        )
+    legacy = time_runs(
+        conninfo, args.runs, lambda cursor: legacy_insert(cursor, args.schema, figures)
+    )
+
+    console.log(f"{args.batch} figures into a table with {args.prefill} figures")
+    console.log(f"legacy (COPY + full scan): {legacy:.3f}s")
+    console.log(f"staging (COPY + INSERT RETURNING): {staging:.3f}s")
+
+    # pylint: disable=not-context-manager
+    with connect(conninfo=conninfo, autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA {args.schema} CASCADE")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+""" Throughput of ImportManager.import_content on a synthetic project.
+Generates DOCUMENTS folders with synthetic.py and reports documents/sec for
+the phases of the import:
+  - validation: folder structure checks (validate_pdf_folders)
+  - metadata: Cord19Loader over the generated metadata.csv
+  - figure fetch: reading the extractor metadata of every folder
+  - subfigure fetch: listing the subfigures and reading their bounding boxes
+  - copy: documents, figures and subfigures through the staging tables, rolled
+    back so the end to end run starts from empty tables
+  - import_content: the complete import, phases overlapped
+
+The database is a throwaway schema. With --db, the schema is created on the
+server of the .env file. Without it, a temporary local cluster is started with
+the initdb and pg_ctl binaries in PATH and removed at the end, so the benchmark
+runs on a laptop without touching any existing database.
+
+  python benchmark_throughput.py [--db DB_ENV] [--documents 2000] [--workers 8]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from contextlib import contextmanager
+from dataclasses import replace
+from os import makedirs
+from pathlib import Path
+from shutil import which
+from typing import Dict, Iterator, List
+import socket
+import subprocess
+import tempfile
+import time
+from psycopg import connect
+from rich.console import Console
+from biosearch_core.data.figure import DBFigure
+from biosearch_core.db.model import ConnectionParams, params_from_env
+from biosearch_core.db_importer.importer import ImportManager
+from biosearch_core.db_importer.loaders import Cord19Loader
+from biosearch_core.db_importer.project import Project
+from biosearch_core.db_importer.synthetic import create_import_tree
+
+console = Console()
+PROJECT = "cord19"
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="benchmark import throughput")
+    parser.add_argument("--db", type=str, default=None, help="path to .env with db conn, a temporary local cluster if missing")
+    parser.add_argument("--schema", type=str, default="bench_throughput", help="schema to create and drop")
+    parser.add_argument("--documents", type=int, default=2000, help="document folders to import")
+    parser.add_argument("--figures", type=int, default=5, help="figures per document")
+    parser.add_argument("--subfigures", type=int, default=3, help="subfigures per figure")
+    parser.add_argument("--workers", type=int, default=8, help="importer threads")
+    parser.add_argument("--batch_size", type=int, default=None, help="folders per import transaction")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def temporary_postgres(schema: str) -> Iterator[ConnectionParams]:
+    """Local cluster in a temporary folder with trust authentication"""
+    if which("initdb") is None or which("pg_ctl") is None:
+        raise RuntimeError("initdb and pg_ctl are needed without --db")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_dir = Path(tmp_dir) / "data"
+        port = _free_port()
+        subprocess.run(
+            ["initdb", "-D", str(data_dir), "-U", "postgres", "--auth=trust"],
+            check=True,
+            capture_output=True,
+        )
+        options = f"-p {port} -k {tmp_dir} -c fsync=off"
+        subprocess.run(
+            ["pg_ctl", "-D", str(data_dir), "-o", options, "-w", "start"],
+            check=True,
+            capture_output=True,
+        )
+        try:
+            yield ConnectionParams(
+                "localhost", port, "postgres", "postgres", "", schema
+            )
+        finally:
+            subprocess.run(
+                ["pg_ctl", "-D", str(data_dir), "-m", "fast", "-w", "stop"],
+                check=False,
+                capture_output=True,
+            )
+
+
+@contextmanager
+def benchmark_schema(conn_params: ConnectionParams) -> Iterator[ConnectionParams]:
+    """Empty schema with the importer tables, dropped at the end"""
+    schema = conn_params.schema
+    # pylint: disable=not-context-manager
+    with connect(conninfo=conn_params.conninfo(), autocommit=True) as conn:
+        conn.execute(f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        conn.execute(f"CREATE SCHEMA {schema}")
+    ImportManager(".", PROJECT, conn_params).create_tables()
+    try:
+        yield conn_params
+    finally:
+        # pylint: disable=not-context-manager
+        with connect(conninfo=conn_params.conninfo(), autocommit=True) as conn:
+            conn.execute(f"DROP SCHEMA {schema} CASCADE")
+
+
+class PhaseTimer:
+    """Seconds and documents per phase"""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the block"""
+        start_time = time.time()
+        yield
+        self.phases[name] = time.time() - start_time
+
+    def report(self, documents: int):
+        """Log documents/sec for every phase"""
+        for name, elapsed in self.phases.items():
+            rate = documents / elapsed if elapsed > 0 else float("inf")
+            console.log(f"{name:>16}: {elapsed:8.3f}s {rate:10.1f} docs/sec")
+
+
+def time_copy(
+    manager: ImportManager,
+    documents: List,
+    figures: List[DBFigure],
+    subfigures: List[DBFigure],
+):
+    """Insert the fetched rows with the importer queries and roll back. The
+    ids used while fetching are replaced by the ones returned by the inserts."""
+    params = manager.params
+    # pylint: disable=not-context-manager
+    with connect(conninfo=params.conninfo(), autocommit=False) as conn:
+        with conn.cursor() as cursor:
+            # pylint: disable=protected-access
+            pmc_to_id = manager._insert_documents_to_db(cursor, documents, "pmcid")
+            figures = [
+                replace(el, doc_id=pmc_to_id[el.uri.split("/")[0]]) for el in figures
+            ]
+            url_to_id = manager._insert_figures_to_db(cursor, figures)
+            subfigures = [
+                replace(
+                    el,
+                    doc_id=pmc_to_id[el.uri.split("/")[0]],
+                    parent_id=url_to_id[f"{el.uri.rsplit('/', 1)[0]}.jpg"],
+                )
+                for el in subfigures
+            ]
+            manager._insert_figures_to_db(cursor, subfigures)
+        conn.rollback()
+
+
+def run(args: Namespace, conn_params: ConnectionParams):
+    """Generate the project and time every phase"""
+    timer = PhaseTimer()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        project_dir = Path(tmp_dir) / PROJECT
+        with console.status(f"[bold green] creating {args.documents} documents..."):
+            metadata_path = create_import_tree(
+                project_dir, args.documents, args.figures, args.subfigures
+            )
+        makedirs(Project.predict_dir(project_dir))
+        manager = ImportManager(tmp_dir, PROJECT, conn_params, workers=args.workers)
+        loader = Cord19Loader()
+        import_dir = Project.import_dir(project_dir)
+        paths = sorted(str(el) for el in import_dir.iterdir())
+
+        with timer.phase("validation"):
+            manager.validate_pdf_folders(paths)
+        with timer.phase("metadata"):
+            documents = loader.load(str(metadata_path), paths)
+
+        # ids are assigned locally, time_copy maps them to the inserted rows
+        pmc_to_id = {doc.pmcid: idx for idx, doc in enumerate(documents)}
+        with timer.phase("figure fetch"):
+            figures = manager.fetch_figures(paths, pmc_to_id)
+        url_to_id = {el.uri: idx for idx, el in enumerate(figures)}
+        with timer.phase("subfigure fetch"):
+            subfigures = manager.fetch_subfigures(figures, url_to_id)
+        with timer.phase("copy"):
+            time_copy(manager, documents, figures, subfigures)
+
+        # the end to end import starts with fresh validation results
+        manager = ImportManager(tmp_dir, PROJECT, conn_params, workers=args.workers)
+        with timer.phase("import_content"):
+            manager.import_content(str(metadata_path), loader, args.batch_size)
+
+    console.log(
+        f"{len(documents)} documents, {len(figures)} figures, "
+        f"{len(subfigures)} subfigures, {args.workers} workers"
+    )
+    timer.report(len(documents))
+
+
+def main():
+    """Run against the given server or a temporary local cluster"""
+    args = parse_args(argv[1:])
+    if args.db is not None:
+        conn_params = replace(params_from_env(args.db), schema=args.schema)
+        with benchmark_schema(conn_params):
+            run(args, conn_params)
+        return
+    with temporary_postgres(args.schema) as conn_params:
+        with benchmark_schema(conn_params):
+            run(args, conn_params)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+""" Checkpoint for chunked imports. Every batch committed to the database is
+appended as a json line with the names of its folders, so an interrupted import
+can skip them on the next run. The file is removed once an import finishes
+without failed batches.
+"""
+
+from datetime import datetime
+from os import fsync
+from pathlib import Path
+from typing import List, Set
+import json
+import logging
+
+
+class ImportCheckpoint:
+    """Append-only record of the committed import batches"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+
+    def completed_folders(self) -> Set[str]:
+        """Names of the folders already committed to the database"""
+        folders = set()
+        if not self.path.exists():
+            return folders
+        with open(self.path, "r", encoding="utf-8") as reader:
+            for line in reader:
+                if line.strip() == "":
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the process died while writing this line
+                    logging.warning("Ignoring incomplete checkpoint line: %s", line)
+                    continue
+                folders.update(entry["folders"])
+        return folders
+
+    def record(self, batch: int, folders: List[str], **counts):
+        """Store a committed batch, flushed to disk before returning"""
+        entry = {
+            "batch": batch,
+            "time": datetime.now().isoformat(),
+            "folders": [Path(el).name for el in folders],
+            **counts,
+        }
+        with open(self.path, "a", encoding="utf-8") as writer:
+            writer.write(json.dumps(entry) + "\n")
+            writer.flush()
+            fsync(writer.fileno())
+
+    def clear(self):
+        """Remove the checkpoint after a complete import"""
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,137 @@
+""" Indexed copy of the CORD19 metadata.csv.
+The csv has over a million rows, and scanning it on every import (loader) and
+indexing run (full text pointers) dominates both. The file is converted once
+to a sqlite database next to it, with an index on pmcid, so readers only fetch
+the rows they need. The copy is rebuilt when metadata.csv is newer.
+
+  python cord_metadata.py PATH_TO_METADATA_CSV
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from itertools import islice
+from os import replace
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, Iterator, Optional
+import csv
+import sqlite3
+
+COLUMNS = [
+    "cord_uid",
+    "pmcid",
+    "pubmed_id",
+    "title",
+    "abstract",
+    "authors",
+    "publish_time",
+    "journal",
+    "license",
+    "doi",
+    "source_x",
+    "pdf_json_files",
+]
+# sqlite limits the number of query parameters
+CHUNK_SIZE = 500
+
+
+class CordMetadata:
+    """Lookups by pmcid over the sqlite copy of metadata.csv. Safe to share
+    between threads."""
+
+    def __init__(self, metadata_path: str):
+        self.csv_path = Path(metadata_path)
+        self.db_path = self.csv_path.with_suffix(".sqlite")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = Lock()
+
+    def is_stale(self) -> bool:
+        """Whether the sqlite copy is missing or older than the csv"""
+        if not self.db_path.exists():
+            return True
+        return self.db_path.stat().st_mtime < self.csv_path.stat().st_mtime
+
+    def build(self, batch_size: int = 10000):
+        """Convert metadata.csv, writing to a temporary file that replaces the
+        previous copy once complete"""
+        tmp_path = self.db_path.with_suffix(".sqlite.tmp")
+        tmp_path.unlink(missing_ok=True)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            columns = ", ".join(f"{el} TEXT" for el in COLUMNS)
+            conn.execute(f"CREATE TABLE metadata ({columns})")
+            insert = f"INSERT INTO metadata VALUES ({','.join('?' * len(COLUMNS))})"
+            with open(self.csv_path, encoding="utf-8") as f_in:
+                reader = csv.DictReader(f_in)
+                rows = ([row.get(el) or "" for el in COLUMNS] for row in reader)
+                while True:
+                    batch = list(islice(rows, batch_size))
+                    if not batch:
+                        break
+                    conn.executemany(insert, batch)
+            conn.execute("CREATE INDEX metadata_pmcid_idx ON metadata (pmcid)")
+            conn.commit()
+        finally:
+            conn.close()
+        replace(tmp_path, self.db_path)
+
+    def ensure(self) -> "CordMetadata":
+        """Build the copy when needed and open it"""
+        with self._lock:
+            if self._conn is None:
+                if self.is_stale():
+                    self.build()
+                self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+                self._conn.row_factory = sqlite3.Row
+        return self
+
+    def rows(self, pmcids: Iterable[str]) -> Iterator[Dict[str, str]]:
+        """Rows for the pmcids, with the same keys and string values as the
+        csv.DictReader rows. Rows of each chunk of pmcids keep the file order."""
+        self.ensure()
+        pmcids = list(pmcids)
+        for start in range(0, len(pmcids), CHUNK_SIZE):
+            chunk = pmcids[start : start + CHUNK_SIZE]
+            placeholders = ",".join("?" * len(chunk))
+            query = f"""SELECT * FROM metadata WHERE pmcid IN ({placeholders})
+                        ORDER BY rowid"""
+            with self._lock:
+                result = self._conn.execute(query, chunk).fetchall()
+            for row in result:
+                yield dict(row)
+
+    def full_text_pointer(self, pmcid: str) -> Optional[str]:
+        """pdf_json_files of the pmcid, from its last row like the previous
+        dictionary mapping. None if the pmcid is not in the metadata."""
+        self.ensure()
+        query = """SELECT pdf_json_files FROM metadata WHERE pmcid = ?
+                   ORDER BY rowid DESC LIMIT 1"""
+        with self._lock:
+            row = self._conn.execute(query, (pmcid,)).fetchone()
+        return None if row is None else row[0]
+
+    def close(self):
+        """Close the sqlite connection"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    parser = ArgumentParser(prog="index the CORD19 metadata.csv")
+    parser.add_argument("metadata", type=str, help="path to metadata.csv")
+    return parser.parse_args(args)
+
+
+def main():
+    """Rebuild the sqlite copy"""
+    args = parse_args(argv[1:])
+    metadata = CordMetadata(args.metadata)
+    metadata.build()
+    print(f"saved {metadata.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,8 @@ from biosearch_core.db.model import params_from_env
 from biosearch_core.db_importer.tables import (
     create_documents_table,
     create_figures_table,
+    create_indexes,
+    create_surrogate_view,
 )
 
 
@@ -27,12 +29,18 @@ def parse_args(args) -> Namespace:
     """Parse args from command line"""
     parser = ArgumentParser(prog="create tables")
     parser.add_argument("db", type=str, help="path to .env with db conn")
+    parser.add_argument(
+        "--surrogate_view",
+        "-v",
+        action="store_true",
+        help="create the materialized view for document surrogates",
+    )
     parsed_args = parser.parse_args(args)
 
     return parsed_args
 
 
-def create_tables(params):
+def create_tables(params, surrogate_view: bool = False):
     """Create database tables"""
     # pylint: disable=not-context-manager
     with connect(conninfo=params.conninfo(), autocommit=False) as conn:
@@ -42,6 +50,9 @@ def create_tables(params):
                 owner = params.user
                 cursor.execute(create_documents_table(schema, owner))
                 cursor.execute(create_figures_table(schema, owner))
+                cursor.execute(create_indexes(schema))
+                if surrogate_view:
+                    cursor.execute(create_surrogate_view(schema, owner))
             # pylint: disable=broad-except
             except Exception as exc:
                 print("Erorr creating tables", exc)
@@ -56,7 +67,7 @@ def main():
     setup_logger(workspace)
 
     conn_params = params_from_env(args.db)
-    create_tables(conn_params)
+    create_tables(conn_params, surrogate_view=args.surrogate_view)
 
 
 if __name__ == "__main__":
@@ -37,6 +37,19 @@ def parse_args(args) -> Namespace:
     parser.add_argument(
         "--loader", "-l", type=str, help="metadata loader", default="cord19"
     )
+    parser.add_argument(
+        "--workers", "-w", type=int, help="folder validation workers", default=8
+    )
+    parser.add_argument(
+        "--processes", action="store_true", help="validate with processes"
+    )
+    parser.add_argument(
+        "--batch_size",
+        "-b",
+        type=int,
+        default=None,
+        help="folders per transaction, resumes from the last committed batch",
+    )
     parsed_args = parser.parse_args(args)
 
     return parsed_args
@@ -48,7 +61,13 @@ def main():
     setup_logger(str(Path(args.projects_dir) / args.project))
 
     conn_params = params_from_env(args.db)
-    manager = ImportManager(args.projects_dir, args.project, conn_params)
+    manager = ImportManager(
+        args.projects_dir,
+        args.project,
+        conn_params,
+        workers=args.workers,
+        use_processes=args.processes,
+    )
 
     if args.loader == "cord19":
         loader = Cord19Loader()
@@ -56,7 +75,7 @@ def main():
         loader = GDXLoader()
     else:
         raise ValueError(f"{args.loader} loader not supported")
-    manager.import_content(args.metadata, loader)
+    manager.import_content(args.metadata, loader, batch_size=args.batch_size)
 
 
 if __name__ == "__main__":
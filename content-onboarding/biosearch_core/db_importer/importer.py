@@ -1,30 +1,50 @@
 """ Module responsible for taking documents from to_import and inserting 
 them in the database"""
 
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
-from os import listdir
-from typing import List, Dict, Tuple, Optional
+from os import listdir, scandir
+from typing import Callable, Iterable, Iterator, List, Dict, Tuple, Optional
 from shutil import move, rmtree
 from tqdm import tqdm
 import logging
 import json
 from psycopg import Cursor, connect
 from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db.surrogate_cache import notify_surrogates_changed
 from biosearch_core.data.figure import (
     DBFigure,
     FigureStatus,
     FigureType,
     SubFigureStatus,
 )
-from biosearch_core.data.document import DbDocument
+from biosearch_core.data.document import DbDocument, DocumentModel
 from biosearch_core.db_importer.bbox_reader import BoundingBoxMapper
+from biosearch_core.db_importer.checkpoint import ImportCheckpoint
 from biosearch_core.db_importer.loaders import Loader
+from biosearch_core.db_importer.manifest import ImportManifest, folder_hash
 from biosearch_core.db_importer.project import Project
 from biosearch_core.db_importer.tables import (
     create_documents_table,
     create_figures_table,
+    create_indexes,
+    create_surrogate_view,
 )
 
+DOCUMENT_COLUMNS = "title, authors, abstract, publication_date, pmcid, pubmed_id, journal, repository, project, license, status, uri, doi, notes, import_date, otherid"  # pylint: disable=line-too-long
+# columns read from the metadata, the curation columns (status, notes) and the
+# lookup columns are kept on re-import
+DOCUMENT_UPDATE_COLUMNS = "title, authors, abstract, publication_date, pubmed_id, journal, repository, license, uri, doi, import_date"  # pylint: disable=line-too-long
+FIGURE_COLUMNS = "name, caption, num_panes, fig_type, doc_id, status, uri, parent_id, width, height, coordinates, last_update_by, owner, migration_key, notes, label, source, page, ground_truth"  # pylint: disable=line-too-long
+# columns read from the folder, the curation columns are kept on re-import
+FIGURE_UPDATE_COLUMNS = "caption, num_panes, uri, width, height, coordinates, source, page"  # pylint: disable=line-too-long
+
+
+def _scan(path: Path) -> Dict[str, bool]:
+    """Entries of a directory as name -> is_dir, using a single scandir call"""
+    with scandir(path) as entries:
+        return {entry.name: entry.is_dir() for entry in entries}
+
 
 class Validator:
     """Validates that the folder to import has the required folder structure
@@ -40,82 +60,118 @@ class Validator:
             "multiple_pdfs": [],
         }
 
-    def _fetch_content(self, path: Path, extension: str) -> List[str]:
-        return [str(path / elem) for elem in listdir(path) if elem.endswith(extension)]
-
-    def _has_valid_pdfs(self, folder: Path) -> bool:
-        pdfs = self._fetch_content(folder, ".pdf")
+    def _pdfs_violation(self, folder: Path, entries: Dict[str, bool]) -> Optional[str]:
+        pdfs = [name for name in entries if name.endswith(".pdf")]
 
         if len(pdfs) == 0:
             logging.info("%s,MISSING_DATA", folder.name)
-            self.violation_reasons_["missing_pdf"].append(str(folder))
-            return False
+            return "missing_pdf"
         if len(pdfs) > 1:
             logging.info("%s,MULTIPLE_PDFS", folder.name)
-            self.violation_reasons_["multiple_pdfs"].append(str(folder))
-            return False
-        return True
+            return "multiple_pdfs"
+        return None
 
-    def _has_extraction_data(self, folder: Path) -> bool:
-        metadata_file = f"{folder.name}.json"
-        if not (folder / metadata_file).exists():
-            self.violation_reasons_["to_extract"].append(str(folder))
+    def _extraction_violation(
+        self, folder: Path, entries: Dict[str, bool]
+    ) -> Optional[str]:
+        if f"{folder.name}.json" not in entries:
             logging.info("%s,TO_EXTRACT,missing metadata", folder.name)
-            return False
-        return True
+            return "to_extract"
+        return None
 
-    def _has_extracted_figures(self, folder: Path) -> bool:
+    def _figures_violation(
+        self, folder: Path, entries: Dict[str, bool]
+    ) -> Optional[str]:
         metadata_file = folder / f"{folder.name}.json"
         with open(metadata_file, "r", encoding="utf-8") as reader:
             json_data = json.load(reader)
-            for page in json_data["pages"]:
-                for figure in page["figures"]:
-                    fig_path = folder / figure["id"]
-                    if not fig_path.exists():
-                        self.violation_reasons_["to_extract"].append(str(folder))
-                        logging.info("%s,TO_EXTRACT,image missing", folder.name)
-                        return False
-                    fig_folder = Path(str(fig_path)[:-4])
-                    if not fig_folder.exists():
-                        self.violation_reasons_["to_segment"].append(str(folder))
-                        logging.info(
-                            "%s,TO_SEGMENT,missing extraction folder %s",
-                            folder.name,
-                            fig_folder,
-                        )
-                        return False
-
-                    txt_file = fig_folder / f"{fig_path.name}.txt"
-                    csv_file = fig_folder / f"{fig_path.stem}.csv"
-                    if not (txt_file.exists() or csv_file.exists()):
-                        self.violation_reasons_["to_segment"].append(str(folder))
-                        logging.info(
-                            "%s,TO_SEGMENT,missing segment data %s",
-                            folder.name,
-                            fig_folder,
-                        )
-                        return False
-        return True
+        for page in json_data["pages"]:
+            for figure in page["figures"]:
+                fig_path = Path(figure["id"])
+                if fig_path.name not in entries:
+                    logging.info("%s,TO_EXTRACT,image missing", folder.name)
+                    return "to_extract"
+                fig_folder = fig_path.name[:-4]
+                if not entries.get(fig_folder, False):
+                    logging.info(
+                        "%s,TO_SEGMENT,missing extraction folder %s",
+                        folder.name,
+                        folder / fig_folder,
+                    )
+                    return "to_segment"
+
+                fig_entries = _scan(folder / fig_folder)
+                txt_file = f"{fig_path.name}.txt"
+                csv_file = f"{fig_path.stem}.csv"
+                if not (txt_file in fig_entries or csv_file in fig_entries):
+                    logging.info(
+                        "%s,TO_SEGMENT,missing segment data %s",
+                        folder.name,
+                        folder / fig_folder,
+                    )
+                    return "to_segment"
+        return None
 
-    def is_valid_folder(self, folder: str) -> bool:
-        """Whether the folder has all the requirements to be imported to db"""
+    def folder_violation(self, folder: str) -> Optional[str]:
+        """Key in violation_reasons_ of the first requirement that the folder
+        does not meet, or None if the folder can be imported. It does not
+        modify the validator, so it is safe to call from multiple workers."""
         folder_path = Path(folder)
-        if not self._has_valid_pdfs(folder_path):
-            return False
-        return self._has_extraction_data(folder_path) and self._has_extracted_figures(
-            folder_path
+        entries = _scan(folder_path)
+        return (
+            self._pdfs_violation(folder_path, entries)
+            or self._extraction_violation(folder_path, entries)
+            or self._figures_violation(folder_path, entries)
         )
 
+    def record(self, folder: str, reason: Optional[str]) -> bool:
+        """Store the folder under its violation reason, returns whether the
+        folder is valid"""
+        if reason is None:
+            return True
+        self.violation_reasons_[reason].append(str(folder))
+        return False
+
+    def is_valid_folder(self, folder: str) -> bool:
+        """Whether the folder has all the requirements to be imported to db"""
+        return self.record(folder, self.folder_violation(folder))
 
-class ImportManager:
-    """Manage document inserts to db"""
 
-    def __init__(self, projects_dir: str, project: str, conn_params: ConnectionParams):
+def _collect(items: Iterable, into: List) -> Iterator:
+    """Yield the items while keeping them in a list"""
+    for item in items:
+        into.append(item)
+        yield item
+
+
+def _folder_violation(folder: str) -> Optional[str]:
+    """Module level entry point so the process pool can pickle it"""
+    return Validator().folder_violation(folder)
+
+
+class ImportManager:
+    """Manage document inserts to db
+    workers: number of threads (or processes with use_processes) to validate
+    the folders to import. The checks are dominated by file system calls, so
+    threads are enough unless the json parsing becomes the bottleneck. The
+    figures and subfigures are also discovered on a pool of `workers` threads.
+    """
+
+    def __init__(
+        self,
+        projects_dir: str,
+        project: str,
+        conn_params: ConnectionParams,
+        workers: int = 8,
+        use_processes: bool = False,
+    ):
         self.projects_dir = Path(projects_dir)
         self.project = project
         self.dir = self.projects_dir / self.project
         self.params = conn_params
         self.validator = Validator()
+        self.workers = workers
+        self.use_processes = use_processes
 
         if not self.projects_dir.exists():
             raise FileNotFoundError(f"projects dir {projects_dir} does not exist")
@@ -123,12 +179,28 @@ class ImportManager:
     def _fetch_content(self, path: Path, extension: str) -> List[str]:
         return [str(path / elem) for elem in listdir(path) if elem.endswith(extension)]
 
-    def validate_pdf_folders(self, folders: List[str]) -> Tuple[List[Path], Dict]:
-        """Return folders to skip because they do not meet import requirements
-        and return the constrains not met"""
+    def _validation_executor(self) -> Executor:
+        if self.use_processes:
+            return ProcessPoolExecutor(max_workers=self.workers)
+        return ThreadPoolExecutor(max_workers=self.workers)
+
+    def validate_pdf_folders(self, folders: List[str]) -> List[str]:
+        """Return folders to skip because they do not meet import requirements.
+        The constrains not met are stored in validator.violation_reasons_.
+        Folders are checked in parallel and the results merged in input order."""
+        if self.workers <= 1:
+            reasons = map(self.validator.folder_violation, folders)
+            return self._record_violations(folders, reasons)
+
+        with self._validation_executor() as executor:
+            chunksize = max(1, len(folders) // (self.workers * 4))
+            reasons = executor.map(_folder_violation, folders, chunksize=chunksize)
+            return self._record_violations(folders, reasons)
+
+    def _record_violations(self, folders: List[str], reasons) -> List[str]:
         skipping = []
-        for folder in tqdm(folders):
-            if not self.validator.is_valid_folder(folder):
+        for folder, reason in tqdm(zip(folders, reasons), total=len(folders)):
+            if not self.validator.record(folder, reason):
                 skipping.append(folder)
         return skipping
 
@@ -168,68 +240,118 @@ class ImportManager:
                     )
         return figures
 
-    def fetch_figures(
-        self, paths_to_import: List[Path], pmc_to_id: Dict[str, str]
-    ) -> Tuple[List[DBFigure], List[str]]:
-        """Inspect every folder and collect figures and subfigures"""
-        figures = []
-        for folder in tqdm(paths_to_import):
+    def _map_folders(self, func: Callable, items: Iterable) -> Iterator:
+        """Apply func to the items on a thread pool, yielding the results in
+        input order as soon as they are ready. The file system calls release the
+        GIL, so the consumer (e.g. a COPY writer) overlaps with the scanning."""
+        if self.workers <= 1:
+            yield from map(func, items)
+            return
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            yield from executor.map(func, items)
+
+    def iter_figures(
+        self, paths_to_import: List[str], pmc_to_id: Dict[str, int]
+    ) -> Iterator[DBFigure]:
+        """Stream the figures of every folder, reading the metadata files on
+        the thread pool"""
+
+        def read_folder(folder: str) -> List[DBFigure]:
             folder_path = Path(folder)
             doc_id = pmc_to_id[folder_path.stem]
-            figures += self.fetch_folder_figures(folder_path, doc_id, self.project)
-        return figures
+            return self.fetch_folder_figures(folder_path, doc_id, self.project)
 
-    def fetch_subfigures(
-        self, figures: List[DBFigure], url_to_id: Dict[str, str], loader
-    ) -> List[DBFigure]:
-        """Fetch subfigures and bounding boxes information"""
-        subfigures = []
+        for folder_figures in tqdm(
+            self._map_folders(read_folder, paths_to_import), total=len(paths_to_import)
+        ):
+            yield from folder_figures
 
-        for figure in tqdm(figures):
-            figure_folder = Project.import_dir(self.dir) / figure.uri[:-4]
-            subfig_paths = self._fetch_content(figure_folder, ".jpg")
+    def fetch_figures(
+        self, paths_to_import: List[str], pmc_to_id: Dict[str, int]
+    ) -> List[DBFigure]:
+        """Inspect every folder and collect figures"""
+        return list(self.iter_figures(paths_to_import, pmc_to_id))
 
-            bbox_reader = BoundingBoxMapper()
-            # doc_name/fig_name
-            prefix = figure.uri.split("/")[1][:-4] if loader.subfig_prefix else None
-            bbox_reader.load(subfig_paths, prefix=prefix)
-            for subfig_path in subfig_paths:
-                try:
-                    coordinates = bbox_reader.mapping[subfig_path]
-                    if len(coordinates) == 0:
-                        # no subfigures present
-                        coordinates = [0, 0, figure.width, figure.height]
-                    width = coordinates[2]
-                    height = coordinates[3]
-                except KeyError:
-                    # figsplit did not generate coordinates file
-                    coordinates = None
-                    message = f"Missing coordinates: {subfig_path}"
-                    logging.info(message)
-                    width = -1
-                    height = -1
-
-                local_path = Path(subfig_path)
-                subfigures.append(
-                    DBFigure(
-                        status=SubFigureStatus.NOT_PREDICTED.value,
-                        uri=f"{figure.uri[:-4]}/{local_path.name}",
-                        width=width,
-                        height=height,
-                        type=FigureType.SUBFIGURE.value,
-                        name=local_path.stem,
-                        caption=None,
-                        num_panes=None,
-                        doc_id=figure.doc_id,
-                        parent_id=url_to_id[figure.uri],
-                        coordinates=coordinates,
-                        source=self.project,
-                        page=figure.page,
-                    )
+    def fetch_figure_subfigures(
+        self, figure: DBFigure, parent_id: int, bboxes: BoundingBoxMapper
+    ) -> List[DBFigure]:
+        """Subfigures of a single figure with their coordinates from the loaded
+        bounding boxes. It does not modify the figure, so it can run on worker
+        threads."""
+        subfigures = []
+        figure_folder = Project.import_dir(self.dir) / figure.uri[:-4]
+        subfig_paths = self._fetch_content(figure_folder, ".jpg")
+
+        for subfig_path in subfig_paths:
+            coordinates = bboxes.lookup(subfig_path)
+            if coordinates is None:
+                # figsplit did not generate coordinates file
+                message = f"Missing coordinates: {subfig_path}"
+                logging.info(message)
+                width = -1
+                height = -1
+            else:
+                if len(coordinates) == 0:
+                    # no subfigures present
+                    coordinates = [0, 0, figure.width, figure.height]
+                width = coordinates[2]
+                height = coordinates[3]
+
+            local_path = Path(subfig_path)
+            subfigures.append(
+                DBFigure(
+                    status=SubFigureStatus.NOT_PREDICTED.value,
+                    uri=f"{figure.uri[:-4]}/{local_path.name}",
+                    width=width,
+                    height=height,
+                    type=FigureType.SUBFIGURE.value,
+                    name=local_path.stem,
+                    caption=None,
+                    num_panes=None,
+                    doc_id=figure.doc_id,
+                    parent_id=parent_id,
+                    coordinates=coordinates,
+                    source=self.project,
+                    page=figure.page,
                 )
-                figure.num_panes += 1
+            )
         return subfigures
 
+    def iter_subfigures(
+        self, figures: List[DBFigure], url_to_id: Dict[str, int]
+    ) -> Iterator[DBFigure]:
+        """Stream the subfigures of every figure. Each worker thread takes a
+        document, loads the bounding boxes of all its figures at once and
+        lists the figure folders."""
+        import_dir = Project.import_dir(self.dir)
+        documents: Dict[str, List[DBFigure]] = {}
+        for figure in figures:
+            documents.setdefault(figure.uri.split("/")[0], []).append(figure)
+
+        def read_document(doc_figures: List[DBFigure]) -> List[Tuple]:
+            # the subfigures are matched by the index at the end of their name,
+            # so the prefix used by some loaders (fig_name_001.jpg) is not needed
+            bboxes = BoundingBoxMapper().load_figures(
+                str(import_dir / el.uri[:-4]) for el in doc_figures
+            )
+            return [
+                (el, self.fetch_figure_subfigures(el, url_to_id[el.uri], bboxes))
+                for el in doc_figures
+            ]
+
+        for results in tqdm(
+            self._map_folders(read_document, documents.values()), total=len(documents)
+        ):
+            for figure, subfigures in results:
+                figure.num_panes += len(subfigures)
+                yield from subfigures
+
+    def fetch_subfigures(
+        self, figures: List[DBFigure], url_to_id: Dict[str, int]
+    ) -> List[DBFigure]:
+        """Fetch subfigures and bounding boxes information"""
+        return list(self.iter_subfigures(figures, url_to_id))
+
     def _get_paths_to_import(self, prefix: Optional[str]):
         import_dir = Project.import_dir(self.dir)
         if prefix is not None:
@@ -248,7 +370,8 @@ class ImportManager:
             move(folder, target)
 
     def _move_successful_imports(self, folders: List[str]):
-        self._move(folders, Project.predict_dir(self.dir), False)
+        # re-imported folders replace their previous version
+        self._move(folders, Project.predict_dir(self.dir), True)
 
     def _move_folder_with_errors(self):
         reasons = self.validator.violation_reasons_
@@ -262,55 +385,322 @@ class ImportManager:
         self._move(reasons["missing_pdf"], err_no_pdf, True)
         self._move(reasons["multiple_pdfs"], err_multiple, True)
 
-    def _insert_documents_to_db(self, cursor: Cursor, documents: List[DbDocument]):
-        """Massive import of documents to database"""
+    def _stage(
+        self, cursor: Cursor, table: str, columns: str, rows: Iterable[Tuple]
+    ) -> str:
+        """COPY the rows into a temporary table with the column types of the
+        target table. Returns the name of the temporary table, which callers
+        truncate after use so it can be reused in the same transaction."""
         schema = self.params.schema
-        # pylint: disable=line-too-long
-        sql = f"COPY {schema}.documents (title, authors, abstract, publication_date, pmcid, pubmed_id, journal, repository, project, license, status, uri, doi, notes, import_date, otherid) FROM STDIN"
-        with cursor.copy(sql) as copy:
-            for doc in documents:
-                copy.write_row(doc.to_tuple())
-
-    def _insert_figures_to_db(self, cursor: Cursor, figures: List[DBFigure]):
-        """Massive import of figures to database"""
+        staging = f"staging_{table}"
+        cursor.execute(
+            f"""CREATE TEMP TABLE IF NOT EXISTS {staging} ON COMMIT DROP AS
+                SELECT {columns} FROM {schema}.{table} WITH NO DATA"""
+        )
+        with cursor.copy(f"COPY {staging} ({columns}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row(row)
+        return staging
+
+    def _insert_through_staging(
+        self,
+        cursor: Cursor,
+        table: str,
+        columns: str,
+        rows: Iterable[Tuple],
+        returning: str,
+    ) -> List[Tuple]:
+        """COPY the rows into a temporary table with the column types of the
+        target table, then move them with a single INSERT ... SELECT. COPY
+        cannot return the generated ids, but the INSERT can, so the callers map
+        the new rows without scanning the whole target table."""
         schema = self.params.schema
-        # pylint: disable=line-too-long
-        sql = f"COPY {schema}.figures (name,caption,num_panes,fig_type,doc_id,status,uri,parent_id,width,height,coordinates,last_update_by,owner,migration_key,notes,label,source,page,ground_truth) FROM STDIN"
-        with cursor.copy(sql) as copy:
-            for elem in figures:
-                copy.write_row(elem.to_tuple())
-
-    def _build_uri_to_id_mapper(self, cursor: Cursor) -> Dict[str, int]:
-        """
-        Query the database for the insert figures and create a dictionary that
-        matches the figure path to the database id. We can just this match to
-        populate the figure id for the labels table.
-        """
+        staging = self._stage(cursor, table, columns, rows)
+        cursor.execute(
+            f"""INSERT INTO {schema}.{table} ({columns})
+                SELECT {columns} FROM {staging}
+                RETURNING {returning}"""
+        )
+        inserted = cursor.fetchall()
+        # the staging table is reused for subfigures in the same transaction
+        cursor.execute(f"TRUNCATE {staging}")
+        return inserted
+
+    def _insert_documents_to_db(
+        self, cursor: Cursor, documents: List[DbDocument], folder_field: str
+    ) -> Dict[str, int]:
+        """Massive import of documents to database. Returns a dictionary
+        [folder_field, doc_id] to match figures to their source documents"""
+        rows = self._insert_through_staging(
+            cursor,
+            "documents",
+            DOCUMENT_COLUMNS,
+            (doc.to_tuple() for doc in documents),
+            f"id, {folder_field}",
+        )
+        return {r[1]: r[0] for r in rows if r[1]}
+
+    def _replace_documents_in_db(
+        self, cursor: Cursor, documents: List[DbDocument], folder_field: str
+    ) -> Dict[str, int]:
+        """Update the rows of documents imported before by the same project,
+        keeping their ids and curation columns. Their figures and subfigures
+        are updated by _update_figures_in_db. Returns a dictionary
+        [folder_field, doc_id] for the documents found."""
         schema = self.params.schema
-        query = f"select id, uri from {schema}.figures WHERE status = {FigureStatus.IMPORTED.value}"
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        values = [getattr(doc, folder_field) for doc in documents]
+        projects = {getattr(doc, folder_field): doc.project for doc in documents}
+        cursor.execute(
+            f"""SELECT id, {folder_field}, project FROM {schema}.documents
+                WHERE {folder_field} = ANY(%s) AND project = ANY(%s)""",
+            (values, list(set(projects.values()))),
+        )
+        existing = {r[1]: r[0] for r in cursor.fetchall() if projects[r[1]] == r[2]}
+        if len(existing) == 0:
+            return existing
+
+        rows = (
+            doc.to_tuple()
+            for doc in documents
+            if getattr(doc, folder_field) in existing
+        )
+        staging = self._stage(cursor, "documents", DOCUMENT_COLUMNS, rows)
+        staged = ", ".join(f"s.{el}" for el in DOCUMENT_UPDATE_COLUMNS.split(", "))
+        cursor.execute(
+            f"""UPDATE {schema}.documents d
+                SET ({DOCUMENT_UPDATE_COLUMNS}) = ({staged})
+                FROM {staging} s
+                WHERE d.{folder_field} = s.{folder_field}
+                AND d.project = s.project"""
+        )
+        cursor.execute(f"TRUNCATE {staging}")
+        notify_surrogates_changed(cursor, schema, list(existing.values()))
+        return existing
+
+    def _insert_figures_to_db(
+        self, cursor: Cursor, figures: Iterable[DBFigure]
+    ) -> Dict[str, int]:
+        """Massive import of figures to database. Returns a dictionary that
+        matches the figure path to the database id of the inserted figures"""
+        rows = self._insert_through_staging(
+            cursor,
+            "figures",
+            FIGURE_COLUMNS,
+            (elem.to_tuple() for elem in figures),
+            "id, uri",
+        )
         return {r[1]: r[0] for r in rows}
 
-    def _build_pmc_to_id_mapper(
-        self, cursor: Cursor, folder_field: str
-    ) -> Dict[str, str]:
-        """Get a dictionary [pmcid, doc_id] to match figures to their corresponding
-        source documents"""
+    def _update_figures_in_db(
+        self,
+        cursor: Cursor,
+        figures: Iterable[DBFigure],
+        fig_type: int,
+        doc_ids: List[int],
+    ) -> Dict[str, int]:
+        """Import figures (or subfigures) of a batch with documents imported
+        before. Rows matching a new one by document, parent figure and name are
+        updated in place, so their ids and the label, ground truth and status
+        are kept; the new rows without a match are inserted, and the rows of
+        the doc_ids missing from the new version are deleted. Subfigures
+        without ground truth whose uri or coordinates changed are a different
+        crop after re-segmentation, so their label is cleared and they are
+        predicted again. Returns a dictionary that matches the figure path to
+        the database id of the updated and inserted figures."""
         schema = self.params.schema
-        # field is text
-        sql = f"select id, {folder_field} from {schema}.documents where status='IMPORTED' and {folder_field} != ''"
-        cursor.execute(sql)
-        rows = cursor.fetchall()
-        return {r[1]: r[0] for r in rows}
+        staging = self._stage(
+            cursor, "figures", FIGURE_COLUMNS, (elem.to_tuple() for elem in figures)
+        )
+        match = """f.doc_id = s.doc_id AND f.fig_type = s.fig_type
+                   AND f.name = s.name
+                   AND f.parent_id IS NOT DISTINCT FROM s.parent_id"""
+        staged = ", ".join(f"s.{el}" for el in FIGURE_UPDATE_COLUMNS.split(", "))
+        reset = ""
+        if fig_type == FigureType.SUBFIGURE.value:
+            changed = f"""f.status IS DISTINCT FROM {SubFigureStatus.GROUND_TRUTH.value}
+                AND (f.uri IS DISTINCT FROM s.uri
+                     OR f.coordinates IS DISTINCT FROM s.coordinates)"""
+            reset = f""",
+                status = CASE WHEN {changed}
+                              THEN {SubFigureStatus.NOT_PREDICTED.value}
+                              ELSE f.status END,
+                label = CASE WHEN {changed} THEN NULL ELSE f.label END"""
+        cursor.execute(
+            f"""UPDATE {schema}.figures f
+                SET ({FIGURE_UPDATE_COLUMNS}) = ({staged}){reset}
+                FROM {staging} s
+                WHERE {match}
+                RETURNING f.id, f.uri"""
+        )
+        uri_to_id = {r[1]: r[0] for r in cursor.fetchall()}
+        cursor.execute(
+            f"""INSERT INTO {schema}.figures ({FIGURE_COLUMNS})
+                SELECT {FIGURE_COLUMNS} FROM {staging} s
+                WHERE NOT EXISTS (SELECT 1 FROM {schema}.figures f WHERE {match})
+                RETURNING id, uri"""
+        )
+        uri_to_id.update({r[1]: r[0] for r in cursor.fetchall()})
+        # subfigures of deleted figures no longer match and go with the
+        # subfigures of the batch
+        cursor.execute(
+            f"""DELETE FROM {schema}.figures f
+                WHERE f.doc_id = ANY(%s) AND f.fig_type = %s
+                AND NOT EXISTS (SELECT 1 FROM {staging} s WHERE {match})""",
+            (doc_ids, fig_type),
+        )
+        cursor.execute(f"TRUNCATE {staging}")
+        return uri_to_id
+
+    def _write_figures(
+        self,
+        cursor: Cursor,
+        figures: Iterable[DBFigure],
+        fig_type: int,
+        updated_ids: List[int],
+    ) -> Dict[str, int]:
+        """Plain inserts unless the batch updates documents imported before"""
+        if len(updated_ids) == 0:
+            return self._insert_figures_to_db(cursor, figures)
+        return self._update_figures_in_db(cursor, figures, fig_type, updated_ids)
+
+    def _skip_completed(
+        self, paths_to_import: List[str], checkpoint: ImportCheckpoint
+    ) -> List[str]:
+        """Remove the folders committed by a previous, interrupted import. The
+        folders may still be in to_import if the process died before moving
+        them, so they are moved without validating them again."""
+        completed = checkpoint.completed_folders()
+        if len(completed) == 0:
+            return paths_to_import
+        done = [el for el in paths_to_import if Path(el).name in completed]
+        logging.info("Resuming import, %d folders already imported", len(completed))
+        self._move_successful_imports(done)
+        return [el for el in paths_to_import if Path(el).name not in completed]
+
+    def _changed_folders(
+        self, paths_to_import: List[str], manifest: ImportManifest
+    ) -> List[str]:
+        """Folders to import, sorted, leaving out the folders with the same
+        content as their last import. Folders imported before the manifest
+        existed are compared against their copy in to_predict. The hashes of
+        the returned folders are staged in the manifest."""
+        predict_dir = Project.predict_dir(self.dir)
+        digests = self._map_folders(folder_hash, paths_to_import)
+        changed, unchanged = [], []
+        for folder, digest in zip(paths_to_import, digests):
+            name = Path(folder).name
+            previous = manifest.get(name)
+            if previous is None and (predict_dir / name).exists():
+                previous = folder_hash(str(predict_dir / name))
+            manifest.stage(name, digest)
+            if previous == digest:
+                logging.info("%s,IGNORED,unchanged since last import", name)
+                unchanged.append(folder)
+            else:
+                if previous is not None:
+                    logging.info("%s,UPDATED,content changed", name)
+                changed.append(folder)
+        if unchanged:
+            # records the folders compared against to_predict
+            manifest.commit(unchanged)
+        return sorted(changed)
+
+    def _import_batch(
+        self,
+        batch_idx: int,
+        folders: List[str],
+        documents: List[DbDocument],
+        loader: Loader,
+        checkpoint: ImportCheckpoint,
+        manifest: ImportManifest,
+    ) -> bool:
+        """Insert the documents, figures and subfigures of the folders in a
+        single transaction. Documents imported before are updated in place. The
+        folders are moved to to_predict and recorded in the checkpoint and
+        manifest only after the commit. Returns whether it succeeded."""
+        lookup_id = loader.lookup_id
+        # pylint: disable=not-context-manager
+        with connect(conninfo=self.params.conninfo(), autocommit=False) as conn:
+            with conn.cursor() as cursor:
+                try:
+                    logging.info("Batch %d: updating documents", batch_idx)
+                    pmc_to_id = self._replace_documents_in_db(
+                        cursor, documents, lookup_id
+                    )
+                    logging.info("Batch %d: inserting documents", batch_idx)
+                    new_documents = [
+                        doc
+                        for doc in documents
+                        if getattr(doc, lookup_id) not in pmc_to_id
+                    ]
+                    # documents imported before keep their figure ids
+                    updated_ids = list(pmc_to_id.values())
+                    pmc_to_id.update(
+                        self._insert_documents_to_db(cursor, new_documents, lookup_id)
+                    )
+
+                    # the figures are written to COPY while the folders are
+                    # scanned, and kept to look for their subfigures
+                    logging.info("Batch %d: inserting figures", batch_idx)
+                    figures = []
+                    stream = self.iter_figures(folders, pmc_to_id)
+                    url_to_id = self._write_figures(
+                        cursor,
+                        _collect(stream, figures),
+                        FigureType.FIGURE.value,
+                        updated_ids,
+                    )
 
-    def import_content(self, metadata_path: str, loader: Loader):
+                    logging.info("Batch %d: inserting subfigures", batch_idx)
+                    stream = self.iter_subfigures(figures, url_to_id)
+                    subfig_to_id = self._write_figures(
+                        cursor, stream, FigureType.SUBFIGURE.value, updated_ids
+                    )
+
+                    logging.info("Batch %d: commiting transaction", batch_idx)
+                    conn.commit()
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    print(f"Error inserting batch {batch_idx}", exc)
+                    logging.error("Error inserting batch %d", batch_idx, exc_info=True)
+                    conn.rollback()
+                    return False
+
+        manifest.commit(folders)
+        checkpoint.record(
+            batch_idx,
+            folders,
+            documents=len(documents),
+            updated=len(documents) - len(new_documents),
+            figures=len(figures),
+            subfigures=len(subfig_to_id),
+        )
+        logging.info("Moving: %d", len(folders))
+        self._move_successful_imports(folders)
+        return True
+
+    def _refresh_surrogate_view(self):
+        # pylint: disable=not-context-manager
+        with connect(conninfo=self.params.conninfo(), autocommit=False) as conn:
+            with conn.cursor() as cursor:
+                DocumentModel.refresh_surrogate_view(cursor, self.params.schema)
+
+    def import_content(
+        self, metadata_path: str, loader: Loader, batch_size: Optional[int] = None
+    ):
         """Insert documents, figures and subfigures to the database based
-        on the documents found on /to_import folder"""
+        on the documents found on /to_import folder.
+        batch_size: number of folders imported per transaction, None imports
+        every folder in a single transaction. Committed batches are written to
+        the project checkpoint, and running the import again after a failure
+        only processes the remaining folders.
+        """
+        checkpoint = ImportCheckpoint(Project.import_checkpoint(self.dir))
 
         # prepare the paths to explore
         logging.info("Starting import - validating data ######################")
         paths_to_import = self._get_paths_to_import(prefix=loader.prefix)
+        paths_to_import = self._skip_completed(paths_to_import, checkpoint)
         logging.info("\tAvailable paths: %d", len(paths_to_import))
         path_to_remove = self.validate_pdf_folders(paths_to_import)
         logging.info("\tInvalid file paths: %d", len(path_to_remove))
@@ -322,54 +712,39 @@ class ImportManager:
         logging.info("  %d documents found in metadata", len(documents))
 
         import_dir = Project.import_dir(self.dir)
-        paths_in_metadata = [
-            str(import_dir / doc.folder_name(loader.folder_name)) for doc in documents
-        ]
-        paths_to_remove = list(set(paths_to_import).difference(paths_in_metadata))
+        folder_to_doc = {
+            str(import_dir / doc.folder_name(loader.folder_name)): doc
+            for doc in documents
+        }
+        paths_to_remove = list(set(paths_to_import).difference(folder_to_doc))
         self.validator.violation_reasons_["not_in_metadata"] = paths_to_remove
-        paths_to_import = paths_in_metadata
+        paths_to_import = list(folder_to_doc.keys())
 
-        # remove any folder that already exists on to_predict
-        tmp = []
-        for folder in paths_to_import:
-            name = Path(folder).name
-            if (Project.predict_dir(self.dir) / name).exists():
-                logging.info("%s,IGNORED,already exists in predicted", name)
-            else:
-                tmp.append(folder)
-        paths_to_import = tmp
+        # only import new folders and folders whose content changed
+        manifest = ImportManifest(Project.import_manifest(self.dir))
+        paths_to_import = self._changed_folders(paths_to_import, manifest)
+        self._move_folder_with_errors()
         if len(paths_to_import) == 0:
+            checkpoint.clear()
             return
 
-        # pylint: disable=not-context-manager
-        with connect(conninfo=self.params.conninfo(), autocommit=False) as conn:
-            with conn.cursor() as cursor:
-                try:
-                    logging.info("Inserting documents")
-                    self._insert_documents_to_db(cursor, documents)
-                    pmc_to_id = self._build_pmc_to_id_mapper(cursor, loader.lookup_id)
-
-                    logging.info("Inserting figures")
-                    figures = self.fetch_figures(paths_to_import, pmc_to_id)
-                    self._insert_figures_to_db(cursor, figures)
-
-                    logging.info("Inserting subfigures")
-                    url_to_id = self._build_uri_to_id_mapper(cursor)
-                    subfigures = self.fetch_subfigures(figures, url_to_id, loader)
-                    self._insert_figures_to_db(cursor, subfigures)
-
-                    logging.info("Moving: %d", len(paths_to_import))
-                    self._move_folder_with_errors()
-                    self._move_successful_imports(paths_to_import)
-                    logging.info("Commiting transaction")
-                    conn.commit()
-                # pylint: disable=broad-except
-                except Exception as exc:
-                    print("Error inserting content", exc)
-                    logging.error("Error inserting content", exc_info=True)
-                    conn.rollback()
-
-    def create_tables(self):
+        batch_size = batch_size or len(paths_to_import)
+        failed = 0
+        for batch_idx, start in enumerate(range(0, len(paths_to_import), batch_size)):
+            folders = paths_to_import[start : start + batch_size]
+            batch_documents = [folder_to_doc[folder] for folder in folders]
+            if not self._import_batch(
+                batch_idx, folders, batch_documents, loader, checkpoint, manifest
+            ):
+                failed += 1
+
+        self._refresh_surrogate_view()
+        if failed == 0:
+            checkpoint.clear()
+        else:
+            logging.info("%d batches failed, run the import again to retry", failed)
+
+    def create_tables(self, surrogate_view: bool = False):
         """Create database tables"""
         # pylint: disable=not-context-manager
         with connect(conninfo=self.params.conninfo(), autocommit=False) as conn:
@@ -379,6 +754,9 @@ class ImportManager:
                     owner = self.params.user
                     cursor.execute(create_documents_table(schema, owner))
                     cursor.execute(create_figures_table(schema, owner))
+                    cursor.execute(create_indexes(schema))
+                    if surrogate_view:
+                        cursor.execute(create_surrogate_view(schema, owner))
                 # pylint: disable=broad-except
                 except Exception as exc:
                     print("Erorr creating tables", exc)
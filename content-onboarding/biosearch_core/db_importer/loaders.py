@@ -1,16 +1,15 @@
 """ Load metadata from file"""
 
-from os import listdir
+from os import listdir, environ
 from abc import ABC, abstractmethod
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 from pathlib import Path
-import numpy as np
-import csv
 import json
-import requests
-from time import sleep
+import logging
 from biosearch_core.data.document import DbDocument
+from biosearch_core.db_importer.cord_metadata import CordMetadata
+from biosearch_core.db_importer.pubmed import PubMedClient, PubMedFetcher, default_cache
 
 # pylint: disable=too-few-public-methods
 class Loader(ABC):
@@ -61,13 +60,10 @@ class Cord19Loader(Loader):
         documents = []
         import_date = datetime.now()
 
-        with open(csv_path, encoding="utf-8") as f_in:
-            reader = csv.DictReader(f_in)
-            for row in reader:
-                # only insert documents with local folder
-                if row["pmcid"] not in dict_paths:
-                    continue
-
+        # only the rows for the local folders are read from the indexed copy
+        metadata = CordMetadata(csv_path)
+        try:
+            for row in metadata.rows(dict_paths.keys()):
                 main_pdf = [
                     x for x in listdir(dict_paths[row["pmcid"]]) if x.endswith(".pdf")
                 ][0]
@@ -100,23 +96,26 @@ class Cord19Loader(Loader):
                     otherid=None,
                 )
                 documents.append(document)
+        finally:
+            metadata.close()
         return documents
 
 
 class GDXLoader(Loader):
-    """Loader for the GDX2000 collection"""
+    """Loader for the GDX2000 collection. The PubMed summaries are fetched with
+    the given fetcher, by default one that caches them next to the metadata
+    file and uses the NCBI_API_KEY environment variable when available."""
 
-    def __init__(self) -> None:
+    def __init__(self, fetcher: Optional[PubMedFetcher] = None) -> None:
         super().__init__()
         self.prefix = None
         self.folder_name = "cord_uid"
         self.lookup_id = "otherid"
         self.subfig_prefix = True
+        self.fetcher = fetcher
 
-    def get_metadata(self, pmid, gxd_entry, pubmed_dict):
-        """Parse entries from our metadata and the data queried from PubMed"""
-
-        data = pubmed_dict["result"][pmid]
+    def get_metadata(self, pmid, gxd_entry, data):
+        """Parse entries from our metadata and the summary queried from PubMed"""
 
         authors = [x["name"] for x in data["authors"]]
         publication_date = datetime.strptime(data["sortpubdate"][:10], "%Y/%m/%d")
@@ -160,31 +159,20 @@ class GDXLoader(Loader):
 
         with open(csv_path, "r", encoding="utf-8") as f_in:
             gdx = json.loads(f_in.read())
-        gdx_pubmed_ids = [x["pmid"] for x in gdx]
-        gdx = {x["pmid"]: x for x in gdx}
+        # only use pdfs with jaxid from gdx2000
+        pdfs = {Path(el).stem for el in pdf_paths}
+        gdx = {str(x["pmid"]): x for x in gdx if x["jaxid"] in pdfs}
 
-        # split to query NCBI
-        n_splits = len(gdx_pubmed_ids) // 100
-        id_splits = np.array_split(gdx_pubmed_ids, n_splits)
+        fetcher = self.fetcher
+        if fetcher is None:
+            client = PubMedClient(api_key=environ.get("NCBI_API_KEY"))
+            fetcher = PubMedFetcher(client, default_cache(csv_path))
+        summaries = fetcher.fetch(gdx.keys())
 
         documents = []
-
-        for split in id_splits:
-            concat_pmids = ",".join(split)
-            # pylint: disable=missing-timeout
-            # print(
-            #     f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=pubmed&id={concat_pmids}&retmode=json"
-            # )
-            res_pubmedids = requests.get(
-                f"https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi?db=pubmed&id={concat_pmids}&retmode=json"
-            )
-            for pmid in split:
-                document = self.get_metadata(pmid, gdx[pmid], res_pubmedids.json())
-                documents.append(document)
-            sleep(2.5)
-        pdfs = {Path(el).stem for el in pdf_paths}
-        # only use pdfs with jaxid from gdx2000
-        print(list(pdfs)[:5])
-        # print(documents[:5])
-        filtered_documents = [el for el in documents if el.cord_uid in pdfs]
-        return filtered_documents
+        for pmid, gxd_entry in gdx.items():
+            if pmid not in summaries:
+                logging.info("%s,NOT_IN_PUBMED", gxd_entry["jaxid"])
+                continue
+            documents.append(self.get_metadata(pmid, gxd_entry, summaries[pmid]))
+        return documents
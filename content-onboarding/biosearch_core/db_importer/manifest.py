@@ -0,0 +1,83 @@
+""" Content manifest for incremental imports. Every imported folder is stored
+with a hash of the files that define its rows in the database: the metadata
+json, the names of the figure and subfigure images and the bounding box files.
+A folder arriving again in to_import is only imported when its hash changed,
+and in that case its existing rows are replaced instead of duplicated.
+"""
+
+from hashlib import sha256
+from os import replace, scandir
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import json
+
+# files whose content is hashed, images only contribute their names
+CONTENT_SUFFIXES = (".json", ".txt", ".csv")
+
+
+def _hash_entries(digest, folder: Path, relative: str):
+    with scandir(folder) as iterator:
+        entries = sorted(iterator, key=lambda el: el.name)
+    for entry in entries:
+        name = f"{relative}{entry.name}"
+        if entry.is_dir():
+            _hash_entries(digest, Path(entry.path), f"{name}/")
+            continue
+        if entry.name.endswith(".pdf"):
+            # the pdf is not read by the importer, besides its name
+            digest.update(f"{name}\0".encode("utf-8"))
+        elif entry.name.endswith(CONTENT_SUFFIXES):
+            digest.update(f"{name}\0".encode("utf-8"))
+            with open(entry.path, "rb") as reader:
+                digest.update(reader.read())
+            digest.update(b"\0")
+        elif entry.name.endswith(".jpg"):
+            digest.update(f"{name}\0".encode("utf-8"))
+
+
+def folder_hash(folder: str) -> str:
+    """sha256 over the metadata, figure list and bounding boxes of a folder"""
+    digest = sha256()
+    _hash_entries(digest, Path(folder), "")
+    return digest.hexdigest()
+
+
+class ImportManifest:
+    """Folder name -> content hash of the last import, stored as json. Hashes
+    are staged while planning the import and only persisted for the folders
+    of committed batches."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.hashes: Dict[str, str] = {}
+        self.staged: Dict[str, str] = {}
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as reader:
+                self.hashes = json.load(reader)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.hashes
+
+    def get(self, name: str) -> Optional[str]:
+        """Hash of the last import of the folder"""
+        return self.hashes.get(name)
+
+    def stage(self, name: str, digest: str):
+        """Keep the hash of a folder about to be imported"""
+        self.staged[name] = digest
+
+    def commit(self, folders: Iterable[str]):
+        """Persist the staged hashes of the folders, after their batch was
+        committed to the database"""
+        for folder in folders:
+            name = Path(folder).name
+            if name in self.staged:
+                self.hashes[name] = self.staged.pop(name)
+        self.save()
+
+    def save(self):
+        """Write the manifest to a temporary file that replaces the previous"""
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as writer:
+            json.dump(self.hashes, writer)
+        replace(tmp_path, self.path)
@@ -39,3 +39,18 @@ class Project:
     @staticmethod
     def error_missing_pdf_dir(project_dir: Path) -> Path:
         return project_dir / "errors" / "missing_pdf"
+
+    # pylint: disable=missing-function-docstring
+    @staticmethod
+    def import_checkpoint(project_dir: Path) -> Path:
+        return project_dir / "import_checkpoint.jsonl"
+
+    # pylint: disable=missing-function-docstring
+    @staticmethod
+    def import_manifest(project_dir: Path) -> Path:
+        return project_dir / "import_manifest.json"
+
+    # pylint: disable=missing-function-docstring
+    @staticmethod
+    def predict_checkpoint(project_dir: Path) -> Path:
+        return project_dir / "predict_checkpoint.json"
@@ -0,0 +1,249 @@
+""" Fetch document summaries from NCBI esummary for the GDX loader.
+Summaries are cached on disk by pmid so re-imports do not query NCBI again.
+Missing pmids are requested in batches from a pool of threads that share a
+token bucket, which keeps the client within the NCBI limits (3 requests per
+second, 10 with an api key). Failed requests are retried with exponential
+backoff.
+
+For tests and offline runs, ReplaySession answers the requests from recorded
+summaries with the same payload format as NCBI.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+import json
+import logging
+import sqlite3
+import time
+import requests
+
+ESUMMARY_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esummary.fcgi"
+# requests per second allowed by NCBI
+RATE_WITHOUT_KEY = 3
+RATE_WITH_KEY = 10
+BATCH_SIZE = 100
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Thread-safe token bucket, acquire blocks until a token is available.
+    The capacity is the burst allowed; with the default of one token, requests
+    are spaced 1/rate seconds apart, also on a cold start."""
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = Lock()
+
+    def acquire(self):
+        """Take a token, sleeping outside the lock while the bucket refills"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                elapsed = now - self._updated
+                self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EsummaryCache:
+    """esummary results by pmid in a sqlite file"""
+
+    def __init__(self, path: str):
+        self.path = str(path)
+        self._lock = Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS esummary (pmid TEXT PRIMARY KEY, data TEXT)"
+            )
+
+    def get_many(self, pmids: Iterable[str]) -> Dict[str, Dict]:
+        """Cached summaries for the pmids found"""
+        pmids = list(pmids)
+        found = {}
+        with self._lock:
+            # sqlite limits the number of query parameters
+            for start in range(0, len(pmids), 500):
+                chunk = pmids[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT pmid, data FROM esummary WHERE pmid IN ({placeholders})",
+                    chunk,
+                ).fetchall()
+                found.update({row[0]: json.loads(row[1]) for row in rows})
+        return found
+
+    def put_many(self, summaries: Dict[str, Dict]):
+        """Store or replace summaries"""
+        rows = [(pmid, json.dumps(data)) for pmid, data in summaries.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO esummary (pmid, data) VALUES (?, ?)", rows
+            )
+
+    def close(self):
+        """Close the sqlite connection"""
+        self._conn.close()
+
+
+class PubMedClient:
+    """esummary client with rate limiting and retries"""
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        session: Optional[requests.Session] = None,
+        bucket: Optional[TokenBucket] = None,
+        retries: int = 5,
+        backoff: float = 1.0,
+        timeout: float = 30.0,
+    ):
+        self.api_key = api_key
+        self.session = session if session is not None else requests.Session()
+        rate = RATE_WITH_KEY if api_key else RATE_WITHOUT_KEY
+        self.bucket = bucket if bucket is not None else TokenBucket(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+    def _wait(self, attempt: int, response=None) -> float:
+        retry_after = None
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2**attempt
+
+    def fetch(self, pmids: List[str]) -> Dict[str, Dict]:
+        """Summaries for the pmids returned by NCBI. Ids unknown to NCBI come
+        back with an error field and are left out."""
+        params = {"db": "pubmed", "id": ",".join(pmids), "retmode": "json"}
+        if self.api_key:
+            params["api_key"] = self.api_key
+
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            response = None
+            try:
+                response = self.session.get(
+                    ESUMMARY_URL, params=params, timeout=self.timeout
+                )
+                if response.status_code not in RETRY_STATUS:
+                    response.raise_for_status()
+                    result = response.json()["result"]
+                    return {
+                        uid: result[uid]
+                        for uid in result.get("uids", [])
+                        if uid in result and "error" not in result[uid]
+                    }
+                message = f"status {response.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                message = str(exc)
+            if attempt == self.retries:
+                break
+            wait = self._wait(attempt, response)
+            logging.info("esummary failed (%s), retrying in %.1fs", message, wait)
+            time.sleep(wait)
+        raise RuntimeError(f"esummary failed after {self.retries} retries: {message}")
+
+
+class PubMedFetcher:
+    """Cached and concurrent esummary lookups"""
+
+    def __init__(
+        self,
+        client: PubMedClient,
+        cache: Optional[EsummaryCache] = None,
+        batch_size: int = BATCH_SIZE,
+        workers: Optional[int] = None,
+    ):
+        self.client = client
+        self.cache = cache
+        self.batch_size = batch_size
+        if workers is None:
+            # one request in flight per token of the rate allowed to the client
+            workers = RATE_WITH_KEY if client.api_key else RATE_WITHOUT_KEY
+        self.workers = workers
+
+    def fetch(self, pmids: Iterable[str]) -> Dict[str, Dict]:
+        """Summaries by pmid, querying NCBI only for the pmids not cached"""
+        pmids = list(dict.fromkeys(str(el) for el in pmids))
+        summaries = self.cache.get_many(pmids) if self.cache else {}
+        missing = [el for el in pmids if el not in summaries]
+        logging.info("esummary: %d cached, %d to fetch", len(summaries), len(missing))
+
+        batches = [
+            missing[start : start + self.batch_size]
+            for start in range(0, len(missing), self.batch_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for fetched in executor.map(self.client.fetch, batches):
+                if self.cache:
+                    self.cache.put_many(fetched)
+                summaries.update(fetched)
+        return summaries
+
+
+class ReplayResponse:
+    """Minimal requests.Response stand-in"""
+
+    def __init__(self, status_code: int, payload: Optional[Dict] = None):
+        self.status_code = status_code
+        self.payload = payload
+        self.headers = {}
+
+    def json(self) -> Dict:
+        """Response payload"""
+        return self.payload
+
+    def raise_for_status(self):
+        """Same contract as requests"""
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"status {self.status_code}")
+
+
+class ReplaySession:
+    """Serves esummary requests from recorded summaries by pmid. The first
+    `failures` requests answer 429 to exercise the retries. Requested ids are
+    kept in `requests` to check the cache and batching."""
+
+    def __init__(self, summaries: Dict[str, Dict], failures: int = 0):
+        self.summaries = summaries
+        self.failures = failures
+        self.requests: List[List[str]] = []
+        self._lock = Lock()
+
+    @staticmethod
+    def from_file(path: str) -> "ReplaySession":
+        """Recording saved as a json object {pmid: summary}"""
+        with open(path, "r", encoding="utf-8") as reader:
+            return ReplaySession(json.load(reader))
+
+    # pylint: disable=unused-argument
+    def get(self, url: str, params: Dict, timeout: float = None) -> ReplayResponse:
+        """Answer like esummary with retmode=json"""
+        pmids = params["id"].split(",")
+        with self._lock:
+            self.requests.append(pmids)
+            if self.failures > 0:
+                self.failures -= 1
+                return ReplayResponse(429)
+        result = {"uids": pmids}
+        for pmid in pmids:
+            result[pmid] = self.summaries.get(pmid, {"uid": pmid, "error": "not found"})
+        return ReplayResponse(200, {"header": {}, "result": result})
+
+
+def default_cache(metadata_path: str) -> EsummaryCache:
+    """Cache stored next to the metadata file"""
+    return EsummaryCache(Path(metadata_path).parent / "esummary_cache.sqlite")
@@ -0,0 +1,165 @@
+""" Synthetic CORD19 project for importer benchmarks and tests.
+Creates DOCUMENTS folders in to_import with the layout left by the extraction
+and FigSplit segmentation steps, plus a metadata.csv listing them:
+
+to_import/
+  PMC0000001/
+    PMC0000001.pdf
+    PMC0000001.json    # pages and figures from the extractor
+    1_1.jpg
+    1_1/
+      1_1.jpg.txt      # scaled FigSplit bounding boxes
+      001.jpg
+      002.jpg
+
+The images are placeholders, the importer only reads their names.
+
+  python synthetic.py PROJECTS_DIR [--project cord19] [--documents 1000]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from os import makedirs
+from pathlib import Path
+import csv
+import json
+import random
+from biosearch_core.db_importer.cord_metadata import COLUMNS
+from biosearch_core.db_importer.project import Project
+
+# smallest valid jpeg: start and end of image markers
+PLACEHOLDER_JPG = b"\xff\xd8\xff\xd9"
+FIGURES_PER_PAGE = 2
+
+
+def _bbox_text(num_subfigures: int) -> str:
+    lines = ["   1.0e+03 *", ""]
+    for _ in range(num_subfigures):
+        values = [random.random() for _ in range(4)]
+        lines.append("".join(f"{el:10.4f}" for el in values))
+    return "\n".join(lines)
+
+
+def create_document_folder(
+    import_dir: Path, pmcid: str, num_figures: int, num_subfigures: int
+) -> Path:
+    """Folder of a document ready to import"""
+    folder = import_dir / pmcid
+    makedirs(folder)
+    with open(folder / f"{pmcid}.pdf", "wb") as writer:
+        writer.write(b"%PDF-1.4\n%%EOF\n")
+
+    pages = {}
+    for fig_idx in range(num_figures):
+        page = 1 + fig_idx // FIGURES_PER_PAGE
+        fig_name = f"{page}_{fig_idx % FIGURES_PER_PAGE + 1}"
+        pages.setdefault(page, []).append(
+            {
+                "id": f"{fig_name}.jpg",
+                "name": f"Figure {fig_idx + 1}",
+                "caption": f"Caption of figure {fig_idx + 1} from {pmcid}",
+                "bbox": [0, 0, 600, 400],
+            }
+        )
+        with open(folder / f"{fig_name}.jpg", "wb") as writer:
+            writer.write(PLACEHOLDER_JPG)
+        makedirs(folder / fig_name)
+        bbox_file = folder / fig_name / f"{fig_name}.jpg.txt"
+        with open(bbox_file, "w", encoding="utf-8") as writer:
+            writer.write(_bbox_text(num_subfigures))
+        for subfig_idx in range(num_subfigures):
+            subfig_file = folder / fig_name / f"{subfig_idx + 1:03d}.jpg"
+            with open(subfig_file, "wb") as writer:
+                writer.write(PLACEHOLDER_JPG)
+
+    metadata = {
+        "pages": [
+            {"number": number, "figures": figures}
+            for number, figures in pages.items()
+        ]
+    }
+    with open(folder / f"{pmcid}.json", "w", encoding="utf-8") as writer:
+        json.dump(metadata, writer)
+    return folder
+
+
+def metadata_row(pmcid: str, idx: int) -> dict:
+    """Row of metadata.csv for a synthetic document"""
+    return {
+        "cord_uid": f"uid{idx:07d}",
+        "pmcid": pmcid,
+        "pubmed_id": str(1000000 + idx),
+        "title": f"Synthetic document {idx}",
+        "abstract": f"Abstract of the synthetic document {idx}",
+        "authors": "Doe, Jane; Roe, Richard",
+        "publish_time": f"20{idx % 20:02d}-0{1 + idx % 9}-1{idx % 10}",
+        "journal": "Synthetic Journal",
+        "license": "cc-by",
+        "doi": f"10.0000/synthetic.{idx}",
+        "source_x": "PMC",
+        "pdf_json_files": "",
+    }
+
+
+# pylint: disable=too-many-arguments
+def create_import_tree(
+    project_dir: Path,
+    num_documents: int,
+    figures_per_document: int = 5,
+    subfigures_per_figure: int = 3,
+    start: int = 1,
+    seed: int = 0,
+) -> Path:
+    """Create the to_import folders of a project and its metadata.csv, returns
+    the path to the metadata file"""
+    random.seed(seed)
+    project_dir = Path(project_dir)
+    import_dir = Project.import_dir(project_dir)
+    makedirs(import_dir, exist_ok=True)
+
+    rows = []
+    for idx in range(start, start + num_documents):
+        pmcid = f"PMC{idx:07d}"
+        create_document_folder(
+            import_dir, pmcid, figures_per_document, subfigures_per_figure
+        )
+        rows.append(metadata_row(pmcid, idx))
+
+    metadata_path = project_dir / "metadata.csv"
+    with open(metadata_path, "w", encoding="utf-8", newline="") as writer:
+        csv_writer = csv.DictWriter(writer, fieldnames=COLUMNS)
+        csv_writer.writeheader()
+        csv_writer.writerows(rows)
+    return metadata_path
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="create a synthetic project to import")
+    parser.add_argument("projects_dir", type=str, help="path to projects")
+    parser.add_argument("--project", type=str, default="cord19", help="project name")
+    parser.add_argument("--documents", type=int, default=1000, help="document folders to create")
+    parser.add_argument("--figures", type=int, default=5, help="figures per document")
+    parser.add_argument("--subfigures", type=int, default=3, help="subfigures per figure")
+    parser.add_argument("--seed", type=int, default=0)
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def main():
+    """Create the project"""
+    args = parse_args(argv[1:])
+    metadata_path = create_import_tree(
+        Path(args.projects_dir) / args.project,
+        args.documents,
+        args.figures,
+        args.subfigures,
+        seed=args.seed,
+    )
+    print(f"created {args.documents} documents, metadata in {metadata_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -81,3 +81,54 @@ def create_figures_table(schema: str, owner: str) -> str:
     """.format(
         schema=schema, owner=owner
     )
+
+
+def create_indexes(schema: str) -> str:
+    """Secondary indexes for the hot queries: surrogates by document, subfigures
+    by parent figure, prediction by type and status, figure lookups by uri and
+    the documents of an import batch by pmcid or otherid"""
+    return """
+        CREATE INDEX IF NOT EXISTS figures_doc_id_fig_type_idx
+            ON {schema}.figures USING btree (doc_id, fig_type);
+        CREATE INDEX IF NOT EXISTS figures_parent_id_idx
+            ON {schema}.figures USING btree (parent_id);
+        CREATE INDEX IF NOT EXISTS figures_fig_type_status_idx
+            ON {schema}.figures USING btree (fig_type, status);
+        CREATE INDEX IF NOT EXISTS figures_uri_idx
+            ON {schema}.figures USING btree (uri);
+        CREATE INDEX IF NOT EXISTS documents_project_idx
+            ON {schema}.documents USING btree (project);
+        CREATE INDEX IF NOT EXISTS documents_pmcid_idx
+            ON {schema}.documents USING btree (pmcid);
+        CREATE INDEX IF NOT EXISTS documents_otherid_idx
+            ON {schema}.documents USING btree (otherid);
+    """.format(
+        schema=schema
+    )
+
+
+def create_surrogate_view(schema: str, owner: str) -> str:
+    """Materialized view with one row per subfigure and the data of its parent
+    figure, so the surrogate cards do not need the figures self-join. The view
+    is created empty and populated by the first refresh. The unique index is
+    required to refresh it concurrently."""
+    return """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS {schema}.surrogate_subfigures AS
+            SELECT f.doc_id, f.id as fig_id, sf.id as subfig_id, f.caption,
+                   f.uri as fig_uri, sf.uri as subfig_uri, sf.coordinates,
+                   sf.label as prediction, f.width, f.height, f.page
+            FROM {schema}.figures f
+            JOIN {schema}.figures sf ON sf.parent_id = f.id
+            WHERE f.fig_type = 0
+        WITH NO DATA;
+
+        CREATE UNIQUE INDEX IF NOT EXISTS surrogate_subfigures_subfig_id_idx
+            ON {schema}.surrogate_subfigures USING btree (subfig_id);
+        CREATE INDEX IF NOT EXISTS surrogate_subfigures_doc_id_idx
+            ON {schema}.surrogate_subfigures USING btree (doc_id);
+
+        ALTER MATERIALIZED VIEW IF EXISTS {schema}.surrogate_subfigures
+            OWNER to {owner};
+    """.format(
+        schema=schema, owner=owner
+    )
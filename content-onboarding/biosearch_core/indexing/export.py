@@ -34,6 +34,9 @@ def parse_args(args) -> Namespace:
     parser.add_argument("project", type=str, help="project name")
     parser.add_argument("db", type=str, help="path to .env with db conn")
     parser.add_argument("output_file", type=str, help="path to output parquet")
+    parser.add_argument(
+        "--batch_size", type=int, default=10000, help="documents per row group"
+    )
     parsed_args = parser.parse_args(args)
 
     return parsed_args
@@ -46,7 +49,8 @@ def main():
     
     conn_params = params_from_env(args.db)
     manager = IndexManager(args.project, conn_params)
-    manager.to_parquet(args.output_file)
+    total = manager.to_parquet(args.output_file, batch_size=args.batch_size)
+    logging.info("Exported %d documents", total)
 
 
 if __name__ == "__main__":
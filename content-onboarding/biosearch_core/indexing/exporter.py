@@ -1,16 +1,88 @@
 """ Module to exporting the database records for indexing """
 
-from typing import Optional, List, Tuple
+from typing import Optional, List, Tuple, Iterable, Iterator, Dict, Sequence
 from dataclasses import asdict
-from datetime import datetime
-from collections import defaultdict
-from pandas import json_normalize as pd_json_normalize
+from itertools import islice
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import psycopg
 from psycopg import Cursor
 from biosearch_core.data.figure import FigureType
 from biosearch_core.indexing.lucene import LuceneCaption, LuceneDocument
 from biosearch_core.db.model import ConnectionParams
 
+# rows fetched per round trip by the server-side cursors
+ITERSIZE = 2000
+
+PARQUET_SCHEMA = pa.schema(
+    [
+        ("doc_id", pa.int64()),
+        ("source", pa.string()),
+        ("title", pa.string()),
+        ("abstract", pa.string()),
+        ("pub_date", pa.date32()),
+        ("journal", pa.string()),
+        ("authors", pa.string()),
+        ("pmcid", pa.string()),
+        ("num_figures", pa.int64()),
+        ("modalities", pa.list_(pa.string())),
+        ("url", pa.string()),
+        (
+            "captions",
+            pa.list_(
+                pa.struct([("figure_id", pa.int64()), ("text", pa.string())])
+            ),
+        ),
+        ("otherid", pa.string()),
+    ]
+)
+
+
+def _modality_ancestors(modality: str) -> List[str]:
+    """mic.ele.sca -> [mic, mic.ele, mic.ele.sca]"""
+    levels = modality.split(".")
+    return [".".join(levels[: i + 1]) for i in range(len(levels))]
+
+
+def expand_modality_parents(
+    labels: Sequence[Optional[List[str]]],
+) -> pa.ListArray:
+    """Expand the subfigure labels of a batch of documents with their parent
+    modalities, e.g. mic.ele -> mic, mic.ele, to enable filtering at multiple
+    levels. The ancestors are only computed once per distinct label in the
+    batch and the per-document results are deduplicated with columnar
+    operations. Documents without labels get a null list."""
+    labels = pa.array(labels, type=pa.list_(pa.string()))
+    flat = pc.list_flatten(labels)
+    owners = pc.list_parent_indices(labels)
+    valid = pc.is_valid(flat)
+    flat, owners = flat.filter(valid), owners.filter(valid)
+
+    encoded = pc.dictionary_encode(flat)
+    ancestors = pa.array(
+        [_modality_ancestors(el) for el in encoded.dictionary.to_pylist()],
+        type=pa.list_(pa.string()),
+    )
+    expanded = ancestors.take(encoded.indices)
+    pairs = pd.DataFrame(
+        {
+            "doc": owners.take(pc.list_parent_indices(expanded)).to_numpy(),
+            "modality": pc.list_flatten(expanded).to_numpy(zero_copy_only=False),
+        }
+    ).drop_duplicates()
+
+    counts = np.bincount(pairs.doc.to_numpy(), minlength=len(labels))
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int32)
+    # a null offset marks the list as null
+    mask = np.concatenate([counts == 0, [False]])
+    return pa.ListArray.from_arrays(
+        pa.array(offsets, mask=mask),
+        pa.array(pairs.modality.to_numpy(), type=pa.string()),
+    )
+
 
 class IndexManager:
     """Export the data to index"""
@@ -20,92 +92,159 @@ class IndexManager:
         self.schema = conn_params.schema
         self.project = project
 
-    def get_documents_from_db(self, cursor: Cursor) -> List[Tuple]:
-        """Get all CORD19 documents with figures extracted"""
+    def _documents_query(self) -> str:
         # TODO add status filter
         # TODO separate the query aggregation to get documents without images,
         # or see how to do a full outer with groupby
         query = """
-                  SELECT d.id, d.repository as source_x, d.title, d.abstract, d.publication_date as publish_time, d.journal, d.authors, d.doi, d.pmcid, COUNT(f.name) as number_figures, array_agg(f.label), d.otherid
+                  SELECT d.id, d.repository as source_x, d.title, d.abstract, d.publication_date as publish_time, d.journal, d.authors, d.doi, d.pmcid, COUNT(f.name) as number_figures, array_agg(DISTINCT f.label), d.otherid
                   FROM {schema}.documents d, {schema}.figures f
                   WHERE d.project='{project}' and d.uri is not NULL and f.doc_id=d.id and f.fig_type={fig_type}
                   GROUP BY d.id
+                  ORDER BY d.id
               """.format(
             schema=self.schema,
             fig_type=FigureType.SUBFIGURE.value,
             project=self.project,
         )
-        cursor.execute(query)
-        return cursor.fetchall()
+        return query
 
-    def get_captions_from_db(self, cursor: Cursor) -> List[Tuple]:
-        """Get captions from figures related to the document"""
+    def _captions_query(self) -> str:
         # TODO add status filter
         query = """SELECT d.id, f.id, f.caption
                    FROM {schema}.documents d, {schema}.figures f
                    WHERE d.id = f.doc_id AND f.fig_type = {fig_type} AND d.project='{project}'
+                   ORDER BY d.id, f.id
         """.format(
             schema=self.schema, project=self.project, fig_type=FigureType.FIGURE.value
         )
-        cursor.execute(query)
+        return query
+
+    def get_documents_from_db(self, cursor: Cursor) -> List[Tuple]:
+        """Get all CORD19 documents with figures extracted"""
+        cursor.execute(self._documents_query())
+        return cursor.fetchall()
+
+    def get_captions_from_db(self, cursor: Cursor) -> List[Tuple]:
+        """Get captions from figures related to the document"""
+        cursor.execute(self._captions_query())
         return cursor.fetchall()
 
     def _add_modality_parents(
         self, modalities: Optional[List[str]]
-    ) -> Optional[str]:
-        if not modalities:
-            return None
-        output = []
-        for modality in modalities:
-            split_modalities = modality.split(".")
-            for i in range(len(split_modalities)):
-                if i == 0:
-                    output.append(split_modalities[0])
-                else:
-                    output.append(".".join(split_modalities[:i+1]))
-        return ";".join(output)
+    ) -> Optional[List[str]]:
+        return expand_modality_parents([modalities])[0].as_py()
 
-    def fetch_docs_to_index(self) -> List[LuceneDocument]:
-        """Fetch data from db and return list of data to index"""
-        lucene_docs = []
+    def _expand_modalities(
+        self, documents: Iterable[Tuple], batch_size: int = ITERSIZE
+    ) -> Iterator[Tuple]:
+        """Replace the subfigure labels of the document records with the
+        modalities to index, expanding a batch of documents at a time"""
+        documents = iter(documents)
+        while True:
+            batch = list(islice(documents, batch_size))
+            if not batch:
+                return
+            modalities = expand_modality_parents([el[10] for el in batch])
+            for document, doc_modalities in zip(batch, modalities.to_pylist()):
+                yield document[:10] + (doc_modalities,) + document[11:]
+
+    def _to_lucene_document(
+        self, document: Tuple, captions: List[LuceneCaption]
+    ) -> LuceneDocument:
+        return LuceneDocument(
+            doc_id=document[0],
+            source=document[1],
+            title=document[2],
+            abstract=document[3],
+            pub_date=document[4],
+            journal=document[5],
+            authors=";".join(document[6]) if document[6] else "",
+            url=document[7],
+            pmcid=document[8],
+            num_figures=document[9],
+            modalities=document[10],
+            captions=captions,
+            otherid=document[11],
+        )
 
+    def _merge_captions(
+        self, documents: Iterable[Tuple], captions: Iterable[Tuple]
+    ) -> Iterator[Tuple[Tuple, List[LuceneCaption]]]:
+        """Merge-join the documents and caption records, both ordered by the
+        document id, so only the captions of the current document are in memory.
+        Captions from documents that are not exported are skipped."""
+        captions = iter(captions)
+        pending = next(captions, None)
+        for document in documents:
+            doc_captions = []
+            while pending is not None and pending[0] < document[0]:
+                pending = next(captions, None)
+            while pending is not None and pending[0] == document[0]:
+                caption = LuceneCaption(figure_id=pending[1], text=pending[2])
+                doc_captions.append(caption)
+                pending = next(captions, None)
+            yield document, doc_captions
+
+    def iter_docs_to_index(self) -> Iterator[LuceneDocument]:
+        """Stream the documents to index using server-side cursors"""
         # https://github.com/PyCQA/pylint/issues/5273
         # pylint: disable=not-context-manager
         with psycopg.connect(conninfo=self.params.conninfo(), autocommit=False) as conn:
-            with conn.cursor() as cursor:
-                document_db_records = self.get_documents_from_db(cursor)
-                caption_db_records = self.get_captions_from_db(cursor)
-
-                id_to_captions = defaultdict(list)
-                for caption in caption_db_records:
-                    id_to_captions[caption[0]].append(
-                        LuceneCaption(figure_id=caption[1], text=caption[2])
-                    )
-                for document in document_db_records:
-                    modalities = self._add_modality_parents(document[10])
-                    captions = id_to_captions[document[0]]
-                    lucene_docs.append(
-                        LuceneDocument(
-                            doc_id=document[0],
-                            source=document[1],
-                            title=document[2],
-                            abstract=document[3],
-                            pub_date=datetime.strftime(document[4], "%Y-%m-%d"),
-                            journal=document[5],
-                            authors=";".join(document[6]) if document[6] else "",
-                            url=document[7],
-                            pmcid=document[8],
-                            num_figures=document[9],
-                            modalities=modalities,
-                            captions=captions,
-                            otherid=document[11],
-                        )
-                    )
-        return lucene_docs
-
-    def to_parquet(self, output_file: str) -> None:
-        """save data as parquet"""
-        documents_to_index = self.fetch_docs_to_index()
-        data = pd_json_normalize(asdict(obj) for obj in documents_to_index)
-        data.modalities = data.modalities.astype(str)
-        data.to_parquet(output_file, engine="pyarrow")
+            with conn.cursor(name="export_documents") as doc_cursor, conn.cursor(
+                name="export_captions"
+            ) as caption_cursor:
+                doc_cursor.itersize = ITERSIZE
+                caption_cursor.itersize = ITERSIZE
+                doc_cursor.execute(self._documents_query())
+                caption_cursor.execute(self._captions_query())
+
+                documents = self._expand_modalities(doc_cursor)
+                for document, captions in self._merge_captions(
+                    documents, caption_cursor
+                ):
+                    yield self._to_lucene_document(document, captions)
+
+    def fetch_docs_to_index(self) -> List[LuceneDocument]:
+        """Fetch data from db and return list of data to index"""
+        return list(self.iter_docs_to_index())
+
+    def tee_parquet(
+        self,
+        documents: Iterable[LuceneDocument],
+        output_file: str,
+        batch_size: int = 10000,
+    ) -> Iterator[Dict]:
+        """Yield every document as a dictionary while writing them to parquet in
+        row groups of batch_size. The file is complete once the iterator is
+        exhausted."""
+        batch = []
+        written = 0
+        with pq.ParquetWriter(output_file, PARQUET_SCHEMA) as writer:
+            for document in documents:
+                row = asdict(document)
+                batch.append(row)
+                if len(batch) == batch_size:
+                    writer.write_table(pa.Table.from_pylist(batch, PARQUET_SCHEMA))
+                    written += len(batch)
+                    batch = []
+                yield row
+            if batch or written == 0:
+                writer.write_table(pa.Table.from_pylist(batch, PARQUET_SCHEMA))
+
+    def write_parquet(
+        self,
+        documents: Iterable[LuceneDocument],
+        output_file: str,
+        batch_size: int = 10000,
+    ) -> int:
+        """Write the documents in row groups of batch_size, returns the number
+        of documents written"""
+        total = 0
+        for _ in self.tee_parquet(documents, output_file, batch_size):
+            total += 1
+        return total
+
+    def to_parquet(self, output_file: str, batch_size: int = 10000) -> int:
+        """save data as parquet, streaming from the database in batches"""
+        return self.write_parquet(self.iter_docs_to_index(), output_file, batch_size)
@@ -1,7 +1,11 @@
 """ Batch index collection of documents """
 
-from datetime import datetime
+from datetime import date, datetime
+from queue import Queue
+from threading import Thread
+from typing import Dict, Iterable, List, Optional
 from pandas import isnull
+import lucene
 
 # pylint: disable=import-error
 from java.nio.file import Paths
@@ -18,17 +22,32 @@ from org.apache.lucene.document import (
 
 from biosearch_core.indexing.CordReader import CordReader
 
-def date2long(date):
+def date2long(value):
     """convert cord19 datetime format to long int for lucene"""
-    if len(date) == 4:
+    if isinstance(value, date):
+        return int(value.strftime("%Y%m%d"))
+    if len(value) == 4:
         # only year
-        parsed = int(f"{date}0101")
+        parsed = int(f"{value}0101")
     else:
         # year-month-day
-        parsed = int(datetime.strptime(date, "%Y-%m-%d").strftime("%Y%m%d"))
+        parsed = int(datetime.strptime(value, "%Y-%m-%d").strftime("%Y%m%d"))
     return parsed
 
 
+def as_list(value, split_term: str) -> List:
+    """Values of a list column. Exports made before the typed parquet schema
+    store the lists as strings joined by split_term."""
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return value.split(split_term)
+    if isinstance(value, float):
+        # NaN from pandas
+        return []
+    return list(value)
+
+
 class Indexer:
     """
     arguments:
@@ -48,8 +67,7 @@ class Indexer:
         index_writer = IndexWriter(store, config)
         return index_writer
 
-    def index_from_dataframe(self, dataframe, ft_provider: CordReader, split_term=" "):
-        """index elements in dataframe"""
+    def _fields(self, ft_provider: Optional[CordReader]) -> Dict:
         fields = {
             "doc_id": StringField.TYPE_STORED,
             "source": StringField.TYPE_STORED,
@@ -68,7 +86,52 @@ class Indexer:
 
         if ft_provider:
             fields["full_text"] = ft_provider
+        return fields
+
+    def _create_document(
+        self, row, fields: Dict, ft_provider: Optional[CordReader], split_term: str
+    ) -> Document:
+        """Lucene document from a dataframe row or a dictionary with the
+        LuceneDocument keys"""
+        document = Document()
+        for key, val in fields.items():
+            if key == "full_text":
+                pmcid = row["pmcid"]
+                full_text = ft_provider.fetch_full_text(pmcid)
+                document.add(Field("full_text", full_text, TextField.TYPE_STORED))
+            elif key == "pub_date":
+                if isnull(row[key]):
+                    continue
+                date_millis = date2long(row[key])
+                document.add(LongPoint(key, date_millis))
+                publish = row[key]
+                if isinstance(publish, date):
+                    publish = publish.strftime("%Y-%m-%d")
+                document.add(Field("publish", publish, StringField.TYPE_STORED))
+            elif key == "modalities":
+                for mod in as_list(row["modalities"], split_term):
+                    document.add(Field("modality", mod, StringField.TYPE_STORED))
+            elif key == "captions":
+                # TODO: save captions as [] when none found
+                # captions = [] if isnull(row["captions"]) else row["captions"]
+                for caption in row["captions"]:
+                    document.add(
+                        Field("caption", caption["text"], TextField.TYPE_STORED)
+                    )
+                    document.add(
+                        Field(
+                            "fig_id",
+                            caption["figure_id"],
+                            StringField.TYPE_STORED,
+                        )
+                    )
+            else:
+                document.add(Field(key, row[key] if row[key] else "", val))
+        return document
 
+    def index_from_dataframe(self, dataframe, ft_provider: CordReader, split_term=" "):
+        """index elements in dataframe"""
+        fields = self._fields(ft_provider)
         store = SimpleFSDirectory(Paths.get(self.store_path))
         writer = self.__create_index_writer(store)
 
@@ -77,47 +140,78 @@ class Indexer:
                 _,
                 row,
             ) in dataframe.iterrows():
-                document = Document()
-                for key, val in fields.items():
-                    if key == "full_text":
-                        pmcid = row["pmcid"]
-                        full_text = ft_provider.fetch_full_text(pmcid)
-                        document.add(
-                            Field("full_text", full_text, TextField.TYPE_STORED)
-                        )
-                    elif key == "pub_date":
-                        date_millis = date2long(row[key])
-                        document.add(LongPoint(key, date_millis))
-                        document.add(
-                            Field("publish", row[key], StringField.TYPE_STORED)
-                        )
-                    elif key == "modalities":
-                        if isnull(row["modalities"]):
-                            modalities = []
-                        else:
-                            modalities = row["modalities"].split(split_term)
-                        for mod in modalities:
-                            document.add(
-                                Field("modality", mod, StringField.TYPE_STORED)
-                            )
-                    elif key == "captions":
-                        # TODO: save captions as [] when none found
-                        # captions = [] if isnull(row["captions"]) else row["captions"]
-                        for caption in row["captions"]:
-                            document.add(
-                                Field("caption", caption["text"], TextField.TYPE_STORED)
-                            )
-                            document.add(
-                                Field(
-                                    "fig_id",
-                                    caption["figure_id"],
-                                    StringField.TYPE_STORED,
-                                )
-                            )
-                    else:
-                        document.add(Field(key, row[key] if row[key] else "", val))
+                document = self._create_document(row, fields, ft_provider, split_term)
                 writer.addDocument(document)
                 # TODO: do i need to raise an exception here?
         finally:
             writer.close()
             store.close()
+
+    def index_from_stream(
+        self,
+        documents: Iterable[Dict],
+        ft_provider: Optional[CordReader],
+        split_term=" ",
+        num_workers: int = 2,
+        queue_size: int = 1000,
+    ) -> int:
+        """Index documents as they are produced, e.g. streamed from the database.
+        A reader thread consumes the iterable and fills a bounded queue, so the
+        producer never runs more than queue_size documents ahead of the
+        indexing workers. IndexWriter.addDocument is thread-safe. Returns the
+        number of indexed documents."""
+        fields = self._fields(ft_provider)
+        store = SimpleFSDirectory(Paths.get(self.store_path))
+        writer = self.__create_index_writer(store)
+        pending = Queue(maxsize=queue_size)
+        errors = []
+        counts = [0] * num_workers
+        vm_env = lucene.getVMEnv()
+
+        def read():
+            try:
+                for document in documents:
+                    if errors:
+                        break
+                    pending.put(document)
+            # pylint: disable=broad-except
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                for _ in range(num_workers):
+                    pending.put(None)
+
+        def index(worker_idx: int):
+            vm_env.attachCurrentThread()
+            while True:
+                row = pending.get()
+                if row is None:
+                    return
+                if errors:
+                    continue  # drain the queue so the reader can finish
+                try:
+                    document = self._create_document(
+                        row, fields, ft_provider, split_term
+                    )
+                    writer.addDocument(document)
+                    counts[worker_idx] += 1
+                # pylint: disable=broad-except
+                except Exception as exc:
+                    errors.append(exc)
+
+        threads = [Thread(target=read, name="index-reader")]
+        threads += [
+            Thread(target=index, args=(idx,), name=f"index-worker-{idx}")
+            for idx in range(num_workers)
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            if errors:
+                raise errors[0]
+        finally:
+            writer.close()
+            store.close()
+        return sum(counts)
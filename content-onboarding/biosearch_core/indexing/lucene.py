@@ -1,6 +1,7 @@
 """ Data models used for indexing content in Apache Lucene"""
 
 from dataclasses import dataclass
+from datetime import date
 from typing import Optional, List
 
 
@@ -16,20 +17,20 @@ class LuceneCaption:
 @dataclass
 class LuceneDocument:  # pylint: disable=too-many-instance-attributes
     """Document to index in Lucene.
-    datetime: str in format "%Y-%m%d" or year alone
-    modalities: str with modalities separated by a white space
+    pub_date: publication date, None when unknown
+    modalities: subfigure modalities including their parents, e.g. mic, mic.ele
     """
 
     doc_id: int
     source: str
     title: str
     abstract: str
-    pub_date: str
+    pub_date: Optional[date]
     journal: str
     authors: str
     pmcid: str
     num_figures: int
-    modalities: str
+    modalities: Optional[List[str]]
     url: str
     captions: Optional[List[LuceneCaption]]
     otherid: str
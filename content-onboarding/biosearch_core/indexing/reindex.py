@@ -0,0 +1,98 @@
+""" Index the documents ready for indexing straight from the database.
+Compared to export.py + index.py, the documents are streamed from Postgres into
+the Lucene writer without materializing them in pandas or on disk. A parquet
+copy of the streamed documents can still be written as a side output.
+
+  python reindex.py PROJECTS_DIR PROJECT DB_ENV OUTPUT_PATH [--parquet FILE]
+"""
+
+import lucene
+
+print("loading java")
+lucene.initVM(vmargs=["-Djava.awt.headless=true"])
+
+# pylint: disable=wrong-import-position
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from dataclasses import asdict
+from pathlib import Path
+import logging
+import time
+from rich.console import Console
+from biosearch_core.db.model import params_from_env
+from biosearch_core.indexing.exporter import IndexManager
+from biosearch_core.indexing.index_writer import Indexer
+from biosearch_core.indexing.CordReader import CordReader
+
+console = Console()
+
+
+def setup_logger(workspace: str):
+    """configure logger"""
+    logger_dir = Path(workspace) / "logs"
+    if not logger_dir.exists:
+        raise FileNotFoundError("workspace does not exist")
+
+    logging.basicConfig(
+        filename=str(logger_dir / "reindex.log"),
+        filemode="a",
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="index documents from the database")
+    parser.add_argument("projects_dir", type=str, help="root folder for projects")
+    parser.add_argument("project", type=str, help="project name")
+    parser.add_argument("db", type=str, help="path to .env with db conn")
+    parser.add_argument("output_path", type=str, help="path to index storage")
+    parser.add_argument("-c", "--cord19_base_path", type=str, default="")
+    parser.add_argument("-p", "--parquet", type=str, default=None, help="also export the documents to this parquet file")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="indexing threads")
+    parser.add_argument("-q", "--queue_size", type=int, default=1000, help="max documents waiting to be indexed")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+
+    return parsed_args
+
+
+def main():
+    """Stream documents from the database into the Lucene indexes"""
+    args = parse_args(argv[1:])
+    setup_logger(str(Path(args.projects_dir) / args.project))
+
+    conn_params = params_from_env(args.db)
+    manager = IndexManager(args.project, conn_params)
+
+    with console.status("[bold green] indexing data..."):
+        fulltext_provider = None
+        if args.cord19_base_path != "":
+            console.log("Found text provider")
+            fulltext_provider = CordReader(args.cord19_base_path)
+
+        documents = manager.iter_docs_to_index()
+        if args.parquet:
+            console.log(f"Exporting a copy to {args.parquet}")
+            rows = manager.tee_parquet(documents, args.parquet)
+        else:
+            rows = (asdict(document) for document in documents)
+
+        start_time = time.time()
+        indexer = Indexer(args.output_path, create_mode=True)
+        total = indexer.index_from_stream(
+            rows,
+            fulltext_provider,
+            split_term=";",
+            num_workers=args.workers,
+            queue_size=args.queue_size,
+        )
+        end_time = time.time()
+        console.log(f"Indexed {total} documents after {end_time - start_time}")
+        logging.info("Indexed %d documents", total)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+""" Time writing predictions back to the figures table.
+Compares the former write-back, one formatted UPDATE per subfigure sent as a
+single string, with PredictManager._update_db, which copies (id, label) into a
+temporary table and applies them with one UPDATE ... FROM. Both run on the same
+subfigures of a throwaway schema, one tenth of them with ground truth, and are
+rolled back so they start from the same table.
+
+Without --db, a temporary local cluster is started as in the import benchmark.
+
+  python benchmark_update.py [--db DB_ENV] [--rows 1000000] [--skip_legacy]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from dataclasses import replace
+import time
+import numpy as np
+from pandas import DataFrame
+from psycopg import Cursor, connect
+from rich.console import Console
+from biosearch_core.data.figure import FigureType, SubFigureStatus
+from biosearch_core.db.model import ConnectionParams, params_from_env
+from biosearch_core.db_importer.benchmark_throughput import (
+    benchmark_schema,
+    temporary_postgres,
+)
+from biosearch_core.prediction.predictor import PredictManager
+
+console = Console()
+LABELS = ["exp.gel", "mic.ele", "mic.flu.wes", "gra.his", "pho"]
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="benchmark prediction write-back")
+    parser.add_argument("--db", type=str, default=None, help="path to .env with db conn, a temporary local cluster if missing")
+    parser.add_argument("--schema", type=str, default="bench_update", help="schema to create and drop")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="subfigures to update")
+    parser.add_argument("--skip_legacy", action="store_true", help="only time the staging table")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def fill_subfigures(conn_params: ConnectionParams, rows: int):
+    """Insert the subfigures to predict, every tenth one with ground truth"""
+    schema = conn_params.schema
+    not_predicted = SubFigureStatus.NOT_PREDICTED.value
+    ground_truth = SubFigureStatus.GROUND_TRUTH.value
+    # pylint: disable=not-context-manager
+    with connect(conninfo=conn_params.conninfo(), autocommit=True) as conn:
+        conn.execute(
+            f"""INSERT INTO {schema}.figures
+                    (name, fig_type, status, uri, width, height, source)
+                SELECT 'sub-' || i, {FigureType.SUBFIGURE.value},
+                       CASE WHEN i % 10 = 0 THEN {ground_truth}
+                            ELSE {not_predicted} END,
+                       'sub-' || i || '.jpg', 100, 100, 'bench'
+                FROM generate_series(1, {rows}) AS i"""
+        )
+        conn.execute(f"ANALYZE {schema}.figures")
+
+
+def legacy_update(cursor: Cursor, schema: str, data: DataFrame):
+    """Former write-back: ids with ground truth through an IN list, then one
+    UPDATE statement per subfigure"""
+    all_ids = ",".join([str(el) for el in data.id.values.tolist()])
+    query = f"""SELECT id FROM {schema}.figures WHERE id IN ({all_ids}) AND
+                status = '{SubFigureStatus.GROUND_TRUTH.value}'"""
+    ids_with_gt = [el[0] for el in cursor.execute(query).fetchall()]
+    with_gt = data.id.isin(ids_with_gt)
+
+    templates = [
+        (
+            data.loc[with_gt],
+            f"UPDATE {schema}.figures SET label=('{{}}') WHERE id=({{}}); ",
+        ),
+        (
+            data.loc[~with_gt],
+            f"UPDATE {schema}.figures SET status={SubFigureStatus.PREDICTED.value},"
+            " label=('{}') WHERE id=({}); ",
+        ),
+    ]
+    for rows, template in templates:
+        if len(rows) == 0:
+            continue
+        values = rows[["prediction", "id"]].itertuples(index=False, name=None)
+        cursor.execute("".join(template.format(*el) for el in values))
+
+
+def time_update(conn_params: ConnectionParams, name: str, update) -> float:
+    """Seconds taken by update(cursor), rolled back"""
+    # pylint: disable=not-context-manager
+    with connect(conninfo=conn_params.conninfo(), autocommit=False) as conn:
+        with conn.cursor() as cursor:
+            start_time = time.time()
+            update(cursor)
+            elapsed = time.time() - start_time
+        conn.rollback()
+    console.log(f"{name:>14}: {elapsed:8.3f}s")
+    return elapsed
+
+
+def run(args: Namespace, conn_params: ConnectionParams):
+    """Fill the schema and time both write-backs"""
+    with console.status(f"[bold green] inserting {args.rows} subfigures..."):
+        fill_subfigures(conn_params, args.rows)
+    rng = np.random.default_rng(0)
+    data = DataFrame(
+        {
+            "id": np.arange(1, args.rows + 1),
+            "prediction": rng.choice(LABELS, size=args.rows),
+        }
+    )
+    manager = PredictManager(".", conn_params, classifiers={})
+
+    # pylint: disable=protected-access
+    results = {
+        "staging table": time_update(
+            conn_params,
+            "staging table",
+            lambda cursor: manager._update_db(cursor, data),
+        )
+    }
+    if not args.skip_legacy:
+        results["legacy"] = time_update(
+            conn_params,
+            "legacy",
+            lambda cursor: legacy_update(cursor, conn_params.schema, data),
+        )
+    for name, elapsed in results.items():
+        console.log(f"{name:>14}: {args.rows / elapsed:12.1f} rows/sec")
+
+
+def main():
+    """Run against the given server or a temporary local cluster"""
+    args = parse_args(argv[1:])
+    if args.db is not None:
+        conn_params = replace(params_from_env(args.db), schema=args.schema)
+        with benchmark_schema(conn_params):
+            run(args, conn_params)
+        return
+    with temporary_postgres(args.schema) as conn_params:
+        with benchmark_schema(conn_params):
+            run(args, conn_params)
+
+
+if __name__ == "__main__":
+    main()
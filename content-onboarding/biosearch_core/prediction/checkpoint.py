@@ -0,0 +1,55 @@
+""" Checkpoint for streaming predictions. Subfigures are predicted in id order
+and every committed chunk stores the last id written, so an interrupted run
+continues after it. The checkpoint belongs to a schema and status filter, and
+is removed once all the subfigures are predicted.
+"""
+
+from datetime import datetime
+from os import replace
+from pathlib import Path
+from typing import Optional
+import json
+import logging
+
+
+class PredictionCheckpoint:
+    """Last subfigure id committed by a streaming prediction"""
+
+    def __init__(self, path: Path, schema: str, status: Optional[int]):
+        self.path = Path(path)
+        self.schema = schema
+        self.status = status
+
+    def last_id(self) -> int:
+        """Id of the last committed subfigure, 0 without a checkpoint for the
+        same schema and status"""
+        if not self.path.exists():
+            return 0
+        try:
+            with open(self.path, "r", encoding="utf-8") as reader:
+                entry = json.load(reader)
+        except json.JSONDecodeError:
+            logging.warning("Ignoring unreadable prediction checkpoint %s", self.path)
+            return 0
+        if entry["schema"] != self.schema or entry["status"] != self.status:
+            logging.warning("Ignoring prediction checkpoint of another run")
+            return 0
+        return entry["last_id"]
+
+    def record(self, last_id: int, predicted: int):
+        """Store the last committed id, replacing the file atomically"""
+        entry = {
+            "schema": self.schema,
+            "status": self.status,
+            "last_id": last_id,
+            "predicted": predicted,
+            "time": datetime.now().isoformat(),
+        }
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as writer:
+            json.dump(entry, writer)
+        replace(tmp_path, self.path)
+
+    def clear(self):
+        """Remove the checkpoint after a complete run"""
+        self.path.unlink(missing_ok=True)
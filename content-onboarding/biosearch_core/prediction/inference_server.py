@@ -0,0 +1,216 @@
+""" Local HTTP service predicting the modality of subfigures.
+The offline jobs (PredictManager, offload_predict) label whole schemas; this
+service answers the pipeline as soon as a document is imported. Requests are
+decoded in the request threads and grouped into dynamic batches: the batcher
+thread waits for an image, then collects more until max_batch_size images or
+max_wait_ms after the first one, and routes the batch through the classifier
+tree at once. Classifiers come from the model registry, loaded once.
+
+  POST /predict  {"paths": ["PMC1/fig_1.jpg", ...]}  relative to BASE_IMG_DIR
+  POST /predict  multipart form with the image files in "images"
+  -> {"predictions": [{"label": "exp.gel",
+                       "levels": [{"label": "exp", "probability": 0.98}, ...]}]}
+
+  python inference_server.py CLASSIFIERS_JSON BASE_IMG_DIR [--port 5050]
+    [--max_batch_size 64] [--max_wait_ms 10]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import Future
+from io import BytesIO
+from pathlib import Path
+from queue import Empty, Queue
+from threading import Thread
+from typing import Dict, List, Optional, Tuple
+import json
+import logging
+import time
+import torch
+from flask import Flask, jsonify, request
+from PIL import UnidentifiedImageError
+from werkzeug.exceptions import BadRequest
+
+from image_modalities_classifier.dataset.image_dataset import (
+    load_image,
+    resolution_transforms,
+)
+from image_modalities_classifier.models.multi_head import FORMAT as MULTI_HEAD_FORMAT
+from image_modalities_classifier.models.predict import (
+    HierarchicalPredictor,
+    RunConfig,
+)
+
+
+class DynamicBatcher:
+    """Groups the images submitted by concurrent requests into batches for the
+    classifier tree, waiting at most max_wait_ms for a batch to fill"""
+
+    def __init__(
+        self,
+        predictor: HierarchicalPredictor,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 10.0,
+    ):
+        self.predictor = predictor
+        self.transforms = resolution_transforms(predictor.sizes)
+        self.draft_size = max(el[0] for el in predictor.sizes)
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # size of every batch sent to the tree
+        self.batch_sizes: List[int] = []
+        self._queue: Queue = Queue()
+        self._stopping = False
+        self._thread = Thread(target=self._run, name="dynamic-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, source) -> Future:
+        """Future with the (label, levels) of an image path or file object"""
+        image = load_image(source, self.draft_size)
+        images = {size: el(image) for size, el in self.transforms.items()}
+        future = Future()
+        self._queue.put((images, future))
+        return future
+
+    def predict(self, sources: List, timeout: Optional[float] = None) -> List[Tuple]:
+        """(label, levels) of every image, in input order"""
+        futures = [self.submit(el) for el in sources]
+        return [el.result(timeout) for el in futures]
+
+    def _collect(self) -> List:
+        items = []
+        deadline = None
+        while len(items) < self.max_batch_size:
+            timeout = None if deadline is None else deadline - time.monotonic()
+            if timeout is not None and timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                break
+            if item is None:
+                self._stopping = True
+                break
+            items.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + self.max_wait
+        return items
+
+    def _run(self):
+        while not self._stopping:
+            items = self._collect()
+            if len(items) == 0:
+                continue
+            self.batch_sizes.append(len(items))
+            try:
+                batch = {
+                    size: torch.stack([el[0][size] for el in items])
+                    for size in self.transforms
+                }
+                labels, levels = self.predictor.route_with_probs(batch)
+                for (_, future), label, level in zip(items, labels, levels):
+                    future.set_result((label, level))
+            # pylint: disable=broad-except
+            except Exception as exc:
+                logging.error("INFERENCE", exc_info=True)
+                for _, future in items:
+                    future.set_exception(exc)
+
+    def close(self):
+        """Stop the batcher thread after the submitted images"""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def serialize(label: str, levels: List[Tuple[str, float]]) -> Dict:
+    """Response entry of an image"""
+    return {
+        "label": label,
+        "levels": [{"label": el[0], "probability": el[1]} for el in levels],
+    }
+
+
+def create_app(batcher: DynamicBatcher, base_img_dir: str) -> Flask:
+    """Flask app answering predictions through the batcher"""
+    app = Flask(__name__)
+    base_dir = Path(base_img_dir).resolve()
+
+    @app.errorhandler(BadRequest)
+    def handle_bad_request(e):
+        """Handler for cases when the parameters are wrong"""
+        response = {"description": e.description}
+        return jsonify(response), 400
+
+    @app.route("/hello")
+    def hello():
+        """just to check if server is up"""
+        return "Hello world!"
+
+    @app.route("/predict", methods=["POST"])
+    def predict():
+        """Labels and probabilities of the posted images or paths"""
+        if len(request.files) > 0:
+            files = request.files.getlist("images")
+            sources = [BytesIO(el.read()) for el in files]
+        else:
+            paths = (request.get_json(silent=True) or {}).get("paths", [])
+            sources = [(base_dir / el).resolve() for el in paths]
+            if any(base_dir not in el.parents for el in sources):
+                raise BadRequest("paths must be relative to the image folder")
+        if len(sources) == 0:
+            raise BadRequest("expected 'paths' or 'images'")
+
+        try:
+            results = batcher.predict(sources)
+        except (FileNotFoundError, UnidentifiedImageError) as exc:
+            raise BadRequest(str(exc)) from exc
+        return jsonify({"predictions": [serialize(*el) for el in results]})
+
+    return app
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="modality inference server")
+    parser.add_argument("classifiers", type=str, help="json file with classifiers to use")
+    parser.add_argument("base_img_dir", type=str, help="folder of the image paths")
+    parser.add_argument("--host", type=str, default="localhost")
+    parser.add_argument("--port", type=int, default=5050)
+    parser.add_argument("--max_batch_size", type=int, default=64, help="images per batch")
+    parser.add_argument("--max_wait_ms", type=float, default=10.0, help="max wait for a batch to fill")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def create_batcher(
+    classifiers_path: str, max_batch_size: int, max_wait_ms: float
+) -> DynamicBatcher:
+    """Batcher over the classifier tree on the available device. Multi-head
+    models do not route by resolution and are not served."""
+    with open(classifiers_path, "r", encoding="utf-8") as reader:
+        classifiers = json.load(reader)
+    if classifiers.get("format") == MULTI_HEAD_FORMAT:
+        raise ValueError(
+            f"{classifiers_path} is a multi-head model, serve a classifier tree"
+        )
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    config = RunConfig(batch_size=max_batch_size, num_workers=0, device=device)
+    predictor = HierarchicalPredictor(classifiers, config)
+    return DynamicBatcher(predictor, max_batch_size, max_wait_ms)
+
+
+def main():
+    """Serve predictions until interrupted"""
+    args = parse_args(argv[1:])
+    batcher = create_batcher(args.classifiers, args.max_batch_size, args.max_wait_ms)
+    app = create_app(batcher, args.base_img_dir)
+    try:
+        app.run(host=args.host, port=args.port, threaded=True)
+    finally:
+        batcher.close()
+
+
+if __name__ == "__main__":
+    main()
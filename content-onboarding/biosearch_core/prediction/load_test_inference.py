@@ -0,0 +1,119 @@
+""" Load test of the inference server: throughput and latency vs batch window.
+For every --max_wait_ms value, the server is started in this process on a free
+port, and --clients threads post one image path per request until --requests
+requests are answered. Reports images/sec, p50/p95 latency and the mean batch
+sent to the classifier tree. A window of 0 predicts the images as they arrive.
+
+  python load_test_inference.py CLASSIFIERS_JSON BASE_IMG_DIR
+    [--windows 0 2 5 10 20] [--clients 32] [--requests 2000]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from concurrent.futures import ThreadPoolExecutor
+from os import listdir
+from threading import Thread
+from typing import Dict, List
+import json
+import socket
+import time
+import urllib.request
+import numpy as np
+from pandas import DataFrame
+from rich.console import Console
+from werkzeug.serving import make_server
+
+from biosearch_core.prediction.inference_server import create_app, create_batcher
+
+console = Console()
+EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="inference server load test")
+    parser.add_argument("classifiers", type=str, help="json file with classifiers to use")
+    parser.add_argument("base_img_dir", type=str, help="folder with the images to post")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10, 20], help="max_wait_ms values")
+    parser.add_argument("--max_batch_size", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--requests", type=int, default=2000, help="requests per window")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+def post_path(url: str, path: str) -> float:
+    """Seconds to get the prediction of an image"""
+    body = json.dumps({"paths": [path]}).encode("utf-8")
+    req = urllib.request.Request(
+        url, data=body, headers={"Content-Type": "application/json"}
+    )
+    start_time = time.time()
+    with urllib.request.urlopen(req) as response:
+        response.read()
+    return time.time() - start_time
+
+
+def run_window(args: Namespace, window: float, paths: List[str]) -> Dict:
+    """Serve with the batch window and send the requests"""
+    batcher = create_batcher(args.classifiers, args.max_batch_size, window)
+    app = create_app(batcher, args.base_img_dir)
+    port = _free_port()
+    server = make_server("localhost", port, app, threaded=True)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://localhost:{port}/predict"
+
+    try:
+        # warm up, the first batch loads the classifiers
+        post_path(url, paths[0])
+        batcher.batch_sizes.clear()
+        requests = [paths[idx % len(paths)] for idx in range(args.requests)]
+        start_time = time.time()
+        with ThreadPoolExecutor(max_workers=args.clients) as executor:
+            latencies = list(executor.map(lambda el: post_path(url, el), requests))
+        elapsed = time.time() - start_time
+    finally:
+        server.shutdown()
+        batcher.close()
+
+    latencies = np.array(latencies) * 1000
+    return {
+        "max_wait_ms": window,
+        "images/sec": len(requests) / elapsed,
+        "p50_ms": np.percentile(latencies, 50),
+        "p95_ms": np.percentile(latencies, 95),
+        "mean_batch": np.mean(batcher.batch_sizes),
+    }
+
+
+def main():
+    """Compare the batch windows"""
+    args = parse_args(argv[1:])
+    paths = sorted(
+        el for el in listdir(args.base_img_dir) if el.lower().endswith(EXTENSIONS)
+    )
+    if len(paths) == 0:
+        raise FileNotFoundError(f"no images in {args.base_img_dir}")
+
+    results = []
+    for window in args.windows:
+        with console.status(f"[bold green] max_wait_ms={window}..."):
+            results.append(run_window(args, window, paths))
+    console.log(
+        f"{args.requests} requests, {args.clients} clients, "
+        f"max batch {args.max_batch_size}"
+    )
+    console.print(DataFrame(results).to_string(index=False, float_format="%.1f"))
+
+
+if __name__ == "__main__":
+    main()
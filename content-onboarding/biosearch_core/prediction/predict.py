@@ -7,6 +7,7 @@ from typing import Dict
 import logging
 import json
 from biosearch_core.data.figure import SubFigureStatus
+from biosearch_core.db_importer.project import Project
 from biosearch_core.prediction.predictor import PredictManager
 from biosearch_core.db.model import params_from_env
 
@@ -44,6 +45,12 @@ def parse_args(args) -> Namespace:
     parser.add_argument(
         "classifiers", type=str, help="json file with classifiers to use"
     )
+    parser.add_argument(
+        "--chunk_size",
+        type=int,
+        default=None,
+        help="subfigures per committed chunk, resumable after a failure",
+    )
     parsed_args = parser.parse_args(args)
 
     return parsed_args
@@ -58,7 +65,14 @@ def main():
     setup_logger(project_dir)
     classifiers = load_classifiers_info(args.classifiers)
     manager = PredictManager(str(project_dir), conn_params, classifiers)
-    manager.predict_and_update_db(status=SubFigureStatus.NOT_PREDICTED)
+    if args.chunk_size is None:
+        manager.predict_and_update_db(status=SubFigureStatus.NOT_PREDICTED)
+        return
+    manager.predict_in_chunks(
+        status=SubFigureStatus.NOT_PREDICTED.value,
+        chunk_size=args.chunk_size,
+        checkpoint_path=Project.predict_checkpoint(project_dir),
+    )
 
 
 if __name__ == "__main__":
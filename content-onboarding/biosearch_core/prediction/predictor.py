@@ -1,20 +1,25 @@
 """ Module responsible for predicting the image modalities for images in db.
 The updates can be performed on non-predicted figures (when importing
 content from the pipeline), or to all the figures on a schema (when classifiers
-are updated).
+are updated). Large schemas are predicted in chunks of subfigures, each one
+committed and checkpointed, so a failure only loses the chunk in progress.
 """
 
+from concurrent.futures import Future, ThreadPoolExecutor
 from os import cpu_count
-from typing import Dict, List, Tuple, Literal, Optional
+from typing import Dict, Iterator, List, Tuple, Literal, Optional
 from pathlib import Path
 import logging
 from pandas import DataFrame
 from torch import cuda
-from psycopg import sql, Cursor, connect  # https://github.com/PyCQA/pylint/issues/5273
+from psycopg import Cursor, connect  # https://github.com/PyCQA/pylint/issues/5273
 
 from image_modalities_classifier.models.predict import ModalityPredictor, RunConfig
 from biosearch_core.data.figure import SubFigureStatus, FigureType
 from biosearch_core.db.model import ConnectionParams
+from biosearch_core.data.document import DocumentModel
+from biosearch_core.db.surrogate_cache import notify_surrogates_changed
+from biosearch_core.prediction.checkpoint import PredictionCheckpoint
 
 
 class PredictManager:
@@ -45,6 +50,10 @@ class PredictManager:
         ] = None,
     ) -> List[Tuple]:
         """Fetch not predicted subfigures from db"""
+        cursor.execute(self._subfigures_query(status))
+        return cursor.fetchall()
+
+    def _subfigures_query(self, status: Optional[int]) -> str:
         valid_status = set(item.value for item in SubFigureStatus)
         if status is not None and status not in valid_status:
             # pylint: disable=C0209:consider-using-f-string
@@ -56,50 +65,46 @@ class PredictManager:
         """
         if status is not None:
             query += f" AND status={status}"
-        cursor.execute(query)
-        return cursor.fetchall()
-
-    def _fetch_ids_with_ground_truth(
-        self, cursor: Cursor, data: DataFrame
-    ) -> List[int]:
-        all_ids = ",".join([str(el) for el in data.id.values.tolist()])
-        query_valid = f"""
-            SELECT id FROM {self.schema}.figures 
-            WHERE id IN ({all_ids}) AND 
-                  status = '{SubFigureStatus.GROUND_TRUTH.value}'
-        """
-        results = cursor.execute(query_valid).fetchall()
-        return [el[0] for el in results]
-
-    def _flatten_and_update(self, cursor: Cursor, data: DataFrame, update_query: str):
-        """Send the update queries as repeated statements because psycopg3 does
-        not have the extra_values functions available in psycopg2."""
-        tuples = data[["prediction", "id"]]
-        tuples = list(tuples.itertuples(index=False, name=None))
-        flattened_values = [item for sublist in tuples for item in sublist]
-
-        all_queries = update_query * len(tuples)
-        query = sql.SQL(all_queries.format(*flattened_values))
-        cursor.execute(query)
+        return query
 
     def _update_db(self, cursor, data: DataFrame) -> None:
-        """Update subfigures during prediction phase. If figures in the data
-        already contain ground truth data, do not update its status.
+        """Update subfigures during prediction phase. The predictions are
+        copied to a temporary table and applied with a single UPDATE joined on
+        the id. If figures already contain ground truth data, only their label
+        is updated and their status is kept.
         """
-        # only update status for figures without ground-truth
-        ids_with_gt = self._fetch_ids_with_ground_truth(cursor, data)
-        df_with_gt = data.loc[data.id.isin(ids_with_gt)]
-        df_without_gt = data.loc[~data.id.isin(ids_with_gt)]
+        cursor.execute(
+            """CREATE TEMP TABLE IF NOT EXISTS staging_predictions
+               (id integer, label text) ON COMMIT DROP"""
+        )
+        with cursor.copy("COPY staging_predictions (id, label) FROM STDIN") as copy:
+            for fig_id, label in zip(data.id.tolist(), data.prediction.tolist()):
+                copy.write_row((int(fig_id), str(label)))
+        cursor.execute("ANALYZE staging_predictions")
+
+        ground_truth = SubFigureStatus.GROUND_TRUTH.value
+        predicted = SubFigureStatus.PREDICTED.value
+        cursor.execute(
+            f"""UPDATE {self.schema}.figures f
+                SET label = s.label,
+                    status = CASE WHEN f.status = {ground_truth} THEN f.status
+                                  ELSE {predicted} END
+                FROM staging_predictions s
+                WHERE f.id = s.id"""
+        )
 
-        if len(df_with_gt) > 0:
-            update_query1 = f"UPDATE {self.schema}.figures SET "
-            update_query1 += "label=('{}') WHERE id=({}); "
-            self._flatten_and_update(cursor, df_with_gt, update_query1)
+        # cached surrogates show the labels, delivered on commit
+        cursor.execute(
+            f"""SELECT DISTINCT f.doc_id FROM {self.schema}.figures f
+                JOIN staging_predictions s ON f.id = s.id
+                WHERE f.doc_id IS NOT NULL"""
+        )
+        doc_ids = [row[0] for row in cursor.fetchall()]
+        if doc_ids:
+            notify_surrogates_changed(cursor, self.schema, doc_ids)
 
-        if len(df_without_gt) > 0:
-            update_query2 = f"UPDATE {self.schema}.figures SET status={SubFigureStatus.PREDICTED.value},"
-            update_query2 += " label=('{}') WHERE id=({}); "
-            self._flatten_and_update(cursor, df_without_gt, update_query2)
+        # the staging table lives until the commit
+        cursor.execute("TRUNCATE staging_predictions")
 
     def predict_and_update_db(
         self,
@@ -128,8 +133,123 @@ class PredictManager:
                     output_df = predictor.predict(rel_img_paths, self.base_img_path)
                     output_df["id"] = [elem[0] for elem in rows]
                     self._update_db(cursor, output_df)
+                    DocumentModel.refresh_surrogate_view(cursor, self.schema)
                     conn.commit()
                 # pylint: disable=bare-except
                 except:
                     logging.error("PREDICTION", exc_info=True)
         return output_df
+
+    def _write_chunk(
+        self,
+        conn,
+        data: DataFrame,
+        checkpoint: Optional[PredictionCheckpoint],
+        predicted: int,
+    ):
+        """Commit the predictions of a chunk and record its last id"""
+        with conn.cursor() as cursor:
+            self._update_db(cursor, data)
+        conn.commit()
+        if checkpoint is not None:
+            checkpoint.record(int(data.id.iloc[-1]), predicted)
+
+    def _refresh_after_chunks(self, conn):
+        """Refresh the surrogate view with the committed chunks"""
+        try:
+            # discard the transaction of a failed chunk
+            conn.rollback()
+            with conn.cursor() as cursor:
+                DocumentModel.refresh_surrogate_view(cursor, self.schema)
+            conn.commit()
+        # pylint: disable=bare-except
+        except:
+            logging.error(
+                "PREDICTION,surrogate view of %s is stale", self.schema, exc_info=True
+            )
+
+    def predict_in_chunks(
+        self,
+        status: Optional[
+            Literal[
+                SubFigureStatus.NOT_PREDICTED,
+                SubFigureStatus.PREDICTED,
+                SubFigureStatus.GROUND_TRUTH,
+            ]
+        ] = None,
+        chunk_size: int = 10000,
+        checkpoint_path: Optional[Path] = None,
+    ) -> int:
+        """Predict the subfigures in id order, paging through a server-side
+        cursor. Every chunk is committed in its own transaction by a writer
+        thread while the next chunk is predicted. With a checkpoint, a new run
+        starts after the last committed id. Returns the predicted subfigures.
+        """
+        checkpoint, last_id = None, 0
+        if checkpoint_path is not None:
+            checkpoint = PredictionCheckpoint(checkpoint_path, self.schema, status)
+            last_id = checkpoint.last_id()
+            if last_id > 0:
+                logging.info("PREDICTION,resuming after id %d", last_id)
+        query = self._subfigures_query(status) + f" AND id > {last_id} ORDER BY id"
+
+        predicted, failed = 0, False
+        conninfo = self.params.conninfo()
+        # pylint: disable=not-context-manager
+        with connect(conninfo=conninfo, autocommit=False) as read_conn:
+            with connect(conninfo=conninfo, autocommit=False) as write_conn:
+                try:
+                    for predicted in self._stream_chunks(
+                        read_conn, write_conn, query, chunk_size, checkpoint
+                    ):
+                        logging.info("PREDICTION,%d subfigures", predicted)
+                # pylint: disable=bare-except
+                except:
+                    logging.error("PREDICTION", exc_info=True)
+                    failed = True
+                finally:
+                    # the chunks committed before a failure (including the one
+                    # in flight) reach the view too
+                    if predicted > 0 or failed:
+                        self._refresh_after_chunks(write_conn)
+        if checkpoint is not None and not failed:
+            checkpoint.clear()
+        return predicted
+
+    # pylint: disable=too-many-arguments
+    def _stream_chunks(
+        self,
+        read_conn,
+        write_conn,
+        query: str,
+        chunk_size: int,
+        checkpoint: Optional[PredictionCheckpoint],
+    ) -> Iterator[int]:
+        """Yield the number of subfigures committed after every chunk. Chunk k
+        is written while chunk k+1 is predicted, one write in flight."""
+        predictor = ModalityPredictor(self.classifiers, self.run_config)
+        submitted = 0
+        pending: Optional[Future] = None
+        with ThreadPoolExecutor(max_workers=1) as writer:
+            with read_conn.cursor(name="subfigures_to_predict") as cursor:
+                cursor.itersize = chunk_size
+                cursor.execute(query)
+                while True:
+                    # tuples id, img_path
+                    rows = cursor.fetchmany(chunk_size)
+                    if len(rows) == 0:
+                        break
+                    rel_img_paths = [elem[1] for elem in rows]
+                    output_df = predictor.predict(rel_img_paths, self.base_img_path)
+                    output_df["id"] = [elem[0] for elem in rows]
+
+                    if pending is not None:
+                        pending.result()
+                        yield submitted
+                    submitted += len(rows)
+                    pending = writer.submit(
+                        self._write_chunk, write_conn, output_df, checkpoint, submitted
+                    )
+            if pending is not None:
+                pending.result()
+                yield submitted
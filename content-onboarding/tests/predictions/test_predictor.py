@@ -114,20 +114,26 @@ def test_invalid_status(database, fake_conn_params):
             mgt.fetch_subfigures_from_db(cursor, status=error_status)
 
 
-def test_fetch_gt_figures_from_dataframe(database, fake_conn_params):
-    """Test that we are parsing correctly the values from the dataframe"""
-    to_update = [{"id": 1, "prediction": "bul.2"}, {"id": 2, "prediction": "ter.2"}]
+def test_update_labels_with_quotes(database, fake_conn_params):
+    """Test that labels are written as values and not formatted into the
+    query, and that figures with ground truth keep their status"""
+    to_update = [{"id": 1, "prediction": "bul'2"}, {"id": 2, "prediction": "ter);"}]
     df_update = pd.DataFrame.from_dict(to_update)
 
-    fake_conn_params["schema"] = "dogs"
+    schema = "dogs"
+    fake_conn_params["schema"] = schema
     c_params = ConnectionParams(**fake_conn_params)
     mgt = PredictManager(project_dir="dogs", conn_params=c_params, classifiers={})
     with database.cursor() as cursor:
         # pylint: disable=W0212:protected-access
-        results = mgt._fetch_ids_with_ground_truth(cursor, df_update)
-        assert len(results) == 2
-        assert 1 in results
-        assert 2 in results
+        mgt._update_db(cursor, df_update)
+        query = f"SELECT id, label, status FROM {schema}.figures WHERE id IN (1, 2)"
+        d_results = {el[0]: el for el in cursor.execute(query).fetchall()}
+
+        assert d_results[1][1] == "bul'2"
+        assert d_results[2][1] == "ter);"
+        assert d_results[1][2] == SubFigureStatus.GROUND_TRUTH.value
+        assert d_results[2][2] == SubFigureStatus.GROUND_TRUTH.value
 
 
 def test_update_schema_unlabeled_samples(database: Connection, fake_conn_params):
@@ -1,8 +1,13 @@
 """ Test helpers reading bounding box data created from FigSplit"""
 
 from pathlib import Path
+from numpy import isnan
 from pytest import approx
-from biosearch_core.bbox_reader import BoundingBoxMapper
+from biosearch_core.db_importer.bbox_reader import (
+    BoundingBoxMapper,
+    parse_csv,
+    parse_txt,
+)
 
 
 def test_load():
@@ -55,3 +60,39 @@ def test_load():
     assert reader.mapping[img_paths[22]] == approx([510.0, 53.5, 251.5, 284.5])
 
     assert reader.mapping[img_paths[22]] != approx([520.0, 53.5, 251.5, 284.5])
+
+
+def test_load_continues_past_missing_files():
+    """Figures without bounding boxes are reported and the rest still loaded"""
+    base_path = Path("./tests/sample_data").resolve()
+    reader = BoundingBoxMapper(base_path=base_path)
+    reader.load_figures(
+        [
+            "doc_from_cord_1/pdfname/3_1",
+            "doc_from_cord_1/pdfname/missing",
+            "doc_from_cord_1/pdfname/6_1",
+        ]
+    )
+
+    assert reader.errors == ["doc_from_cord_1/pdfname/missing"]
+    assert reader.boxes.shape == (12, 4)
+    assert reader.lookup("doc_from_cord_1/pdfname/6_1/004.jpg") == approx(
+        [16.7, 1493.0, 1552.9, 353.6]
+    )
+    # subfigure names with the figure prefix use the same index
+    assert reader.lookup("doc_from_cord_1/pdfname/6_1/6_1_001.jpg") == approx(
+        [0.6, 930.5, 1569.1, 559.6]
+    )
+    assert reader.lookup("doc_from_cord_1/pdfname/6_1/005.jpg") is None
+    assert reader.lookup("doc_from_cord_1/pdfname/missing/001.jpg") is None
+
+
+def test_parse_lines_without_boxes():
+    """Lines without four values do not shift the following subfigures"""
+    boxes = parse_txt("1.0 2.0 3.0 4.0\n\n5.0 6.0 7.0 8.0")
+    assert boxes.shape == (3, 4)
+    assert isnan(boxes[1]).all()
+    assert boxes[2] == approx([5.0, 6.0, 7.0, 8.0])
+
+    boxes = parse_csv("1,2,3,4\n5,6,7,8\n")
+    assert boxes[1] == approx([5.0, 6.0, 7.0, 8.0])
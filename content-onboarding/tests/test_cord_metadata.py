@@ -0,0 +1,68 @@
+""" Tests for the indexed copy of the CORD19 metadata.csv
+run: poetry run pytest tests/test_cord_metadata.py
+"""
+
+import json
+import tempfile
+from os import makedirs, utime
+from pathlib import Path
+from shutil import copy
+
+from biosearch_core.db_importer.cord_metadata import CordMetadata
+from biosearch_core.db_importer.loaders import Cord19Loader
+from biosearch_core.indexing.CordReader import CordReader
+
+SAMPLE_CSV = Path("./tests/sample_data/fake_cord19_metadata.csv")
+
+
+def test_rows_only_for_requested_pmcids():
+    """The copy is built on first use and only matching rows are returned"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / "metadata.csv"
+        copy(SAMPLE_CSV, csv_path)
+        metadata = CordMetadata(csv_path)
+        assert metadata.is_stale()
+
+        rows = list(metadata.rows(["PMC2", "PMC999"]))
+        assert [row["pmcid"] for row in rows] == ["PMC2"]
+        assert rows[0]["cord_uid"] != ""
+        assert not metadata.is_stale()
+        metadata.close()
+
+        # touching the csv invalidates the copy
+        db_mtime = metadata.db_path.stat().st_mtime
+        utime(csv_path, (db_mtime + 10, db_mtime + 10))
+        assert metadata.is_stale()
+
+
+def test_cord19_loader_reads_indexed_rows():
+    """Documents are only created for the folders to import"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / "metadata.csv"
+        copy(SAMPLE_CSV, csv_path)
+        folder = Path(tmp_dir) / "to_import" / "PMC1"
+        makedirs(folder)
+        (folder / "document.pdf").touch()
+
+        documents = Cord19Loader().load(str(csv_path), [str(folder)])
+        assert [doc.pmcid for doc in documents] == ["PMC1"]
+        assert documents[0].uri == "PMC1/document.pdf"
+
+
+def test_cord_reader_full_text():
+    """Full text is read from the first pdf_json_files pointer"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = Path(tmp_dir) / "metadata.csv"
+        with open(csv_path, "w", encoding="utf-8") as writer:
+            writer.write("cord_uid,pmcid,pdf_json_files\n")
+            writer.write("a,PMC1,document_parses/a.json; document_parses/b.json\n")
+            writer.write("b,PMC2,\n")
+        parses_dir = Path(tmp_dir) / "document_parses"
+        makedirs(parses_dir)
+        with open(parses_dir / "a.json", "w", encoding="utf-8") as writer:
+            json.dump({"body_text": [{"text": "hello"}, {"text": "world"}]}, writer)
+
+        reader = CordReader(tmp_dir)
+        assert reader.fetch_full_text("PMC1") == "hello world"
+        assert reader.fetch_full_text("PMC2") == ""
+        assert reader.fetch_full_text("PMC3") == ""
@@ -0,0 +1,24 @@
+""" Tests for the shared connection pools"""
+
+from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db.pool import get_pool, close_pools
+
+
+def test_pool_is_shared_across_schemas():
+    """Params that only differ in the schema use the same connections"""
+    params_a = ConnectionParams("localhost", 5432, "db", "user", "pass", "cord19")
+    params_b = ConnectionParams("localhost", 5432, "db", "user", "pass", "gxd")
+    try:
+        assert get_pool(params_a) is get_pool(params_b)
+    finally:
+        close_pools()
+
+
+def test_pool_per_database():
+    """Different databases get different pools"""
+    params_a = ConnectionParams("localhost", 5432, "db1", "user", "pass", "cord19")
+    params_b = ConnectionParams("localhost", 5432, "db2", "user", "pass", "cord19")
+    try:
+        assert get_pool(params_a) is not get_pool(params_b)
+    finally:
+        close_pools()
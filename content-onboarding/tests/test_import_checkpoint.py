@@ -0,0 +1,52 @@
+""" Tests for resuming chunked imports
+run: poetry run pytest tests/test_import_checkpoint.py
+"""
+
+import tempfile
+from os import makedirs
+from pathlib import Path
+
+from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db_importer.checkpoint import ImportCheckpoint
+from biosearch_core.db_importer.importer import ImportManager
+from biosearch_core.db_importer.project import Project
+
+FAKE_CONN = ConnectionParams(None, 1, None, None, None, "schema")
+
+
+def test_checkpoint_accumulates_batches():
+    """Folders from every recorded batch are completed, partial lines ignored"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint = ImportCheckpoint(Path(tmp_dir) / "checkpoint.jsonl")
+        assert checkpoint.completed_folders() == set()
+
+        checkpoint.record(0, ["/data/to_import/PMC1", "/data/to_import/PMC2"])
+        checkpoint.record(1, ["/data/to_import/PMC3"], documents=1)
+        with open(checkpoint.path, "a", encoding="utf-8") as writer:
+            writer.write('{"batch": 2, "fold')
+        assert checkpoint.completed_folders() == {"PMC1", "PMC2", "PMC3"}
+
+        checkpoint.clear()
+        assert not checkpoint.path.exists()
+
+
+def test_resume_moves_and_skips_committed_folders():
+    """Committed folders left in to_import are moved without validation"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        project_dir = Path(tmp_dir) / "cord19"
+        import_dir = Project.import_dir(project_dir)
+        makedirs(Project.predict_dir(project_dir))
+        for name in ["PMC1", "PMC2", "PMC3"]:
+            makedirs(import_dir / name)
+
+        checkpoint = ImportCheckpoint(Project.import_checkpoint(project_dir))
+        checkpoint.record(0, [str(import_dir / "PMC1")])
+
+        manager = ImportManager(tmp_dir, "cord19", FAKE_CONN)
+        paths = sorted(str(el) for el in import_dir.iterdir())
+        # pylint: disable=W0212:protected-access
+        remaining = manager._skip_completed(paths, checkpoint)
+
+        assert [Path(el).name for el in remaining] == ["PMC2", "PMC3"]
+        assert (Project.predict_dir(project_dir) / "PMC1").exists()
+        assert not (import_dir / "PMC1").exists()
@@ -0,0 +1,99 @@
+""" Tests for incremental imports based on the content manifest
+run: poetry run pytest tests/test_import_manifest.py
+"""
+
+import json
+import tempfile
+from os import makedirs
+from pathlib import Path
+from shutil import copytree
+
+from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db_importer.importer import ImportManager
+from biosearch_core.db_importer.manifest import ImportManifest, folder_hash
+from biosearch_core.db_importer.project import Project
+
+FAKE_CONN = ConnectionParams(None, 1, None, None, None, "schema")
+
+
+def _create_folder(folder: Path):
+    makedirs(folder / "1_1")
+    with open(folder / f"{folder.name}.json", "w", encoding="utf-8") as writer:
+        json.dump([{"name": "1_1", "caption": "a caption"}], writer)
+    with open(folder / f"{folder.name}.pdf", "wb") as writer:
+        writer.write(b"%PDF")
+    with open(folder / "1_1" / "1_1.jpg.txt", "w", encoding="utf-8") as writer:
+        writer.write("   1.0000    2.0000    3.0000    4.0000")
+    for name in ["1_1.jpg", "1_1/001.jpg"]:
+        with open(folder / name, "wb") as writer:
+            writer.write(b"jpg")
+
+
+def test_folder_hash_tracks_metadata_figures_and_bboxes():
+    """The hash changes with the imported content but not with image bytes"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        folder = Path(tmp_dir) / "PMC1"
+        _create_folder(folder)
+        original = folder_hash(str(folder))
+
+        with open(folder / "1_1" / "001.jpg", "wb") as writer:
+            writer.write(b"recompressed jpg")
+        assert folder_hash(str(folder)) == original
+
+        with open(folder / "1_1" / "002.jpg", "wb") as writer:
+            writer.write(b"jpg")
+        with_subfigure = folder_hash(str(folder))
+        assert with_subfigure != original
+
+        with open(folder / "1_1" / "1_1.jpg.txt", "w", encoding="utf-8") as writer:
+            writer.write("   1.0000    2.0000    3.0000    5.0000")
+        assert folder_hash(str(folder)) not in {original, with_subfigure}
+
+
+def test_manifest_persists_committed_folders_only():
+    """Staged hashes are saved for the committed folders"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "manifest.json"
+        manifest = ImportManifest(path)
+        manifest.stage("PMC1", "a")
+        manifest.stage("PMC2", "b")
+        manifest.commit(["/data/to_import/PMC1"])
+
+        reloaded = ImportManifest(path)
+        assert reloaded.get("PMC1") == "a"
+        assert "PMC2" not in reloaded
+
+
+def test_changed_folders_skips_unchanged_content():
+    """New and changed folders are imported, unchanged folders are skipped
+    including the ones imported before the manifest existed"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        project_dir = Path(tmp_dir) / "cord19"
+        import_dir = Project.import_dir(project_dir)
+        predict_dir = Project.predict_dir(project_dir)
+        for name in ["PMC1", "PMC2", "PMC3", "PMC4"]:
+            _create_folder(import_dir / name)
+        # PMC3 was imported before the manifest, with the same content
+        copytree(import_dir / "PMC3", predict_dir / "PMC3")
+        # PMC4 was imported before the manifest, with a different caption
+        copytree(import_dir / "PMC4", predict_dir / "PMC4")
+        with open(import_dir / "PMC4" / "PMC4.json", "w", encoding="utf-8") as writer:
+            json.dump([{"name": "1_1", "caption": "new caption"}], writer)
+
+        manifest = ImportManifest(Project.import_manifest(project_dir))
+        manifest.stage("PMC1", folder_hash(str(import_dir / "PMC1")))
+        manifest.stage("PMC2", "previous content")
+        manifest.commit(["PMC1", "PMC2"])
+
+        manager = ImportManager(tmp_dir, "cord19", FAKE_CONN, workers=2)
+        paths = sorted(str(el) for el in import_dir.iterdir())
+        # pylint: disable=W0212:protected-access
+        changed = manager._changed_folders(paths, manifest)
+
+        assert [Path(el).name for el in changed] == ["PMC2", "PMC4"]
+        assert ImportManifest(manifest.path).get("PMC3") == folder_hash(
+            str(predict_dir / "PMC3")
+        )
+        # the new hashes are persisted once their batch commits
+        manifest.commit(changed)
+        assert manifest.get("PMC2") == folder_hash(str(import_dir / "PMC2"))
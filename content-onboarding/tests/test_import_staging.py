@@ -0,0 +1,241 @@
+""" Tests for inserting documents and figures through the staging tables
+run: poetry run pytest tests/test_import_staging.py
+"""
+
+import tempfile
+from datetime import datetime
+from pytest_postgresql import factories
+
+from biosearch_core.data.document import DbDocument
+from biosearch_core.data.figure import (
+    DBFigure,
+    FigureStatus,
+    FigureType,
+    SubFigureStatus,
+)
+from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db_importer.importer import ImportManager
+from biosearch_core.db_importer.tables import (
+    create_documents_table,
+    create_figures_table,
+)
+
+postgresql_my_proc = factories.postgresql_proc(host="localhost")
+postgresql_my = factories.postgresql("postgresql_my_proc")
+
+SCHEMA = "staging"
+
+
+def fake_figure(uri: str, doc_id: int) -> DBFigure:
+    """Figure with the required fields"""
+    return DBFigure(
+        status=FigureStatus.IMPORTED.value,
+        uri=uri,
+        width=10,
+        height=10,
+        type=FigureType.FIGURE.value,
+        source="cord19",
+        name=uri,
+        caption=None,
+        num_panes=0,
+        doc_id=doc_id,
+        parent_id=None,
+        coordinates=[0, 0, 10, 10],
+        page=1,
+    )
+
+
+def test_inserts_return_ids_of_the_batch_only(postgresql):
+    """Rows already in the tables are not part of the mappings"""
+    owner = postgresql.info.user
+    conn_params = ConnectionParams(None, 1, None, owner, None, SCHEMA)
+    with postgresql.cursor() as cursor, tempfile.TemporaryDirectory() as tmp_dir:
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(create_documents_table(SCHEMA, owner))
+        cursor.execute(create_figures_table(SCHEMA, owner))
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.documents
+                  (title, project, import_date, pmcid, status)
+                VALUES ('old', 'cord19', now(), 'PMC0', 'IMPORTED')"""
+        )
+
+        manager = ImportManager(tmp_dir, "cord19", conn_params)
+        documents = [
+            DbDocument(
+                title=f"doc {idx}",
+                project="cord19",
+                status="IMPORTED",
+                import_date=datetime.now(),
+                authors=["a", "b"],
+                pmcid=f"PMC{idx}",
+            )
+            for idx in range(1, 3)
+        ]
+        # pylint: disable=W0212:protected-access
+        pmc_to_id = manager._insert_documents_to_db(cursor, documents, "pmcid")
+        assert set(pmc_to_id.keys()) == {"PMC1", "PMC2"}
+
+        doc_id = pmc_to_id["PMC1"]
+        figures = [fake_figure(f"PMC1/fig{idx}.jpg", doc_id) for idx in range(3)]
+        uri_to_id = manager._insert_figures_to_db(cursor, figures)
+        # the staging table is emptied and can be reused in the transaction
+        subfigures = [fake_figure("PMC1/fig0/001.jpg", doc_id)]
+        subfig_to_id = manager._insert_figures_to_db(cursor, subfigures)
+
+        assert len(uri_to_id) == 3
+        assert list(subfig_to_id.keys()) == ["PMC1/fig0/001.jpg"]
+        count = cursor.execute(f"SELECT COUNT(*) FROM {SCHEMA}.figures").fetchone()
+        assert count[0] == 4
+        authors = cursor.execute(
+            f"SELECT authors FROM {SCHEMA}.documents WHERE pmcid='PMC1'"
+        ).fetchone()
+        assert authors[0] == ["a", "b"]
+
+
+def test_update_keeps_ids_and_labels(postgresql):
+    """Figures of a re-imported document are updated in place, new figures
+    are inserted and the figures removed from the folder are deleted"""
+    owner = postgresql.info.user
+    conn_params = ConnectionParams(None, 1, None, owner, None, SCHEMA)
+    with postgresql.cursor() as cursor, tempfile.TemporaryDirectory() as tmp_dir:
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(create_documents_table(SCHEMA, owner))
+        cursor.execute(create_figures_table(SCHEMA, owner))
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.documents
+                  (title, project, import_date, pmcid, status)
+                VALUES ('doc', 'cord19', now(), 'PMC1', 'IMPORTED')"""
+        )
+        manager = ImportManager(tmp_dir, "cord19", conn_params)
+        figures = [fake_figure(f"PMC1/fig{idx}.jpg", 1) for idx in range(2)]
+        # pylint: disable=W0212:protected-access
+        uri_to_id = manager._insert_figures_to_db(cursor, figures)
+        subfigures = [
+            fake_figure(f"PMC1/fig0/00{idx}.jpg", 1) for idx in range(1, 3)
+        ]
+        for subfigure in subfigures:
+            subfigure.type = FigureType.SUBFIGURE.value
+            subfigure.parent_id = uri_to_id["PMC1/fig0.jpg"]
+        subfig_to_id = manager._insert_figures_to_db(cursor, subfigures)
+        cursor.execute(
+            f"""UPDATE {SCHEMA}.figures SET label = 'exp.gel', ground_truth = 'exp'
+                WHERE id = %s""",
+            (subfig_to_id["PMC1/fig0/001.jpg"],),
+        )
+
+        # fig1 is gone, fig2 is new and subfigure 002 is gone
+        figures = [fake_figure(f"PMC1/fig{idx}.jpg", 1) for idx in [0, 2]]
+        figures[0].caption = "new caption"
+        updated = manager._update_figures_in_db(
+            cursor, figures, FigureType.FIGURE.value, [1]
+        )
+        assert updated["PMC1/fig0.jpg"] == uri_to_id["PMC1/fig0.jpg"]
+        assert "PMC1/fig2.jpg" in updated
+        subfigures = subfigures[:1]
+        updated = manager._update_figures_in_db(
+            cursor, subfigures, FigureType.SUBFIGURE.value, [1]
+        )
+        assert updated == {"PMC1/fig0/001.jpg": subfig_to_id["PMC1/fig0/001.jpg"]}
+
+        rows = cursor.execute(
+            f"SELECT uri, caption, label, ground_truth FROM {SCHEMA}.figures"
+        ).fetchall()
+        assert sorted(rows) == [
+            ("PMC1/fig0.jpg", "new caption", None, None),
+            ("PMC1/fig0/001.jpg", None, "exp.gel", "exp"),
+            ("PMC1/fig2.jpg", None, None, None),
+        ]
+
+
+def test_replace_documents_of_the_project_only(postgresql):
+    """Documents of other projects with the same pmcid are not matched, and
+    the curated status and notes are kept"""
+    owner = postgresql.info.user
+    conn_params = ConnectionParams(None, 1, None, owner, None, SCHEMA)
+    with postgresql.cursor() as cursor, tempfile.TemporaryDirectory() as tmp_dir:
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(create_documents_table(SCHEMA, owner))
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.documents
+                  (title, project, import_date, pmcid, status, notes)
+                VALUES ('gxd doc', 'gxd', now(), 'PMC1', 'IMPORTED', NULL),
+                       ('old', 'cord19', now(), 'PMC1', 'CURATED', 'checked')"""
+        )
+        manager = ImportManager(tmp_dir, "cord19", conn_params)
+        document = DbDocument(
+            title="new",
+            project="cord19",
+            status="IMPORTED",
+            import_date=datetime.now(),
+            authors=["a"],
+            pmcid="PMC1",
+        )
+        # pylint: disable=W0212:protected-access
+        pmc_to_id = manager._replace_documents_in_db(cursor, [document], "pmcid")
+        assert pmc_to_id == {"PMC1": 2}
+
+        rows = cursor.execute(
+            f"SELECT project, title, status, notes FROM {SCHEMA}.documents"
+        ).fetchall()
+        assert sorted(rows) == [
+            ("cord19", "new", "CURATED", "checked"),
+            ("gxd", "gxd doc", "IMPORTED", None),
+        ]
+
+
+def test_resegmented_subfigures_are_predicted_again(postgresql):
+    """Subfigures whose crop changed lose their predicted label, ground truth
+    and unchanged crops are kept"""
+    owner = postgresql.info.user
+    conn_params = ConnectionParams(None, 1, None, owner, None, SCHEMA)
+    with postgresql.cursor() as cursor, tempfile.TemporaryDirectory() as tmp_dir:
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(create_documents_table(SCHEMA, owner))
+        cursor.execute(create_figures_table(SCHEMA, owner))
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.documents
+                  (title, project, import_date, pmcid, status)
+                VALUES ('doc', 'cord19', now(), 'PMC1', 'IMPORTED')"""
+        )
+        manager = ImportManager(tmp_dir, "cord19", conn_params)
+        # pylint: disable=W0212:protected-access
+        uri_to_id = manager._insert_figures_to_db(
+            cursor, [fake_figure("PMC1/fig0.jpg", 1)]
+        )
+
+        def subfigures(coordinates):
+            rows = []
+            for idx, coords in enumerate(coordinates, start=1):
+                subfigure = fake_figure(f"PMC1/fig0/00{idx}.jpg", 1)
+                subfigure.type = FigureType.SUBFIGURE.value
+                subfigure.parent_id = uri_to_id["PMC1/fig0.jpg"]
+                subfigure.coordinates = coords
+                rows.append(subfigure)
+            return rows
+
+        original = [[0, 0, 5, 5], [5, 0, 5, 5], [0, 5, 5, 5]]
+        manager._insert_figures_to_db(cursor, subfigures(original))
+        predicted = SubFigureStatus.PREDICTED.value
+        ground_truth = SubFigureStatus.GROUND_TRUTH.value
+        cursor.execute(
+            f"""UPDATE {SCHEMA}.figures SET label = 'exp.gel',
+                  status = CASE WHEN uri LIKE '%%003.jpg' THEN %s ELSE %s END
+                WHERE fig_type = %s""",
+            (ground_truth, predicted, FigureType.SUBFIGURE.value),
+        )
+
+        # re-segmentation moved the crops of 001 and 003
+        resegmented = [[0, 0, 10, 4], [5, 0, 5, 5], [0, 4, 10, 6]]
+        manager._update_figures_in_db(
+            cursor, subfigures(resegmented), FigureType.SUBFIGURE.value, [1]
+        )
+        rows = cursor.execute(
+            f"""SELECT name, status, label FROM {SCHEMA}.figures
+                WHERE fig_type = %s ORDER BY name""",
+            (FigureType.SUBFIGURE.value,),
+        ).fetchall()
+        assert rows == [
+            ("PMC1/fig0/001.jpg", SubFigureStatus.NOT_PREDICTED.value, None),
+            ("PMC1/fig0/002.jpg", predicted, "exp.gel"),
+            ("PMC1/fig0/003.jpg", ground_truth, "exp.gel"),
+        ]
@@ -0,0 +1,110 @@
+""" Tests for the validation of the folders to import
+run: poetry run pytest tests/test_import_validation.py
+"""
+
+import json
+import tempfile
+from os import makedirs
+from pathlib import Path
+
+from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db_importer.importer import ImportManager, Validator
+
+FAKE_CONN = ConnectionParams(None, 1, None, None, None, "schema")
+
+
+def create_folder(import_dir: Path, name: str, pdf=True, metadata=True, segmented=2):
+    """PMC folder with two figures, of which only `segmented` have subfigures"""
+    folder = import_dir / name
+    makedirs(folder)
+    if pdf:
+        (folder / "document.pdf").touch()
+    if not metadata:
+        return folder
+
+    figures = [
+        {"id": f"fig{idx}.jpg", "name": f"{idx}", "caption": "", "bbox": [0, 0, 9, 9]}
+        for idx in range(2)
+    ]
+    with open(folder / f"{name}.json", "w", encoding="utf-8") as writer:
+        json.dump({"pages": [{"number": 1, "figures": figures}]}, writer)
+    for idx in range(2):
+        (folder / f"fig{idx}.jpg").touch()
+        if idx < segmented:
+            makedirs(folder / f"fig{idx}")
+            bbox_file = folder / f"fig{idx}" / f"fig{idx}.jpg.txt"
+            with open(bbox_file, "w", encoding="utf-8") as writer:
+                writer.write("0.5 1.5 2.5 3.5\n4.5 5.5 6.5 7.5\n")
+            (folder / f"fig{idx}" / "001.jpg").touch()
+            (folder / f"fig{idx}" / "002.jpg").touch()
+    return folder
+
+
+def create_project(tmp_dir: str) -> ImportManager:
+    """Project with one folder per violation reason plus two valid folders"""
+    import_dir = Path(tmp_dir) / "cord19" / "to_import"
+    create_folder(import_dir, "PMC1")
+    create_folder(import_dir, "PMC2")
+    create_folder(import_dir, "PMC3", pdf=False)
+    create_folder(import_dir, "PMC4", metadata=False)
+    create_folder(import_dir, "PMC5", segmented=1)
+    multiple = create_folder(import_dir, "PMC6")
+    (multiple / "other.pdf").touch()
+    return import_dir
+
+
+def test_validator_reports_first_violation():
+    """Each folder is classified by the first requirement not met"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        import_dir = create_project(tmp_dir)
+        validator = Validator()
+        assert validator.folder_violation(str(import_dir / "PMC1")) is None
+        assert validator.folder_violation(str(import_dir / "PMC3")) == "missing_pdf"
+        assert validator.folder_violation(str(import_dir / "PMC4")) == "to_extract"
+        assert validator.folder_violation(str(import_dir / "PMC5")) == "to_segment"
+        assert validator.folder_violation(str(import_dir / "PMC6")) == "multiple_pdfs"
+        # folder_violation does not store the results
+        assert all(len(el) == 0 for el in validator.violation_reasons_.values())
+
+
+def test_parallel_validation_merges_reasons():
+    """Thread, process and serial validation return the same results"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        import_dir = create_project(tmp_dir)
+        folders = sorted(str(el) for el in import_dir.iterdir())
+
+        results = []
+        for workers, use_processes in [(1, False), (4, False), (2, True)]:
+            manager = ImportManager(
+                tmp_dir, "cord19", FAKE_CONN, workers, use_processes
+            )
+            skipping = manager.validate_pdf_folders(folders)
+            results.append((skipping, manager.validator.violation_reasons_))
+
+        skipping, reasons = results[0]
+        assert [Path(el).name for el in skipping] == ["PMC3", "PMC4", "PMC5", "PMC6"]
+        assert [Path(el).name for el in reasons["to_segment"]] == ["PMC5"]
+        assert all(result == results[0] for result in results)
+
+
+def test_parallel_subfigure_discovery():
+    """Threads stream the same figures and subfigures as the serial scan"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        import_dir = create_project(tmp_dir)
+        folders = [str(import_dir / "PMC1"), str(import_dir / "PMC2")]
+        pmc_to_id = {"PMC1": 1, "PMC2": 2}
+
+        results = []
+        for workers in [1, 4]:
+            manager = ImportManager(tmp_dir, "cord19", FAKE_CONN, workers)
+            figures = manager.fetch_figures(folders, pmc_to_id)
+            url_to_id = {el.uri: idx for idx, el in enumerate(figures)}
+            subfigures = manager.fetch_subfigures(figures, url_to_id)
+            results.append((figures, subfigures))
+
+        figures, subfigures = results[0]
+        assert len(figures) == 4
+        assert len(subfigures) == 8
+        assert all(el.num_panes == 2 for el in figures)
+        assert sorted(el.coordinates for el in subfigures)[0] == [0.5, 1.5, 2.5, 3.5]
+        assert [el.uri for el in results[1][1]] == [el.uri for el in subfigures]
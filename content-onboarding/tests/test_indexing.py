@@ -1,7 +1,14 @@
 """ Test cases for the module responsible for transforming the data from 
 the database to a parquet file"""
 
-from biosearch_core.indexing.exporter import IndexManager
+import tempfile
+from datetime import date
+from pathlib import Path
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pandas import read_parquet
+from biosearch_core.indexing.exporter import IndexManager, expand_modality_parents
+from biosearch_core.indexing.lucene import LuceneCaption, LuceneDocument
 from biosearch_core.db.model import ConnectionParams
 
 def test_indexer_identifies_all_nodes_in_modalities():
@@ -31,3 +38,99 @@ def test_indexer_returns_non_for_missing_modalities():
     assert output is None
     output = index_mgr._add_modality_parents(None)
     assert output is None
+
+
+def test_expand_modality_parents_per_document():
+    """Parents are added once per document and empty documents stay null"""
+    labels = [["mic.ele.sca", "mic.flu", None], None, [], ["oth", "oth"]]
+    output = expand_modality_parents(labels).to_pylist()
+
+    assert output[0] == ["mic", "mic.ele", "mic.ele.sca", "mic.flu"]
+    assert output[1] is None
+    assert output[2] is None
+    assert output[3] == ["oth"]
+
+
+def test_expand_modalities_by_batch():
+    """The labels column is replaced with the expanded modalities"""
+    fake_conn = ConnectionParams(None, 1, None, None, None, "schema")
+    index_mgr = IndexManager(None, fake_conn)
+    documents = [(idx,) + (None,) * 9 + (["gra.his"], "other") for idx in range(5)]
+    # pylint: disable=W0212:protected-access
+    output = list(index_mgr._expand_modalities(documents, batch_size=2))
+
+    assert [el[0] for el in output] == list(range(5))
+    assert all(el[10] == ["gra", "gra.his"] for el in output)
+    assert output[0][11] == "other"
+
+
+def test_merge_captions_streams_by_document():
+    """Captions are matched to their documents and orphan captions skipped"""
+    fake_conn = ConnectionParams(None, 1, None, None, None, "schema")
+    index_mgr = IndexManager(None, fake_conn)
+    documents = [(2,), (3,), (5,)]
+    captions = [(1, 10, "orphan"), (2, 20, "a"), (2, 21, "b"), (5, 50, "c")]
+    # pylint: disable=W0212:protected-access
+    merged = list(index_mgr._merge_captions(documents, captions))
+
+    assert [doc[0] for doc, _ in merged] == [2, 3, 5]
+    assert [el.figure_id for el in merged[0][1]] == [20, 21]
+    assert merged[1][1] == []
+    assert merged[2][1][0].text == "c"
+
+
+def test_write_parquet_in_row_groups():
+    """Documents are written incrementally and readable with pandas"""
+    fake_conn = ConnectionParams(None, 1, None, None, None, "schema")
+    index_mgr = IndexManager(None, fake_conn)
+    documents = [
+        LuceneDocument(
+            doc_id=idx,
+            source="cord19",
+            title=f"title {idx}",
+            abstract="abstract",
+            pub_date=date(2020, 1, 1),
+            journal="journal",
+            authors="a;b",
+            pmcid=f"PMC{idx}",
+            num_figures=1,
+            modalities=["mic", "mic.ele"] if idx % 2 == 0 else None,
+            url="doi",
+            captions=[LuceneCaption(figure_id=idx, text="caption")],
+            otherid=None,
+        )
+        for idx in range(5)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = str(Path(tmp_dir) / "export.parquet")
+        total = index_mgr.write_parquet(documents, output_file, batch_size=2)
+        assert total == 5
+        assert pq.ParquetFile(output_file).num_row_groups == 3
+
+        data = read_parquet(output_file)
+        assert data.shape[0] == 5
+        assert data.iloc[0].captions[0]["text"] == "caption"
+        assert list(data.iloc[0].modalities) == ["mic", "mic.ele"]
+        assert data.iloc[0].pub_date == date(2020, 1, 1)
+        assert data.iloc[1].modalities is None
+
+        schema = pq.read_schema(output_file)
+        assert schema.field("pub_date").type == pa.date32()
+        assert schema.field("modalities").type == pa.list_(pa.string())
+
+
+def test_tee_parquet_yields_rows_while_writing():
+    """The side output keeps every streamed document"""
+    fake_conn = ConnectionParams(None, 1, None, None, None, "schema")
+    index_mgr = IndexManager(None, fake_conn)
+    documents = [
+        # fmt: off
+        LuceneDocument(idx, "cord19", "t", "a", None, "j", "", "PMC", 0, None, "u", [], None)
+        # fmt: on
+        for idx in range(3)
+    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output_file = str(Path(tmp_dir) / "export.parquet")
+        rows = list(index_mgr.tee_parquet(documents, output_file, batch_size=2))
+        assert [row["doc_id"] for row in rows] == [0, 1, 2]
+        assert read_parquet(output_file).doc_id.tolist() == [0, 1, 2]
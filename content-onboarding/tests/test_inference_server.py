@@ -0,0 +1,91 @@
+""" Tests for the dynamic batching inference server
+run: poetry run pytest tests/test_inference_server.py
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import json
+import tempfile
+import numpy as np
+import pytest
+from PIL import Image
+
+from biosearch_core.prediction.inference_server import (
+    DynamicBatcher,
+    create_app,
+    create_batcher,
+)
+
+
+class FakeTree:
+    """Labels every image by its mean intensity, recording the batch sizes"""
+
+    sizes = [(32, 24)]
+
+    def __init__(self):
+        self.batches = []
+
+    def route_with_probs(self, batch):
+        """Label and levels as HierarchicalPredictor.route_with_probs"""
+        images = batch[(32, 24)]
+        self.batches.append(len(images))
+        labels = np.array(
+            ["exp.gel" if el.mean() > 0.5 else "mic" for el in images], dtype=object
+        )
+        levels = [[(el.split(".")[0], 0.9)] for el in labels]
+        return labels, levels
+
+
+def _create_images(tmp_dir: str):
+    Image.new("RGB", (64, 48), (250, 250, 250)).save(Path(tmp_dir) / "light.png")
+    Image.new("L", (64, 48), 10).save(Path(tmp_dir) / "dark.jpg")
+
+
+def test_batcher_groups_concurrent_requests():
+    """Images submitted within the window go through the tree together"""
+    tree = FakeTree()
+    batcher = DynamicBatcher(tree, max_batch_size=8, max_wait_ms=200)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _create_images(tmp_dir)
+        paths = [Path(tmp_dir) / "light.png", Path(tmp_dir) / "dark.jpg"] * 4
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(lambda el: batcher.predict([el])[0], paths))
+    batcher.close()
+
+    assert [el[0] for el in results] == ["exp.gel", "mic"] * 4
+    assert sum(tree.batches) == 8
+    assert len(tree.batches) < 8
+
+
+def test_server_predicts_paths_and_files():
+    """The predict endpoint accepts paths under the image folder and files"""
+    batcher = DynamicBatcher(FakeTree(), max_batch_size=4, max_wait_ms=1)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        _create_images(tmp_dir)
+        client = create_app(batcher, tmp_dir).test_client()
+
+        response = client.post("/predict", json={"paths": ["light.png", "dark.jpg"]})
+        assert response.status_code == 200
+        predictions = response.get_json()["predictions"]
+        assert [el["label"] for el in predictions] == ["exp.gel", "mic"]
+        assert predictions[0]["levels"] == [{"label": "exp", "probability": 0.9}]
+
+        with open(Path(tmp_dir) / "dark.jpg", "rb") as reader:
+            response = client.post("/predict", data={"images": (reader, "dark.jpg")})
+        assert response.get_json()["predictions"][0]["label"] == "mic"
+
+        response = client.post("/predict", json={"paths": ["../light.png"]})
+        assert response.status_code == 400
+        response = client.post("/predict", json={"paths": ["missing.png"]})
+        assert response.status_code == 400
+    batcher.close()
+
+
+def test_batcher_rejects_multi_head_models():
+    """The server routes classifier trees, a multi-head file is rejected"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        classifiers_path = Path(tmp_dir) / "classifiers.json"
+        with open(classifiers_path, "w", encoding="utf-8") as writer:
+            json.dump({"format": "multi-head", "path": "model.pt"}, writer)
+        with pytest.raises(ValueError):
+            create_batcher(str(classifiers_path), 8, 5)
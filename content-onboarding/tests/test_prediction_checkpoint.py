@@ -0,0 +1,31 @@
+""" Tests for resuming chunked predictions
+run: poetry run pytest tests/test_prediction_checkpoint.py
+"""
+
+import tempfile
+from pathlib import Path
+
+from biosearch_core.data.figure import SubFigureStatus
+from biosearch_core.prediction.checkpoint import PredictionCheckpoint
+
+
+def test_checkpoint_keeps_last_committed_id():
+    """The last recorded id is returned for the same schema and status only"""
+    status = SubFigureStatus.NOT_PREDICTED.value
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "predict_checkpoint.json"
+        checkpoint = PredictionCheckpoint(path, "cord19", status)
+        assert checkpoint.last_id() == 0
+
+        checkpoint.record(120, predicted=100)
+        checkpoint.record(250, predicted=200)
+        assert PredictionCheckpoint(path, "cord19", status).last_id() == 250
+        assert PredictionCheckpoint(path, "cord19", None).last_id() == 0
+        assert PredictionCheckpoint(path, "gdx", status).last_id() == 0
+
+        with open(path, "w", encoding="utf-8") as writer:
+            writer.write('{"schema": "cord')
+        assert checkpoint.last_id() == 0
+
+        checkpoint.clear()
+        assert not path.exists()
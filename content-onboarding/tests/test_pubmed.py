@@ -0,0 +1,107 @@
+""" Tests for the cached PubMed summaries used by the GDX loader
+run: poetry run pytest tests/test_pubmed.py
+"""
+
+import json
+import tempfile
+import time
+from os import makedirs
+from pathlib import Path
+
+from biosearch_core.db_importer.loaders import GDXLoader
+from biosearch_core.db_importer.pubmed import (
+    EsummaryCache,
+    PubMedClient,
+    PubMedFetcher,
+    ReplaySession,
+    TokenBucket,
+)
+
+
+def fake_summary(pmid: str) -> dict:
+    """esummary fields read by the loader"""
+    return {
+        "uid": pmid,
+        "authors": [{"name": "Doe J"}],
+        "sortpubdate": "2020/01/02 00:00",
+        "fulljournalname": "Journal",
+        "articleids": [{"idtype": "doi", "value": f"10.1/{pmid}"}],
+    }
+
+
+def fast_client(session: ReplaySession) -> PubMedClient:
+    """Client without waiting between requests"""
+    return PubMedClient(session=session, bucket=TokenBucket(1000), backoff=0)
+
+
+def test_fetcher_batches_and_caches():
+    """Second fetch is answered from the cache, unknown pmids are skipped"""
+    summaries = {str(pmid): fake_summary(str(pmid)) for pmid in range(250)}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EsummaryCache(Path(tmp_dir) / "cache.sqlite")
+        session = ReplaySession(summaries)
+        fetcher = PubMedFetcher(fast_client(session), cache, batch_size=100)
+
+        pmids = [str(pmid) for pmid in range(240)] + ["unknown"]
+        fetched = fetcher.fetch(pmids)
+        assert len(fetched) == 240
+        assert sorted(len(el) for el in session.requests) == [41, 100, 100]
+
+        session.requests = []
+        fetched = fetcher.fetch([str(pmid) for pmid in range(250)])
+        assert len(fetched) == 250
+        assert session.requests == [[str(pmid) for pmid in range(240, 250)]]
+        cache.close()
+
+
+def test_client_retries_rate_limited_requests():
+    """429 responses are retried until the request succeeds"""
+    session = ReplaySession({"1": fake_summary("1")}, failures=2)
+    fetched = fast_client(session).fetch(["1"])
+    assert list(fetched.keys()) == ["1"]
+    assert len(session.requests) == 3
+
+
+def test_token_bucket_limits_rate():
+    """Without a burst capacity, tokens are handed at the bucket rate from a
+    cold start"""
+    bucket = TokenBucket(rate=50)
+    start = time.monotonic()
+    for _ in range(6):
+        bucket.acquire()
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+
+
+def test_fetcher_workers_follow_api_key():
+    """More concurrent requests only when the api key raises the rate"""
+    session = ReplaySession({})
+    assert PubMedFetcher(PubMedClient(session=session)).workers == 3
+    client = PubMedClient(api_key="key", session=session)
+    assert PubMedFetcher(client).workers == 10
+    assert client.bucket.rate == 10 and client.bucket.capacity == 1
+
+
+def test_gdx_loader_with_replay():
+    """Documents are created from the metadata and the replayed summaries"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        metadata = [
+            {"pmid": "1", "jaxid": "J1", "title": "t1", "abstract": "a1"},
+            {"pmid": "2", "jaxid": "J2", "title": "t2", "abstract": "a2"},
+            {"pmid": "3", "jaxid": "J3", "title": "t3", "abstract": "a3"},
+        ]
+        metadata_path = Path(tmp_dir) / "gdx.json"
+        with open(metadata_path, "w", encoding="utf-8") as writer:
+            json.dump(metadata, writer)
+        pdf_paths = []
+        for jaxid in ["J1", "J2"]:
+            makedirs(Path(tmp_dir) / jaxid)
+            pdf_paths.append(str(Path(tmp_dir) / jaxid))
+
+        session = ReplaySession({"1": fake_summary("1")})
+        loader = GDXLoader(fetcher=PubMedFetcher(fast_client(session)))
+        documents = loader.load(str(metadata_path), pdf_paths)
+
+        # J3 has no folder and pmid 2 is not in PubMed
+        assert [doc.cord_uid for doc in documents] == ["J1"]
+        assert documents[0].doi == "10.1/1"
+        assert session.requests == [["1", "2"]]
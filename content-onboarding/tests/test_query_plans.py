@@ -0,0 +1,124 @@
+""" EXPLAIN-based regression tests for the hot queries. The planner prefers
+sequential scans on tiny tables, so the tests disable them to check that an
+index exists that can answer each query.
+run: poetry run pytest tests/test_query_plans.py
+"""
+from typing import List
+import pytest
+from pytest_postgresql import factories
+from psycopg import Connection, Cursor
+
+from biosearch_core.data.document import (
+    DocumentModel,
+    surrogate_details_query,
+    subfigures_query,
+    surrogate_view_query,
+)
+from biosearch_core.db_importer.tables import (
+    create_documents_table,
+    create_figures_table,
+    create_indexes,
+    create_surrogate_view,
+)
+
+postgresql_my_proc = factories.postgresql_proc(host="localhost")
+postgresql_my = factories.postgresql("postgresql_my_proc")
+
+SCHEMA = "plans"
+
+
+@pytest.fixture()
+def database(postgresql) -> Connection:
+    """Tables, indexes and view with one document, a figure and two subfigures"""
+    owner = postgresql.info.user
+    with postgresql.cursor() as cursor:
+        cursor.execute(f"CREATE SCHEMA {SCHEMA}")
+        cursor.execute(create_documents_table(SCHEMA, owner))
+        cursor.execute(create_figures_table(SCHEMA, owner))
+        cursor.execute(create_indexes(SCHEMA))
+        cursor.execute(create_surrogate_view(SCHEMA, owner))
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.documents (title, project, import_date)
+                VALUES ('doc', 'cord19', now())"""
+        )
+        cursor.execute(
+            f"""INSERT INTO {SCHEMA}.figures
+                  (name, fig_type, doc_id, status, uri, parent_id, width, height, source)
+                VALUES ('fig', 0, 1, 0, 'PMC1/fig1.jpg', NULL, 10, 10, 'cord19'),
+                       ('001', 1, 1, 2, 'PMC1/fig1/001.jpg', 1, 5, 5, 'cord19'),
+                       ('002', 1, 1, 2, 'PMC1/fig1/002.jpg', 1, 5, 5, 'cord19')"""
+        )
+        postgresql.commit()
+    yield postgresql
+
+
+def explain(cursor: Cursor, query: str) -> List[str]:
+    """Plan lines for the query with sequential scans disabled"""
+    cursor.execute("SET enable_seqscan = off")
+    rows = cursor.execute(f"EXPLAIN {query}").fetchall()
+    return [row[0] for row in rows]
+
+
+def assert_no_seq_scan(plan: List[str], relation: str):
+    """Fail if the relation is read with a full scan"""
+    full_plan = "\n".join(plan)
+    assert f"Seq Scan on {relation}" not in full_plan, full_plan
+
+
+# pylint: disable=W0621:redefined-outer-name
+def test_surrogate_details_uses_indexes(database):
+    """Counting the figures of a document does not scan the figures table"""
+    with database.cursor() as cursor:
+        plan = explain(cursor, surrogate_details_query(SCHEMA, 1))
+        assert_no_seq_scan(plan, "figures")
+        assert "figures_doc_id_fig_type_idx" in "\n".join(plan)
+
+
+def test_subfigures_uses_parent_index(database):
+    """The subfigure self-join goes through the parent_id index"""
+    with database.cursor() as cursor:
+        plan = explain(cursor, subfigures_query(SCHEMA, 1))
+        assert_no_seq_scan(plan, "figures")
+        assert "figures_parent_id_idx" in "\n".join(plan)
+
+
+def test_prediction_candidates_use_status_index(database):
+    """Fetching subfigures to predict filters with the type and status index"""
+    query = f"SELECT id, uri FROM {SCHEMA}.figures WHERE fig_type=1 AND status=2"
+    with database.cursor() as cursor:
+        plan = explain(cursor, query)
+        assert_no_seq_scan(plan, "figures")
+        assert "figures_fig_type_status_idx" in "\n".join(plan)
+
+
+@pytest.mark.parametrize("folder_field", ["pmcid", "otherid"])
+def test_import_lookup_uses_document_index(database, folder_field):
+    """Finding the documents of an import batch does not scan the documents"""
+    query = f"""SELECT id, {folder_field} FROM {SCHEMA}.documents
+                WHERE {folder_field} = ANY('{{PMC1,PMC2}}'::text[])"""
+    with database.cursor() as cursor:
+        plan = explain(cursor, query)
+        assert_no_seq_scan(plan, "documents")
+        assert f"documents_{folder_field}_idx" in "\n".join(plan)
+
+
+def test_surrogate_view_matches_join(database):
+    """The materialized view returns the same rows as the join after refresh"""
+    with database.cursor() as cursor:
+        assert DocumentModel.refresh_surrogate_view(cursor, SCHEMA)
+        from_join = DocumentModel.fetch_subfigures(cursor, 1, SCHEMA)
+        from_view = DocumentModel.fetch_subfigures(cursor, 1, SCHEMA, from_view=True)
+        key = lambda el: el.subfigure_id  # pylint: disable=C3001
+        assert sorted(from_join, key=key) == sorted(from_view, key=key)
+        assert len(from_view) == 2
+
+        # second refresh runs concurrently on the populated view
+        assert DocumentModel.refresh_surrogate_view(cursor, SCHEMA)
+        plan = explain(cursor, surrogate_view_query(SCHEMA, 1))
+        assert_no_seq_scan(plan, "surrogate_subfigures")
+
+
+def test_refresh_without_view(database):
+    """Schemas created without the view are left untouched"""
+    with database.cursor() as cursor:
+        assert not DocumentModel.refresh_surrogate_view(cursor, "public")
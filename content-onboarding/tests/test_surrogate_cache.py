@@ -0,0 +1,74 @@
+""" Tests for the surrogate cache used by the search api"""
+
+from biosearch_core.db.surrogate_cache import SurrogateCache, parse_payload
+
+
+def test_cache_evicts_least_recently_used():
+    """The cache keeps at most max_entries documents"""
+    cache = SurrogateCache(max_entries=2)
+    cache.put("cord19", 1, "one")
+    cache.put("cord19", 2, "two")
+    assert cache.get("cord19", 1) == "one"  # 2 is now the oldest
+    cache.put("cord19", 3, "three")
+
+    assert len(cache) == 2
+    assert cache.get("cord19", 2) is None
+    assert cache.get("cord19", 1) == "one"
+    assert cache.get("cord19", 3) == "three"
+
+
+def test_compute_only_on_miss():
+    """Hot documents are not recomputed"""
+    cache = SurrogateCache()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return "payload"
+
+    assert cache.get_or_compute("cord19", 1, compute) == "payload"
+    assert cache.get_or_compute("cord19", 1, compute) == "payload"
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_invalidation_during_compute_is_not_cached():
+    """A payload read before an invalidation may be stale, so it is returned
+    but not stored"""
+    cache = SurrogateCache()
+
+    def compute_and_invalidate():
+        cache.invalidate("cord19", [2])
+        return "stale"
+
+    assert cache.get_or_compute("cord19", 1, compute_and_invalidate) == "stale"
+    assert cache.get("cord19", 1) is None
+
+    # other schemas are cached while a schema is invalidated
+    assert cache.get_or_compute("gxd", 1, compute_and_invalidate) == "stale"
+    assert cache.get("gxd", 1) == "stale"
+
+    assert cache.get_or_compute("cord19", 1, lambda: "fresh") == "fresh"
+    assert cache.get("cord19", 1) == "fresh"
+
+
+def test_invalidate_documents_and_schemas():
+    """Invalidation drops documents or whole schemas"""
+    cache = SurrogateCache()
+    cache.put("cord19", 1, "a")
+    cache.put("cord19", 2, "b")
+    cache.put("gxd", 1, "c")
+
+    cache.invalidate(*parse_payload("cord19:1"))
+    assert cache.get("cord19", 1) is None
+    assert cache.get("cord19", 2) == "b"
+
+    cache.invalidate(*parse_payload("cord19"))
+    assert cache.get("cord19", 2) is None
+    assert cache.get("gxd", 1) == "c"
+
+
+def test_parse_payload():
+    """Payloads carry the schema and optionally the document ids"""
+    assert parse_payload("gxd") == ("gxd", None)
+    assert parse_payload("gxd:3,10") == ("gxd", [3, 10])
@@ -0,0 +1,39 @@
+""" Tests for the synthetic project used by the import benchmarks
+run: poetry run pytest tests/test_synthetic_project.py
+"""
+
+import tempfile
+from pathlib import Path
+
+from biosearch_core.db.model import ConnectionParams
+from biosearch_core.db_importer.importer import ImportManager
+from biosearch_core.db_importer.loaders import Cord19Loader
+from biosearch_core.db_importer.project import Project
+from biosearch_core.db_importer.synthetic import create_import_tree
+
+FAKE_CONN = ConnectionParams(None, 1, None, None, None, "schema")
+
+
+def test_synthetic_project_is_importable():
+    """Every generated folder passes validation, is found in the metadata and
+    yields the requested figures and subfigures with coordinates"""
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        project_dir = Path(tmp_dir) / "cord19"
+        metadata_path = create_import_tree(project_dir, 4, 3, 2)
+        import_dir = Project.import_dir(project_dir)
+        paths = sorted(str(el) for el in import_dir.iterdir())
+        assert len(paths) == 4
+
+        manager = ImportManager(tmp_dir, "cord19", FAKE_CONN, workers=2)
+        assert manager.validate_pdf_folders(paths) == []
+
+        documents = Cord19Loader().load(str(metadata_path), paths)
+        assert sorted(doc.pmcid for doc in documents) == [Path(el).name for el in paths]
+
+        pmc_to_id = {doc.pmcid: idx for idx, doc in enumerate(documents)}
+        figures = manager.fetch_figures(paths, pmc_to_id)
+        assert len(figures) == 12
+        url_to_id = {el.uri: idx for idx, el in enumerate(figures)}
+        subfigures = manager.fetch_subfigures(figures, url_to_id)
+        assert len(subfigures) == 24
+        assert all(len(el.coordinates) == 4 for el in subfigures)
@@ -0,0 +1,74 @@
+""" Images/sec per core of the inference decode paths.
+  - array: skimage decode, numpy array, ToPILImage and resize (former path)
+  - draft: PIL draft-mode decode at the resize size, no numpy round trip
+Both run in a single process with one torch thread over the same images, with
+the inference transforms of the model. The mean absolute difference between
+the tensors of both paths is reported, as draft mode changes the pixels of
+downscaled JPEG images. Pillow-SIMD is a drop-in replacement for Pillow
+(pip install pillow-simd); the Pillow build in use is logged.
+
+  python benchmark_decode.py IMG_DIR [--model efficientnet-b1] [--limit 500]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from os import listdir
+import time
+import PIL
+import torch
+from pandas import DataFrame
+
+from image_modalities_classifier.dataset.image_dataset import EvalImageDataset
+from image_modalities_classifier.dataset.transforms import ModalityTransforms
+
+EXTENSIONS = (".jpg", ".jpeg", ".png")
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="benchmark image decoding")
+    parser.add_argument("img_dir", type=str, help="folder with images")
+    parser.add_argument("--model", type=str, default="efficientnet-b1", help="model defining the input size")
+    parser.add_argument("--limit", type=int, default=500, help="max images to decode")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def time_dataset(dataset: EvalImageDataset):
+    """Seconds to decode and transform every image, and the tensors"""
+    start_time = time.time()
+    tensors = [dataset[idx] for idx in range(len(dataset))]
+    return time.time() - start_time, tensors
+
+
+def main():
+    """Decode the images with both paths"""
+    args = parse_args(argv[1:])
+    torch.set_num_threads(1)
+    names = [el for el in listdir(args.img_dir) if el.lower().endswith(EXTENSIONS)]
+    data = DataFrame(sorted(names)[: args.limit], columns=["img_path"])
+    # identity normalization, both paths share the model input size
+    transforms = ModalityTransforms(args.model, [0, 0, 0], [1, 1, 1])
+    transforms = transforms.inference_transforms()
+
+    results = {}
+    for name, fast_decode in [("array", False), ("draft", True)]:
+        dataset = EvalImageDataset(
+            data, args.img_dir, transforms, fast_decode=fast_decode
+        )
+        results[name] = time_dataset(dataset)
+    print(f"{len(data)} images, {args.model}, Pillow {PIL.__version__}")
+    for name, (elapsed, _) in results.items():
+        print(f"{name:>6}: {len(data) / elapsed:8.1f} images/sec per core")
+
+    diffs = [
+        (array - draft).abs().mean().item()
+        for array, draft in zip(results["array"][1], results["draft"][1])
+    ]
+    print(f"mean abs difference: {sum(diffs) / len(diffs):.4f}")
+
+
+if __name__ == "__main__":
+    main()
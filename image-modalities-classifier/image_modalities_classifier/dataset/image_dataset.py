@@ -1,14 +1,23 @@
-""" Datasets for training, validation, test, and inference """
+""" Datasets for training, validation, test, and inference.
+The inference datasets decode straight into PIL images. JPEG files are decoded
+in draft mode, at the smallest 1/2, 1/4 or 1/8 scale that is still larger than
+the input of the model, instead of decoding every full-resolution pixel and
+resizing it afterwards.
+"""
 
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 import torch
 from pandas import DataFrame
+from PIL import Image
 from skimage import io
 from skimage.color import gray2rgb
-from torchvision.transforms import Compose
+from torchvision.transforms import CenterCrop, Compose, Resize, ToPILImage, ToTensor
 from numpy import int64
 
+from image_modalities_classifier.dataset.tensor_cache import cached_transform
+
 
 def read_image(data: DataFrame, base_dir: str, path_col: str, idx):
     """Convert image in index to RGB"""
@@ -22,6 +31,45 @@ def read_image(data: DataFrame, base_dir: str, path_col: str, idx):
     return image
 
 
+def load_image(img_path: Path, draft_size: Optional[int] = None) -> Image.Image:
+    """Open the image (path or file object) as RGB. With draft_size, JPEG
+    images are decoded at a reduced scale that still covers draft_size x
+    draft_size"""
+    with Image.open(img_path) as image:
+        if draft_size is not None:
+            image.draft("RGB", (draft_size, draft_size))
+        return image.convert("RGB")
+
+
+def decode_size(transform) -> Optional[int]:
+    """Largest side requested by the first Resize of a Compose"""
+    for step in getattr(transform, "transforms", []):
+        if isinstance(step, Resize):
+            size = step.size
+            return max(size) if isinstance(size, (list, tuple)) else size
+    return None
+
+
+def without_to_pil(transform) -> Optional[Compose]:
+    """Transform without its leading ToPILImage, None if it does not start
+    converting arrays to PIL images"""
+    steps = getattr(transform, "transforms", [])
+    if len(steps) == 0 or not isinstance(steps[0], ToPILImage):
+        return None
+    return Compose(steps[1:])
+
+
+def resolution_transforms(sizes: List[Tuple[int, int]]) -> Dict[Tuple, Compose]:
+    """Resize, crop and ToTensor on PIL images for every (resize, crop) size,
+    without normalization"""
+    return {
+        size: Compose(
+            [Resize((size[0], size[0])), CenterCrop((size[1], size[1])), ToTensor()]
+        )
+        for size in sizes
+    }
+
+
 class ImageDataset(torch.utils.data.Dataset):
     """Dataset for training, validation and testing steps that returns
     image and label tuples. It assumes that the input dataframe already has
@@ -62,20 +110,33 @@ class EvalImageDataset(torch.utils.data.Dataset):
     """Dataset used for inference.
     Compared to the ImageDataset, this dataset does not have any label value,
     so it only cares about converting the images based on the transform, and
-    returning the tensors
+    returning the tensors. With fast_decode and a transform starting with
+    ToPILImage, images are decoded with load_image at the size of the Resize
+    and the ToPILImage step is skipped. The resized and cropped images are
+    kept in the tensor cache when cache_dir or IMAGE_TENSOR_CACHE is set.
     """
 
+    # pylint: disable=too-many-arguments
     def __init__(
         self,
         data: DataFrame,
         base_img_dir: str,
         image_transform=None,
         path_col="img_path",
+        fast_decode: bool = True,
+        cache_dir: Optional[str] = None,
     ):
         self.base_dir = Path(base_img_dir)
         self.image_transform = image_transform
         self.path_col = path_col
         self.data = data
+        self.pil_transform = without_to_pil(image_transform) if fast_decode else None
+        self.draft_size = decode_size(image_transform)
+        self.cached = None
+        if self.pil_transform is not None:
+            self.cached = cached_transform(
+                self.pil_transform, cache_dir, self.draft_size
+            )
 
     def __len__(self) -> int:
         return self.data.shape[0]
@@ -83,7 +144,63 @@ class EvalImageDataset(torch.utils.data.Dataset):
     def __getitem__(self, idx) -> torch.Tensor:
         if torch.is_tensor(idx):
             idx = idx.tolist()
+        if self.pil_transform is not None:
+            img_path = self.base_dir / self.data.iloc[idx][self.path_col]
+            if self.cached is not None:
+                load = partial(load_image, img_path, self.draft_size)
+                return self.cached(img_path, load)
+            return self.pil_transform(load_image(img_path, self.draft_size))
         image = read_image(self.data, self.base_dir, self.path_col, idx)
         if self.image_transform:
             image = self.image_transform(image)
         return image
+
+
+class MultiResolutionImageDataset(torch.utils.data.Dataset):
+    """Dataset used for inference over a tree of classifiers.
+    Each image is read and decoded once, and returned resized and cropped for
+    every (resize, crop) size used by the classifiers in the tree. The tensors
+    are not normalized, as every classifier normalizes with the statistics of
+    its training data. JPEG images are decoded at the largest resize size, and
+    only if one of the sizes is not in the tensor cache.
+    """
+
+    # pylint: disable=too-many-arguments
+    def __init__(
+        self,
+        data: DataFrame,
+        base_img_dir: str,
+        sizes: List[Tuple[int, int]],
+        path_col="img_path",
+        fast_decode: bool = True,
+        cache_dir: Optional[str] = None,
+    ):
+        self.base_dir = Path(base_img_dir)
+        self.path_col = path_col
+        self.data = data
+        self.draft_size = max(el[0] for el in sizes) if fast_decode else None
+        self.transforms = resolution_transforms(sizes)
+        self.cached = {}
+        if fast_decode:
+            self.cached = {
+                size: cached_transform(transform, cache_dir, self.draft_size)
+                for size, transform in self.transforms.items()
+            }
+
+    def __len__(self) -> int:
+        return self.data.shape[0]
+
+    def __getitem__(self, idx) -> Dict[Tuple[int, int], torch.Tensor]:
+        if torch.is_tensor(idx):
+            idx = idx.tolist()
+        img_path = self.base_dir / self.data.iloc[idx][self.path_col]
+        # decoded at most once, only when a size is not cached
+        load = lru_cache(maxsize=1)(partial(load_image, img_path, self.draft_size))
+        images = {}
+        for size, transform in self.transforms.items():
+            cached = self.cached.get(size)
+            if cached is not None:
+                images[size] = cached(img_path, load)
+            else:
+                images[size] = transform(load())
+        return images
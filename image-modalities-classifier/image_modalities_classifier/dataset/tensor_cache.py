@@ -0,0 +1,168 @@
+""" On-disk cache of preprocessed images.
+The same subfigures are decoded, resized and cropped by every prediction run,
+every schema and every classifier of BI-LAVA onboarding. The cache stores the
+resized and cropped image as uint8 HWC arrays, one memory-mapped file per input
+size, so later runs only apply ToTensor and Normalize to the stored array.
+
+cache_dir/
+  272x272-240x240-draft272/  # Resize, CenterCrop and JPEG draft sizes
+    tensors.u8               # rows of crop_h x crop_w x 3 bytes
+    index.sqlite             # path -> (mtime_ns, row)
+
+The draft size is part of the key because JPEG images decoded at a reduced
+scale give slightly different pixels after the resize; "full" marks images
+decoded at full resolution.
+
+An entry is used only if the image has the mtime_ns stored with it; a modified
+image gets a new row. Rows are allocated in a sqlite transaction, so DataLoader
+workers in different processes can fill the same cache. Set IMAGE_TENSOR_CACHE
+to a folder to enable the cache in the datasets.
+"""
+
+from os.path import abspath
+from pathlib import Path
+from typing import Callable, Optional, Tuple
+import os
+import sqlite3
+import numpy as np
+from PIL import Image
+from torch import Tensor
+from torchvision.transforms import CenterCrop, Compose, Resize
+
+CACHE_ENV = "IMAGE_TENSOR_CACHE"
+
+
+class TensorCache:
+    """uint8 arrays of a fixed shape by image path"""
+
+    def __init__(self, cache_dir: Path, shape: Tuple[int, ...]):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.data_path = self.cache_dir / "tensors.u8"
+        self.index_path = self.cache_dir / "index.sqlite"
+        self.shape = tuple(shape)
+        self.row_bytes = int(np.prod(self.shape))
+        # opened lazily, connections and maps are not shared with forked workers
+        self._pid = None
+        self._conn = None
+        self._rows = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._rows = None
+            self._conn = sqlite3.connect(
+                self.index_path, timeout=60, isolation_level=None
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    path TEXT PRIMARY KEY,
+                    mtime_ns INTEGER NOT NULL,
+                    row INTEGER NOT NULL,
+                    ready INTEGER NOT NULL DEFAULT 0)"""
+            )
+        return self._conn
+
+    def _read_row(self, row: int) -> np.ndarray:
+        if self._rows is None or row >= len(self._rows):
+            num_rows = self.data_path.stat().st_size // self.row_bytes
+            self._rows = np.memmap(
+                self.data_path, np.uint8, "r", shape=(num_rows, *self.shape)
+            )
+        return np.array(self._rows[row])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.update({"_pid": None, "_conn": None, "_rows": None})
+        return state
+
+    def get(self, img_path: Path) -> Optional[np.ndarray]:
+        """Stored array of the image, None if missing or the image changed"""
+        conn = self._connection()
+        key = abspath(img_path)
+        entry = conn.execute(
+            "SELECT mtime_ns, row FROM entries WHERE path = ? AND ready = 1", (key,)
+        ).fetchone()
+        if entry is None or entry[0] != os.stat(key).st_mtime_ns:
+            return None
+        return self._read_row(entry[1])
+
+    def put(self, img_path: Path, array: np.ndarray):
+        """Store the array of the image in a new row"""
+        if array.shape != self.shape or array.dtype != np.uint8:
+            raise ValueError(f"expected uint8 {self.shape}, got {array.shape}")
+        conn = self._connection()
+        key = abspath(img_path)
+        mtime_ns = os.stat(key).st_mtime_ns
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM entries")
+            row = row.fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, 0)",
+                (key, mtime_ns, row),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        # readers skip the entry until its bytes are written
+        descriptor = os.open(self.data_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.pwrite(descriptor, array.tobytes(), row * self.row_bytes)
+        finally:
+            os.close(descriptor)
+        conn.execute(
+            "UPDATE entries SET ready = 1 WHERE path = ? AND row = ?", (key, row)
+        )
+
+
+class CachedTransform:
+    """Resize and crop read from the cache, or computed and stored on a miss.
+    The remaining steps (ToTensor, Normalize) run on the cached array."""
+
+    def __init__(self, cache: TensorCache, geometric: Compose, tensor: Compose):
+        self.cache = cache
+        self.geometric = geometric
+        self.tensor = tensor
+
+    def __call__(self, img_path: Path, load: Callable[[], Image.Image]) -> Tensor:
+        array = self.cache.get(img_path)
+        if array is None:
+            array = np.array(self.geometric(load()), dtype=np.uint8)
+            self.cache.put(img_path, array)
+        return self.tensor(array)
+
+
+def _size_name(size) -> str:
+    if isinstance(size, int):
+        return str(size)
+    return "x".join(str(el) for el in size)
+
+
+def cached_transform(
+    transform, cache_dir: Optional[str] = None, draft_size: Optional[int] = None
+) -> Optional[CachedTransform]:
+    """Cache for a transform on PIL images starting with Resize and
+    CenterCrop, applied to images loaded with draft_size. None when the cache
+    is disabled (no cache_dir and no IMAGE_TENSOR_CACHE) or the transform has
+    another structure."""
+    if cache_dir is None:
+        cache_dir = os.environ.get(CACHE_ENV)
+    if not cache_dir:
+        return None
+    steps = getattr(transform, "transforms", [])
+    if len(steps) < 2:
+        return None
+    if not isinstance(steps[0], Resize) or not isinstance(steps[1], CenterCrop):
+        return None
+
+    crop = steps[1].size
+    crop = (crop, crop) if isinstance(crop, int) else tuple(crop)
+    draft = "full" if draft_size is None else f"draft{draft_size}"
+    name = f"{_size_name(steps[0].size)}-{_size_name(crop)}-{draft}"
+    cache = TensorCache(Path(cache_dir) / name, (crop[0], crop[1], 3))
+    return CachedTransform(cache, Compose(steps[:2]), Compose(steps[2:]))
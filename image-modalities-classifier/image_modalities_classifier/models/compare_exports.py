@@ -0,0 +1,81 @@
+""" Compare a classifier checkpoint with its CPU exports.
+Every model predicts the test images of the dataset the classifier was trained
+on (parquet with img_path, label and split_set columns) on CPU, and the report
+lists images/sec, accuracy, macro F1, agreement with the checkpoint and file
+size. Run it for every classifier of the tree before replacing the
+checkpoints in the tree definition.
+
+  python compare_exports.py CHECKPOINT DATASET BASE_IMG_DIR EXPORT [EXPORT ...]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from os import cpu_count
+from pathlib import Path
+from typing import Dict, List
+import time
+import numpy as np
+from pandas import DataFrame, read_parquet
+from sklearn.metrics import f1_score
+
+from image_modalities_classifier.models.predict import (
+    RunConfig,
+    SingleModalityPredictor,
+)
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="compare exported classifiers")
+    parser.add_argument("checkpoint", type=str, help="ModalityModule checkpoint")
+    parser.add_argument("dataset", type=str, help="parquet with img_path, label, split_set")
+    parser.add_argument("base_img_dir", type=str)
+    parser.add_argument("exports", type=str, nargs="+", help="files from export.py")
+    parser.add_argument("--split_set", type=str, default="TEST")
+    parser.add_argument("--batch_size", type=int, default=32)
+    parser.add_argument("--num_workers", type=int, default=min(cpu_count(), 8))
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def evaluate(
+    model_path: str, config: RunConfig, data: DataFrame, base_img_dir: str
+) -> Dict:
+    """Time the classifier and score its predictions"""
+    predictor = SingleModalityPredictor(model_path, config)
+    start_time = time.time()
+    predictions = np.asarray(predictor.predict(data, base_img_dir))
+    elapsed = time.time() - start_time
+    labels = data.label.values
+    return {
+        "model": Path(model_path).name,
+        "images/sec": len(data) / elapsed,
+        "accuracy": (predictions == labels).mean(),
+        "macro_f1": f1_score(labels, predictions, average="macro"),
+        "MB": Path(model_path).stat().st_size / 1024**2,
+        "predictions": predictions,
+    }
+
+
+def main():
+    """Evaluate the checkpoint and every export on CPU"""
+    args = parse_args(argv[1:])
+    config = RunConfig(args.batch_size, args.num_workers, "cpu")
+    data = read_parquet(args.dataset)
+    data = data[data.split_set == args.split_set].reset_index(drop=True)
+
+    results: List[Dict] = [
+        evaluate(el, config, data, args.base_img_dir)
+        for el in [args.checkpoint] + args.exports
+    ]
+    reference = results[0]["predictions"]
+    for result in results:
+        result["agreement"] = (result.pop("predictions") == reference).mean()
+    print(f"{len(data)} images from {args.dataset}")
+    print(DataFrame(results).to_string(index=False, float_format="%.4f"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+""" Compare the per-model classifier tree with a shared-backbone model.
+Both predict the test images of a dataset (parquet with img_path, label and
+split_set columns) and report images/sec, accuracy and macro F1. Predictions
+are evaluated at the depth of the ground truth, i.e. exp.gel.wes is correct
+for a label exp.gel.
+
+  python compare_multi_head.py TREE_JSON MULTI_HEAD_PT DATASET BASE_IMG_DIR
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from os import cpu_count
+from typing import Dict, List
+import json
+import time
+from pandas import DataFrame, read_parquet
+from sklearn.metrics import f1_score
+from torch import cuda
+
+from image_modalities_classifier.models.multi_head import MultiHeadPredictor
+from image_modalities_classifier.models.predict import ModalityPredictor, RunConfig
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="compare classifier tree formats")
+    parser.add_argument("tree", type=str, help="json with the per-model classifier tree")
+    parser.add_argument("multi_head", type=str, help="shared-backbone model file")
+    parser.add_argument("dataset", type=str, help="parquet with img_path, label, split_set")
+    parser.add_argument("base_img_dir", type=str)
+    parser.add_argument("--split_set", type=str, default="TEST")
+    parser.add_argument("--batch_size", type=int, default=128)
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def at_label_depth(predictions: List[str], labels: List[str]) -> List[str]:
+    """Truncate the predictions to the number of levels of the labels"""
+    return [
+        ".".join(pred.split(".")[: len(label.split("."))])
+        for pred, label in zip(predictions, labels)
+    ]
+
+
+def evaluate(name: str, predictor, data: DataFrame, base_img_dir: str) -> Dict:
+    """Time the predictor and score the predictions"""
+    start_time = time.time()
+    output = predictor.predict(data.img_path.tolist(), base_img_dir)
+    elapsed = time.time() - start_time
+    labels = data.label.tolist()
+    predictions = at_label_depth(output.prediction.tolist(), labels)
+    correct = sum(pred == label for pred, label in zip(predictions, labels))
+    return {
+        "model": name,
+        "images/sec": len(data) / elapsed,
+        "accuracy": correct / len(data),
+        "macro_f1": f1_score(labels, predictions, average="macro"),
+    }
+
+
+def main():
+    """Run both formats over the same images"""
+    args = parse_args(argv[1:])
+    device = "cuda:0" if cuda.is_available() else "cpu"
+    config = RunConfig(args.batch_size, min(cpu_count(), 8), device)
+
+    data = read_parquet(args.dataset)
+    data = data[data.split_set == args.split_set].reset_index(drop=True)
+    with open(args.tree, "r", encoding="utf-8") as reader:
+        tree = json.load(reader)
+
+    predictors = {
+        "per-model tree": ModalityPredictor(tree, config),
+        "shared backbone": MultiHeadPredictor(args.multi_head, config),
+    }
+    results = [
+        evaluate(name, predictor, data, args.base_img_dir)
+        for name, predictor in predictors.items()
+    ]
+    print(f"{len(data)} images from {args.dataset}")
+    print(DataFrame(results).to_string(index=False, float_format="%.4f"))
+
+
+if __name__ == "__main__":
+    main()
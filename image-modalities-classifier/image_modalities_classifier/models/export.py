@@ -0,0 +1,201 @@
+""" Export trained classifiers for CPU inference.
+A ModalityModule checkpoint is traced to TorchScript and frozen, so the
+weights become constants of a graph that runs without Lightning. The float
+graph is optimized for inference when loaded; optimizing before saving bakes
+MKLDNN constants that torch.jit.load cannot read back.
+Optionally, the classifier is quantized to int8:
+  - dynamic: int8 weights for the Linear layers, activations quantized on the
+    fly. Only the classification layer changes, the safest option.
+  - static: int8 convolutions through FX graph mode quantization, with the
+    activation ranges calibrated on a sample of the training images.
+
+The export is a TorchScript file (.ts) with the hyperparameters used by the
+predictors stored in classifier.json. SingleModalityPredictor and the model
+registry load it in place of the checkpoint, on CPU only.
+
+  python export.py CHECKPOINT [--quantize none|dynamic|static]
+    [--dataset PARQUET --base_img_dir DIR --calibration_size 256]
+"""
+
+from sys import argv
+from argparse import ArgumentParser, Namespace
+from copy import deepcopy
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import json
+import logging
+import torch
+from torch import Tensor, nn
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+from torch.utils.data import DataLoader
+from pandas import read_parquet
+
+from image_modalities_classifier.dataset.image_dataset import EvalImageDataset
+from image_modalities_classifier.dataset.transforms import (
+    ModalityTransforms,
+    input_sizes,
+)
+from image_modalities_classifier.models.modality_module import ModalityModule
+
+FORMAT = "torchscript"
+EXPORT_SUFFIX = ".ts"
+METADATA_FILE = "classifier.json"
+QUANTIZATION_MODES = ["none", "dynamic", "static"]
+# int8 kernels for x86 CPUs
+QUANTIZED_ENGINE = "fbgemm"
+
+
+class ExportedModule(nn.Module):
+    """Exported classifier with the hyperparameters read by the predictors,
+    in place of a ModalityModule"""
+
+    def __init__(self, model: torch.jit.ScriptModule, hparams: Dict, nbytes: int):
+        super().__init__()
+        self.model = model
+        self.hparams = hparams
+        # frozen graphs keep the weights as constants, not parameters
+        self.nbytes = nbytes
+
+    # pylint: disable=arguments-differ
+    def forward(self, imgs):
+        """Logits of the exported classifier"""
+        return self.model(imgs)
+
+
+def is_exported(model_path: str) -> bool:
+    """Whether the path is a classifier exported by this module"""
+    return Path(model_path).suffix == EXPORT_SUFFIX
+
+
+def load_exported(model_path: str) -> ExportedModule:
+    """Load an exported classifier on CPU"""
+    extra_files = {METADATA_FILE: ""}
+    model = torch.jit.load(model_path, map_location="cpu", _extra_files=extra_files)
+    hparams = json.loads(extra_files[METADATA_FILE])
+    if hparams.get("format") != FORMAT:
+        raise ValueError(f"{model_path} is not an exported classifier")
+    if hparams["quantization"] == "none":
+        model = torch.jit.optimize_for_inference(model)
+    else:
+        torch.backends.quantized.engine = QUANTIZED_ENGINE
+    return ExportedModule(model, hparams, Path(model_path).stat().st_size)
+
+
+def calibration_loader(
+    module: ModalityModule,
+    dataset_path: str,
+    base_img_dir: str,
+    num_images: int = 256,
+    batch_size: int = 32,
+) -> DataLoader:
+    """Normalized images from a sample of the TRAIN split of the dataset the
+    classifier was trained on"""
+    data = read_parquet(dataset_path)
+    data = data[data.split_set == "TRAIN"]
+    data = data.sample(min(num_images, len(data)), random_state=443)
+    mean = [float(el) for el in module.hparams["mean_dataset"]]
+    std = [float(el) for el in module.hparams["std_dataset"]]
+    transforms = ModalityTransforms(module.hparams["name"], mean, std)
+    dataset = EvalImageDataset(
+        data.reset_index(drop=True), base_img_dir, transforms.test_transforms()
+    )
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False)
+
+
+def quantize_static(
+    model: nn.Module, example: Tensor, calibration: Iterable[Tensor]
+) -> nn.Module:
+    """int8 model with FX graph mode quantization, activation ranges observed
+    over the calibration images"""
+    torch.backends.quantized.engine = QUANTIZED_ENGINE
+    qconfig_mapping = get_default_qconfig_mapping(QUANTIZED_ENGINE)
+    prepared = prepare_fx(deepcopy(model), qconfig_mapping, example_inputs=(example,))
+    with torch.no_grad():
+        for images in calibration:
+            prepared(images)
+    return convert_fx(prepared)
+
+
+def export_classifier(
+    checkpoint_path: str,
+    output_path: Optional[str] = None,
+    quantize: str = "none",
+    calibration: Optional[Iterable[Tensor]] = None,
+) -> Path:
+    """Trace, quantize and freeze the classifier of the checkpoint. Static
+    quantization needs the calibration images."""
+    if quantize not in QUANTIZATION_MODES:
+        raise ValueError(f"quantize must be one of {QUANTIZATION_MODES}")
+    if quantize == "static" and calibration is None:
+        raise ValueError("static quantization needs calibration images")
+    if output_path is None:
+        checkpoint = Path(checkpoint_path)
+        output_name = f"{checkpoint.stem}.{quantize}{EXPORT_SUFFIX}"
+        output_path = checkpoint.with_name(output_name)
+
+    module = ModalityModule.load_from_checkpoint(checkpoint_path, map_location="cpu")
+    model = module.model.eval()
+    name = module.hparams["name"]
+    crop_size = input_sizes[name]["crop"]
+    example = torch.rand(1, 3, crop_size, crop_size)
+
+    if quantize == "dynamic":
+        model = quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+    elif quantize == "static":
+        model = quantize_static(model, example, calibration)
+
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(model, example))
+
+    hparams = {
+        "format": FORMAT,
+        "quantization": quantize,
+        "name": name,
+        "classes": list(module.hparams["classes"]),
+        "num_classes": module.hparams["num_classes"],
+        "mean_dataset": [float(el) for el in module.hparams["mean_dataset"]],
+        "std_dataset": [float(el) for el in module.hparams["std_dataset"]],
+    }
+    extra_files = {METADATA_FILE: json.dumps(hparams)}
+    torch.jit.save(frozen, str(output_path), _extra_files=extra_files)
+    logging.info("Exported %s to %s", checkpoint_path, output_path)
+    return Path(output_path)
+
+
+def parse_args(args) -> Namespace:
+    """Parse args from command line"""
+    # fmt: off
+    parser = ArgumentParser(prog="export classifier")
+    parser.add_argument("checkpoint", type=str, help="ModalityModule checkpoint")
+    parser.add_argument("--output", type=str, default=None, help="CHECKPOINT.QUANTIZE.ts")
+    parser.add_argument("--quantize", type=str, default="none", choices=QUANTIZATION_MODES)
+    parser.add_argument("--dataset", type=str, default=None, help="TRAIN parquet to calibrate")
+    parser.add_argument("--base_img_dir", type=str, default=None)
+    parser.add_argument("--calibration_size", type=int, default=256, help="TRAIN images")
+    parsed_args = parser.parse_args(args)
+    # fmt: on
+    return parsed_args
+
+
+def main():
+    """Export a checkpoint"""
+    args = parse_args(argv[1:])
+    calibration = None
+    if args.quantize == "static":
+        if args.dataset is None or args.base_img_dir is None:
+            raise ValueError("static quantization needs --dataset, --base_img_dir")
+        module = ModalityModule.load_from_checkpoint(
+            args.checkpoint, map_location="cpu"
+        )
+        calibration = calibration_loader(
+            module, args.dataset, args.base_img_dir, args.calibration_size
+        )
+    output_path = export_classifier(
+        args.checkpoint, args.output, args.quantize, calibration
+    )
+    print(output_path)
+
+
+if __name__ == "__main__":
+    main()
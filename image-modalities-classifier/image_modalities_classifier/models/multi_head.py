@@ -0,0 +1,271 @@
+""" Shared-backbone format for the classifier tree.
+The production tree runs an independent EfficientNet/ResNet per classifier, so
+an image reaching a leaf goes through up to four backbones. In this format a
+single frozen feature extractor computes the features of an image once, and
+every classifier of the tree is a linear head over those features.
+
+Heads are trained by ModalityModelTrainer.run_head over cached features of the
+shared backbone, and assembled with the tree definition into one file:
+
+{
+  "format": "multi-head",
+  "backbone": "efficientnet-b1",        # architecture of the extractor
+  "backbone_state": state_dict,
+  "mean": [...], "std": [...],          # normalization of the backbone
+  "tree": { "classifier": str, "classname": str, "children": [...] },
+  "heads": { classifier: { "classes": [...], "state_dict": state_dict } }
+}
+"""
+
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+import numpy as np
+import torch
+from torch import Tensor, nn, no_grad
+from torch.utils.data import DataLoader, TensorDataset
+from torchvision.transforms import Normalize
+from pandas import DataFrame
+from sklearn.preprocessing import LabelEncoder
+from tqdm import tqdm
+
+from image_modalities_classifier.dataset.image_dataset import (
+    MultiResolutionImageDataset,
+)
+from image_modalities_classifier.dataset.transforms import input_sizes
+from image_modalities_classifier.models.modality_module import (
+    ModalityModule,
+    create_model,
+)
+
+FORMAT = "multi-head"
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+# a linear probe over frozen features takes a few steps per epoch on the small
+# classifiers, and needs a higher rate than fine-tuning the whole network
+HEAD_LEARNING_RATE = 1e-2
+HEAD_EPOCHS = 100
+
+
+def load_backbone(
+    name: str, checkpoint: Optional[str] = None
+) -> Tuple[nn.Module, List[float], List[float]]:
+    """Frozen feature extractor and its normalization. Without a checkpoint
+    the ImageNet weights are used, otherwise the backbone of a trained
+    classifier (e.g. higher-modality) with its dataset statistics."""
+    if checkpoint is not None:
+        module = ModalityModule.load_from_checkpoint(checkpoint)
+        model = module.model
+        mean = [float(el) for el in module.hparams["mean_dataset"]]
+        std = [float(el) for el in module.hparams["std_dataset"]]
+    else:
+        params = {"num_classes": 1, "pretrained": True, "fine_tuned_from": "whole"}
+        model = create_model(name, {"name": name, **params})
+        mean, std = IMAGENET_MEAN, IMAGENET_STD
+    extractor = model.feature_extractor()
+    for param in extractor.parameters():
+        param.requires_grad = False
+    return extractor.eval(), mean, std
+
+
+class FeatureCache:
+    """Features of the shared backbone by image path, stored as npz so every
+    head of the tree and every training run reuse them"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index: Dict[str, int] = {}
+        self.features = None
+        if self.path.exists():
+            stored = np.load(self.path, allow_pickle=False)
+            self.index = {el: idx for idx, el in enumerate(stored["paths"].tolist())}
+            self.features = stored["features"]
+
+    def get(self, paths: List[str], extract) -> np.ndarray:
+        """Features of the paths, calling extract(missing_paths) for the ones
+        not cached and storing them"""
+        missing = list(dict.fromkeys(el for el in paths if el not in self.index))
+        if missing:
+            logging.info("Extracting features of %d images", len(missing))
+            new_features = extract(missing)
+            start = len(self.index)
+            self.index.update({el: start + idx for idx, el in enumerate(missing)})
+            self.features = (
+                new_features
+                if self.features is None
+                else np.concatenate([self.features, new_features])
+            )
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "wb") as writer:
+                np.savez(
+                    writer, paths=np.array(list(self.index)), features=self.features
+                )
+        return self.features[[self.index[el] for el in paths]]
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def fit_linear_head(
+    train: Tuple[np.ndarray, np.ndarray],
+    val: Tuple[np.ndarray, np.ndarray],
+    num_classes: int,
+    class_weights: Optional[List[float]] = None,
+    learning_rate: float = HEAD_LEARNING_RATE,
+    epochs: int = HEAD_EPOCHS,
+    patience: int = 10,
+    batch_size: int = 256,
+    device: str = "cpu",
+) -> nn.Linear:
+    """Train a linear classifier on features, keeping the weights with the
+    lowest validation loss"""
+    if len(val[1]) == 0:
+        raise ValueError("The validation set to fit the head is empty")
+    head = nn.Linear(train[0].shape[1], num_classes).to(device)
+    weight = None
+    if class_weights is not None:
+        weight = torch.tensor(class_weights, dtype=torch.float32, device=device)
+    loss_fn = nn.CrossEntropyLoss(weight=weight)
+    optimizer = torch.optim.AdamW(head.parameters(), lr=learning_rate)
+
+    train_loader = DataLoader(
+        TensorDataset(torch.from_numpy(train[0]), torch.from_numpy(train[1])),
+        batch_size=batch_size,
+        shuffle=True,
+    )
+    val_x = torch.from_numpy(val[0]).to(device)
+    val_y = torch.from_numpy(val[1]).to(device)
+
+    best_loss, best_state, waiting = float("inf"), None, 0
+    for _ in range(epochs):
+        head.train()
+        for features, labels in train_loader:
+            optimizer.zero_grad()
+            loss = loss_fn(head(features.to(device)), labels.to(device))
+            loss.backward()
+            optimizer.step()
+
+        head.eval()
+        with no_grad():
+            val_loss = loss_fn(head(val_x), val_y).item()
+        if val_loss < best_loss:
+            best_loss, waiting = val_loss, 0
+            best_state = {k: v.detach().clone() for k, v in head.state_dict().items()}
+        else:
+            waiting += 1
+            if waiting >= patience:
+                break
+    # with a NaN validation loss no epoch is kept, use the last weights
+    if best_state is not None:
+        head.load_state_dict(best_state)
+    return head.eval()
+
+
+def build_multi_head(
+    tree: Dict,
+    backbone_name: str,
+    output_path: str,
+    backbone_checkpoint: Optional[str] = None,
+):
+    """Assemble the heads saved by ModalityModelTrainer.run_head into a
+    multi-head file. The tree has the structure used by ModalityPredictor with
+    'head' (path to the head file) instead of 'path'."""
+    extractor, mean, std = load_backbone(backbone_name, backbone_checkpoint)
+    heads = {}
+
+    def strip(node: Dict) -> Dict:
+        head = torch.load(node["head"], map_location="cpu")
+        heads[node["classifier"]] = {
+            "classes": list(head["classes"]),
+            "state_dict": head["state_dict"],
+        }
+        return {
+            "classifier": node["classifier"],
+            "classname": node["classname"],
+            "children": [strip(el) for el in node["children"] or []],
+        }
+
+    torch.save(
+        {
+            "format": FORMAT,
+            "backbone": backbone_name,
+            "backbone_state": extractor.state_dict(),
+            "mean": mean,
+            "std": std,
+            "tree": strip(tree),
+            "heads": heads,
+        },
+        output_path,
+    )
+
+
+class MultiHeadPredictor:
+    """Predicts modalities with the shared backbone: the features of every
+    image are computed once and routed through the heads of the tree, starting
+    at the root and following the parent prediction"""
+
+    def __init__(self, model_path: str, config):
+        checkpoint = torch.load(model_path, map_location="cpu")
+        if checkpoint.get("format") != FORMAT:
+            raise ValueError(f"{model_path} is not a multi-head model")
+        self.config = config
+        self.name = checkpoint["backbone"]
+        model = create_model(
+            self.name,
+            {
+                "name": self.name,
+                "num_classes": 1,
+                "pretrained": False,
+                "fine_tuned_from": "whole",
+            },
+        )
+        self.backbone = model.feature_extractor()
+        self.backbone.load_state_dict(checkpoint["backbone_state"])
+        self.backbone.eval().to(config.device)
+        self.normalize = Normalize(checkpoint["mean"], checkpoint["std"])
+        self.input_size = (
+            input_sizes[self.name]["resize"],
+            input_sizes[self.name]["crop"],
+        )
+
+        # (classname, head, decoder) in BFS order, parents before children
+        self.nodes = []
+        fringe = [checkpoint["tree"]]
+        while len(fringe) > 0:
+            node = fringe.pop(0)
+            fringe += node["children"]
+            head_data = checkpoint["heads"][node["classifier"]]
+            head = nn.Linear(
+                head_data["state_dict"]["weight"].shape[1], len(head_data["classes"])
+            )
+            head.load_state_dict(head_data["state_dict"])
+            decoder = LabelEncoder()
+            decoder.fit(head_data["classes"])
+            head.eval().to(config.device)
+            self.nodes.append((node["classname"], head, decoder))
+
+    def _route(self, images: Tensor) -> np.ndarray:
+        with no_grad():
+            features = self.backbone(self.normalize(images.to(self.config.device)))
+            labels = np.full(len(features), "", dtype=object)
+            for class_name, head, decoder in self.nodes:
+                rows = np.flatnonzero(labels == class_name)
+                if len(rows) == 0:
+                    continue
+                outputs = head(features[torch.from_numpy(rows).to(features.device)])
+                predictions = outputs.argmax(dim=-1).cpu().numpy()
+                labels[rows] = decoder.inverse_transform(predictions)
+        return labels
+
+    def predict(self, relative_img_paths: List[str], base_img_path: str) -> DataFrame:
+        """Dataframe with img_path and prediction columns, in input order"""
+        data = DataFrame(columns=["img_path"], data=relative_img_paths)
+        dataset = MultiResolutionImageDataset(data, base_img_path, [self.input_size])
+        loader = DataLoader(
+            dataset=dataset,
+            batch_size=self.config.batch_size,
+            shuffle=False,
+            num_workers=self.config.num_workers,
+            drop_last=False,
+        )
+        labels = [self._route(batch[self.input_size]) for batch in tqdm(loader)]
+        data.loc[:, "prediction"] = np.concatenate(labels) if labels else []
+        return data
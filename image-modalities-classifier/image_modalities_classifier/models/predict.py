@@ -1,21 +1,42 @@
 """ Module for predicting modalities """
 
-from typing import List, Dict
+from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass, field
 from torch.cuda import empty_cache
 
 # pylint cannot find max inside torch for some reason
 # pylint: disable=no-name-in-module
-from torch import no_grad, max as torch_max
+from torch import Tensor, no_grad, max as torch_max
 from torch.utils.data import DataLoader
 import torch.nn.functional as nnf
-from numpy import ndarray, hstack, vstack
+from torchvision.transforms import Normalize
+from numpy import (
+    arange,
+    argsort,
+    bincount,
+    concatenate,
+    cumsum,
+    full,
+    hstack,
+    ndarray,
+    split,
+    unique,
+    vstack,
+)
 from pandas import DataFrame
 from sklearn.preprocessing import LabelEncoder
 from tqdm import tqdm
 from image_modalities_classifier.dataset.transforms import ModalityTransforms
-from image_modalities_classifier.dataset.image_dataset import EvalImageDataset
-from image_modalities_classifier.models.modality_module import ModalityModule
+from image_modalities_classifier.dataset.image_dataset import (
+    EvalImageDataset,
+    MultiResolutionImageDataset,
+)
+from image_modalities_classifier.models.export import is_exported
+from image_modalities_classifier.models.multi_head import (
+    FORMAT as MULTI_HEAD_FORMAT,
+    MultiHeadPredictor,
+)
+from image_modalities_classifier.models.registry import ModelRegistry, get_registry
 
 
 @dataclass
@@ -28,11 +49,22 @@ class RunConfig:
 
 
 class SingleModalityPredictor:
-    """Instantiates a trained model to predict a modality for a single classifier"""
+    """Instantiates a trained model to predict a modality for a single classifier.
+    model_path is a ModalityModule checkpoint or, for CPU inference, a
+    classifier exported by models/export.py"""
 
-    def __init__(self, model_path: str, config: RunConfig):
-        # checkpoint = torch.load(model_path)
-        self.module = ModalityModule.load_from_checkpoint(model_path)
+    def __init__(
+        self,
+        model_path: str,
+        config: RunConfig,
+        registry: Optional[ModelRegistry] = None,
+    ):
+        if is_exported(model_path) and str(config.device) != "cpu":
+            raise ValueError(f"{model_path} is exported for CPU inference")
+        # the checkpoint is loaded once per process and device, in eval mode
+        self.model_path = model_path
+        self.registry = registry if registry is not None else get_registry()
+        self.module = self.registry.get(model_path, config.device)
         self.mean = self.module.hparams["mean_dataset"]
         self.std = self.module.hparams["std_dataset"]
         self.classes = self.module.hparams["classes"]
@@ -41,6 +73,8 @@ class SingleModalityPredictor:
 
         transforms_manager = ModalityTransforms(self.name, self.mean, self.std)
         self.transforms = transforms_manager.test_transforms()
+        self.input_size = (transforms_manager.resize_size, transforms_manager.crop_size)
+        self.normalize = Normalize(self.mean, self.std)
 
         self.decoder = LabelEncoder()
         self.decoder.fit(self.classes)
@@ -102,6 +136,22 @@ class SingleModalityPredictor:
 
             return predictions, probabilities
 
+    def predict_batch(self, images: Tensor) -> ndarray:
+        """Class indices for a batch of images already resized to input_size
+        but not normalized, as returned by MultiResolutionImageDataset"""
+        with no_grad():
+            data = self.normalize(images.to(self.config.device))
+            return self.model(data).argmax(dim=-1).cpu().numpy()
+
+    def predict_batch_with_probs(self, images: Tensor) -> Tuple[ndarray, ndarray]:
+        """Class indices and their probabilities for a batch of images, as
+        predict_batch"""
+        with no_grad():
+            data = self.normalize(images.to(self.config.device))
+            probs = nnf.softmax(self.model(data), dim=1)
+            batch_probs, batch_predictions = torch_max(probs, dim=1)
+            return batch_predictions.cpu().numpy(), batch_probs.cpu().numpy()
+
     def _as_classes(self, predictions) -> List[str]:
         return self.decoder.inverse_transform(predictions)
 
@@ -114,7 +164,6 @@ class SingleModalityPredictor:
     ) -> List[str]:
         """Predict from input dataframe"""
         loader = self._get_dataloader(data, base_img_dir, path_col=path_col)
-        self.model.eval().to(self.config.device)
         predictions = self._predict(loader)
         if as_classes:
             return self._as_classes(predictions)
@@ -129,7 +178,6 @@ class SingleModalityPredictor:
     ) -> List[str]:
         """Predict from input dataframe and also return prediction probabilities"""
         loader = self._get_dataloader(data, base_img_dir, path_col=path_col)
-        self.model.eval().to(self.config.device)
         predictions, probabilities = self._predict_with_probs(loader)
         if as_classes:
             return self._as_classes(predictions), probabilities
@@ -151,11 +199,21 @@ class SingleModalityPredictor:
         return vstack(features)
 
     def free(self):
-        """Remove model from gpu"""
+        """Remove model from gpu, unloading it from the registry"""
         del self.model
+        del self.module
+        self.registry.evict(self.model_path)
         empty_cache()
 
 
+def group_rows(rows: ndarray, labels: ndarray) -> Dict[str, ndarray]:
+    """Row positions by label, keeping the input order within each label"""
+    values, inverse = unique(labels.astype(str), return_inverse=True)
+    order = argsort(inverse, kind="stable")
+    splits = split(rows[order], cumsum(bincount(inverse))[:-1])
+    return dict(zip(values.tolist(), splits))
+
+
 class ModalityPredictor:
     """Predicts modalities by traversing over a tree of classifiers
     Parameters:
@@ -169,48 +227,120 @@ class ModalityPredictor:
             {... recursive definition }
           ]
         }
+        or { 'format': 'multi-head', 'path': str } for a shared-backbone model
     """
 
-    def __init__(self, classifiers: Dict, config: RunConfig):
+    def __init__(self, classifiers: Dict, config: RunConfig, single_pass: bool = True):
         self.classifiers = classifiers
         self.config = config
-
-    def _load_dataframe(self, image_names: List[str]) -> DataFrame:
-        """Load a dummy dataframe because the Dataset requires the data to
-        be organized in a dataframe.
-        The prediction column starts as "" to match the classname of classifier
-        at the root (higher-modality), which reflects that the classifier has
-        no parent. We prefer "" over None to be able to do
-        .loc[df.prediction==CLASSNAME] later, and None requires a isna()
-        comparison. Therefore, == is simpler when all are strings.
-        """
-        data = DataFrame(columns=["img_path"], data=image_names)
-        data.loc[:, "prediction"] = ""
-        return data
-
-    def _merge_values(self, data: DataFrame, updated_subset: DataFrame) -> DataFrame:
-        """merge update dataframes with latest predicted values"""
-        data.set_index("img_path", inplace=True)
-        data.update(updated_subset.set_index("img_path"))
-        return data.reset_index(inplace=True)
+        self.single_pass = single_pass
 
     def predict(self, relative_img_paths: List[str], base_img_path: str) -> DataFrame:
-        """Traverse the classifiers in BFS to add labels by level"""
-        data = self._load_dataframe(relative_img_paths)
+        """Add the label of the deepest classifier reached by every image"""
+        if self.classifiers.get("format") == MULTI_HEAD_FORMAT:
+            # {"format": "multi-head", "path": str}, see models/multi_head.py
+            predictor = MultiHeadPredictor(self.classifiers["path"], self.config)
+            return predictor.predict(relative_img_paths, base_img_path)
+        if self.single_pass:
+            predictor = HierarchicalPredictor(self.classifiers, self.config)
+            return predictor.predict(relative_img_paths, base_img_path)
+        return self.predict_by_level(relative_img_paths, base_img_path)
+
+    def predict_by_level(
+        self, relative_img_paths: List[str], base_img_path: str
+    ) -> DataFrame:
+        """Traverse the classifiers in BFS to add labels by level. Every
+        classifier reads the images again from disk.
+        The labels are kept in an array by row position. The rows predicted by
+        a classifier are grouped by label once, giving the rows of each child,
+        so every level costs a scatter over its rows instead of filtering and
+        merging the whole dataframe per classifier. Rows start in the group ""
+        that matches the classname of the root classifier (higher-modality).
+        """
+        data = DataFrame(columns=["img_path"], data=relative_img_paths)
+        labels = full(len(data), "", dtype=object)
+        pending = {"": arange(len(data))}
 
         fringe = [self.classifiers]
         while len(fringe) > 0:
             classifier_node = fringe.pop(0)
-            class_name = classifier_node["classname"]
             if classifier_node["children"]:
                 fringe += classifier_node["children"]
 
-            model = SingleModalityPredictor(classifier_node["path"], self.config)
-            filtered_imgs = data.loc[data.prediction == class_name].copy()
-            if len(filtered_imgs) > 0:
+            rows = pending.pop(classifier_node["classname"], None)
+            if rows is not None and len(rows) > 0:
+                # models come from the process registry, loaded only once
+                model = SingleModalityPredictor(classifier_node["path"], self.config)
                 predictions = model.predict(
-                    filtered_imgs, base_img_path, as_classes=True
+                    data.iloc[rows], base_img_path, as_classes=True
                 )
-                filtered_imgs.loc[:, "prediction"] = predictions
-                self._merge_values(data, filtered_imgs)
+                labels[rows] = predictions
+                pending.update(group_rows(rows, labels[rows]))
+        data.loc[:, "prediction"] = labels
+        return data
+
+
+class HierarchicalPredictor:
+    """Single pass inference over a tree of classifiers (same definition as
+    ModalityPredictor). Every image is read and decoded once, and resized once
+    per input size in the tree. Each batch stays in memory while it is routed
+    from the root to the children matching the parent prediction, instead of
+    reading the images again for every level.
+    """
+
+    def __init__(self, classifiers: Dict, config: RunConfig):
+        self.config = config
+        # (classname, predictor) in BFS order, parents before their children
+        self.nodes = []
+        fringe = [classifiers]
+        while len(fringe) > 0:
+            classifier_node = fringe.pop(0)
+            if classifier_node["children"]:
+                fringe += classifier_node["children"]
+            predictor = SingleModalityPredictor(classifier_node["path"], config)
+            self.nodes.append((classifier_node["classname"], predictor))
+        self.sizes = sorted(set(predictor.input_size for _, predictor in self.nodes))
+
+    def _route(self, batch: Dict, levels: Optional[List[List]] = None) -> ndarray:
+        """Labels for a batch of images, "" matches the root classifier. With
+        levels (a list per image), the label and probability predicted by every
+        classifier reached by the image are appended to its list."""
+        num_images = len(next(iter(batch.values())))
+        labels = full(num_images, "", dtype=object)
+        pending = {"": arange(num_images)}
+        for class_name, predictor in self.nodes:
+            rows = pending.pop(class_name, None)
+            if rows is None or len(rows) == 0:
+                continue
+            images = batch[predictor.input_size][rows]
+            # pylint: disable=protected-access
+            if levels is None:
+                labels[rows] = predictor._as_classes(predictor.predict_batch(images))
+            else:
+                predictions, probs = predictor.predict_batch_with_probs(images)
+                labels[rows] = predictor._as_classes(predictions)
+                for row, prob in zip(rows, probs):
+                    levels[row].append((labels[row], float(prob)))
+            pending.update(group_rows(rows, labels[rows]))
+        return labels
+
+    def route_with_probs(self, batch: Dict) -> Tuple[ndarray, List[List]]:
+        """Labels for a batch of images as returned by the resolution
+        transforms, and the (label, probability) of every level"""
+        levels = [[] for _ in range(len(next(iter(batch.values()))))]
+        return self._route(batch, levels), levels
+
+    def predict(self, relative_img_paths: List[str], base_img_path: str) -> DataFrame:
+        """Dataframe with img_path and prediction columns, in input order"""
+        data = DataFrame(columns=["img_path"], data=relative_img_paths)
+        dataset = MultiResolutionImageDataset(data, base_img_path, self.sizes)
+        loader = DataLoader(
+            dataset=dataset,
+            batch_size=self.config.batch_size,
+            shuffle=False,
+            num_workers=self.config.num_workers,
+            drop_last=False,
+        )
+        labels = [self._route(batch) for batch in tqdm(loader)]
+        data.loc[:, "prediction"] = concatenate(labels) if labels else []
         return data
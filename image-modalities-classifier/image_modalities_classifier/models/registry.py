@@ -0,0 +1,138 @@
+""" Process-level registry of trained classifiers.
+Loading a checkpoint (ModalityModule.load_from_checkpoint) and moving it to the
+device costs more than predicting a few thousand images, and the predictors
+ask for the same classifiers on every node of the tree, every run and every
+schema. The registry loads each checkpoint once per device, in eval mode, and
+shares it between predictors. Entries are keyed by path and modification time
+so a retrained checkpoint is loaded again, and the least recently used models
+are evicted when the loaded parameters exceed the memory budget. Classifiers
+exported for CPU inference (models/export.py) are loaded the same way.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from os import environ
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Optional, Tuple
+import logging
+from torch import nn
+from torch.cuda import empty_cache
+
+from image_modalities_classifier.models.export import is_exported, load_exported
+from image_modalities_classifier.models.modality_module import ModalityModule
+
+# bytes of parameters and buffers kept loaded, override with MODEL_REGISTRY_BYTES
+DEFAULT_BUDGET = 4 * 1024**3
+
+
+@dataclass
+class RegistryEntry:
+    """Loaded module and the bytes it takes on its device"""
+
+    module: nn.Module
+    size: int
+
+
+def module_size(module: nn.Module) -> int:
+    """Bytes taken by the parameters and buffers of the module"""
+    if hasattr(module, "nbytes"):
+        # exported classifiers store their weights as graph constants
+        return module.nbytes
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(el.numel() * el.element_size() for el in tensors)
+
+
+def load_classifier(model_path: str) -> nn.Module:
+    """ModalityModule checkpoint or exported classifier"""
+    if is_exported(model_path):
+        return load_exported(model_path)
+    return ModalityModule.load_from_checkpoint(model_path)
+
+
+class ModelRegistry:
+    """LRU cache of modules keyed by (path, mtime, device). Thread-safe, a
+    checkpoint is loaded once even if requested from many threads."""
+
+    def __init__(
+        self,
+        max_bytes: Optional[int] = None,
+        loader: Callable[[str], nn.Module] = load_classifier,
+    ):
+        if max_bytes is None:
+            max_bytes = int(environ.get("MODEL_REGISTRY_BYTES", DEFAULT_BUDGET))
+        self.max_bytes = max_bytes
+        self.loader = loader
+        self.entries: "OrderedDict[Tuple[str, float, str], RegistryEntry]" = (
+            OrderedDict()
+        )
+        self.loaded_bytes = 0
+        self._lock = Lock()
+
+    @staticmethod
+    def _key(model_path: str, device: str) -> Tuple[str, float, str]:
+        path = Path(model_path).resolve()
+        return (str(path), path.stat().st_mtime, str(device))
+
+    def get(self, model_path: str, device: str) -> nn.Module:
+        """Module of the checkpoint in eval mode on the device"""
+        key = self._key(model_path, device)
+        with self._lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key].module
+
+            # drop previous versions of a retrained checkpoint
+            for old_key in [el for el in self.entries if el[0] == key[0]]:
+                if old_key[2] == key[2]:
+                    self._remove(old_key)
+
+            logging.info("Loading classifier %s on %s", key[0], device)
+            module = self.loader(key[0])
+            module.eval().to(device)
+            entry = RegistryEntry(module, module_size(module))
+            self._make_room(entry.size)
+            self.entries[key] = entry
+            self.loaded_bytes += entry.size
+            return module
+
+    def _make_room(self, size: int):
+        """Evict the least recently used modules until size fits the budget.
+        A module larger than the budget is still loaded, alone."""
+        while self.entries and self.loaded_bytes + size > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+
+    def _remove(self, key: Tuple[str, float, str]):
+        entry = self.entries.pop(key)
+        self.loaded_bytes -= entry.size
+        logging.info("Unloading classifier %s from %s", key[0], key[2])
+        if key[2].startswith("cuda"):
+            del entry
+            empty_cache()
+
+    def evict(self, model_path: str):
+        """Unload every version of the checkpoint from every device"""
+        path = str(Path(model_path).resolve())
+        with self._lock:
+            for key in [el for el in self.entries if el[0] == path]:
+                self._remove(key)
+
+    def clear(self):
+        """Unload all the modules"""
+        with self._lock:
+            for key in list(self.entries):
+                self._remove(key)
+
+
+_REGISTRY: Optional[ModelRegistry] = None
+_REGISTRY_LOCK = Lock()
+
+
+def get_registry() -> ModelRegistry:
+    """Registry shared by the predictors of the process"""
+    # pylint: disable=global-statement
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = ModelRegistry()
+        return _REGISTRY
@@ -23,6 +23,7 @@ from tqdm import tqdm
 import logging
 import pandas as pd
 from sklearn.preprocessing import LabelEncoder
+from sklearn.utils import class_weight
 
 from sklearn.metrics import f1_score
 import numpy as np
@@ -37,10 +38,20 @@ from pytorch_lightning.loggers import WandbLogger
 import wandb
 
 from image_modalities_classifier.dataset.utils import remove_small_classes
-from image_modalities_classifier.dataset.image_dataset import ImageDataset
+from image_modalities_classifier.dataset.image_dataset import (
+    EvalImageDataset,
+    ImageDataset,
+)
 from image_modalities_classifier.dataset.image_datamodule import ImageDataModule
 from image_modalities_classifier.dataset.transforms import ModalityTransforms
 from image_modalities_classifier.models.modality_module import ModalityModule
+from image_modalities_classifier.models.multi_head import (
+    HEAD_EPOCHS,
+    HEAD_LEARNING_RATE,
+    FeatureCache,
+    fit_linear_head,
+    load_backbone,
+)
 
 
 ENCODED_COL_NAME = "enc_label"
@@ -348,3 +359,93 @@ class ModalityModelTrainer:
         wandb.finish()
         self._append_logger_name(cp_name, wandb_logger.name)
         return f"{cp_name}{self.extension}"
+
+    def _extract_features(
+        self, extractor: torch.nn.Module, transforms, paths: List[str], device: str
+    ) -> np.ndarray:
+        data = pd.DataFrame(paths, columns=[self.img_path_col])
+        dataset = EvalImageDataset(
+            data, str(self.base_img_dir), transforms, path_col=self.img_path_col
+        )
+        loader = DataLoader(
+            dataset, batch_size=self.batch_size, num_workers=self.num_workers
+        )
+        features = []
+        with torch.no_grad():
+            for batch_imgs in tqdm(loader):
+                features.append(extractor(batch_imgs.to(device)).cpu().numpy())
+        return np.vstack(features).astype(np.float32)
+
+    def run_head(
+        self,
+        backbone_name: str,
+        backbone_checkpoint: Optional[str] = None,
+        cache_dir: Optional[str] = None,
+        learning_rate: float = HEAD_LEARNING_RATE,
+        epochs: int = HEAD_EPOCHS,
+    ) -> str:
+        """Train a linear head for the classifier over the features of a frozen
+        backbone shared by the whole tree (see models/multi_head.py).
+        The features are cached by image path in cache_dir (by default the
+        artifacts folder), so the heads of the tree and later runs only extract
+        the features of new images. The learning rate and epochs of the
+        trainer are meant for fine-tuning and are not used. Returns the name of
+        the head file."""
+        self._prepare_data()
+        self._create_artifacts_folder()
+        device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        extractor, mean, std = load_backbone(backbone_name, backbone_checkpoint)
+        extractor.to(device)
+        transforms = ModalityTransforms(backbone_name, mean, std).test_transforms()
+
+        tag = backbone_name
+        if backbone_checkpoint is not None:
+            tag = Path(backbone_checkpoint).stem
+        cache_dir = Path(cache_dir or self.artifacts_dir) / "features"
+        cache = FeatureCache(cache_dir / f"{self.taxonomy}_{tag}.npz")
+
+        splits = {}
+        for split_set in ["TRAIN", "VAL", "TEST"]:
+            split_df = self.data[self.data[self.partition_col] == split_set]
+            features = cache.get(
+                split_df[self.img_path_col].tolist(),
+                lambda paths: self._extract_features(
+                    extractor, transforms, paths, device
+                ),
+            )
+            splits[split_set] = (features, split_df[ENCODED_COL_NAME].values)
+
+        y_train = splits["TRAIN"][1]
+        weights = class_weight.compute_class_weight(
+            "balanced", classes=np.unique(y_train), y=y_train
+        )
+        head = fit_linear_head(
+            splits["TRAIN"],
+            splits["VAL"],
+            len(self.encoder.classes_),
+            class_weights=weights.tolist(),
+            learning_rate=learning_rate,
+            epochs=epochs,
+            patience=self.patience or 10,
+            device=device,
+        )
+
+        with torch.no_grad():
+            test_x = torch.from_numpy(splits["TEST"][0]).to(device)
+            preds = head(test_x).argmax(dim=-1).cpu().numpy()
+        macro_f1 = f1_score(splits["TEST"][1], preds, average="macro")
+        logging.info("%s head on %s: macro f1 %.4f", self.classifier, tag, macro_f1)
+        print("test macro f1", macro_f1)
+
+        head_name = f"{tag}_{self.classifier}_head_{self.version}{self.extension}"
+        torch.save(
+            {
+                "classifier": self.classifier,
+                "classes": self.encoder.classes_.tolist(),
+                "backbone": tag,
+                "state_dict": head.cpu().state_dict(),
+                "test_macro_f1": float(macro_f1),
+            },
+            self.output_dir / head_name,
+        )
+        return head_name
@@ -53,8 +53,11 @@ def train(
     gpus: int = 1,
     precision: int = 32,
     strategy: str = None,
+    head: bool = False,
+    backbone_checkpoint: Optional[str] = None,
 ):
-    """Train the model"""
+    """Train the model, or only a linear head over the frozen backbone of the
+    model when head is set (shared-backbone tree, see models/multi_head.py)"""
     dataset_path = find_latest_dataset(workspace, taxonomy, classifier)
     output_dir = str(Path(workspace) / "models")
     trainer = ModalityModelTrainer(
@@ -80,7 +83,10 @@ def train(
         precision=precision,
         strategy=strategy,
     )
-    trainer.run()
+    if head:
+        trainer.run_head(model, backbone_checkpoint)
+    else:
+        trainer.run()
 
 
 def setup_logger(workspace: str):
@@ -138,6 +144,12 @@ def parse_args(args) -> Namespace:
     parser.add_argument("--gpus", type=int, default=1)
     parser.add_argument("--precision", type=int, default=16)
     parser.add_argument("--strategy", type=str, default=None)
+    parser.add_argument(
+        "--head", action="store_true", help="Fit a head over the frozen backbone"
+    )
+    parser.add_argument(
+        "--backbone_checkpoint", type=str, default=None, help="Backbone for --head"
+    )
     parser.set_defaults(pseudo=False)
     parser.set_defaults(pretrained=False)
 
@@ -191,6 +203,8 @@ def main():
             args.gpus,
             args.precision,
             args.strategy,
+            args.head,
+            args.backbone_checkpoint,
         )
     # pylint: disable=broad-except
     except Exception:
@@ -2,10 +2,17 @@
 
 from os import listdir
 from pathlib import Path
+import tempfile
+import numpy as np
 import pandas as pd
 import torch
 from numpy import int64
-from image_modalities_classifier.dataset.image_dataset import ImageDataset
+from PIL import Image
+from image_modalities_classifier.dataset.image_dataset import (
+    EvalImageDataset,
+    ImageDataset,
+    MultiResolutionImageDataset,
+)
 from image_modalities_classifier.dataset.transforms import ModalityTransforms
 
 
@@ -27,3 +34,39 @@ def test_image_dataset():
     assert list(image.shape) == [3, 224, 224]
     assert isinstance(label, int64)
     assert label == 1
+
+
+def test_multi_resolution_dataset():
+    """Test that every input size is returned from a single decoded image"""
+    base_img_dir = str(Path("./tests/sample_data").resolve())
+    img_paths = [x for x in listdir(base_img_dir) if x.endswith(".png")]
+    input_df = pd.DataFrame(img_paths, columns=["img_path"])
+
+    sizes = [(256, 224), (272, 240)]
+    dataset = MultiResolutionImageDataset(input_df, base_img_dir, sizes)
+
+    images = dataset[0]
+    assert list(images[(256, 224)].shape) == [3, 224, 224]
+    assert list(images[(272, 240)].shape) == [3, 240, 240]
+
+
+def test_draft_decoding_matches_array_path():
+    """Test that draft-mode decoding returns the same input as the array path,
+    identical for png and close for a downscaled jpeg"""
+    transforms = ModalityTransforms("efficientnet-b1", [0, 0, 0], [1, 1, 1])
+    transforms = transforms.inference_transforms()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        gradient = (np.indices((1800, 2400)).sum(axis=0) // 16 % 256).astype(np.uint8)
+        pixels = np.stack([gradient, gradient // 2, 255 - gradient], axis=-1)
+        Image.fromarray(pixels).save(Path(tmp_dir) / "figure.jpg", quality=95)
+        Image.fromarray(pixels).save(Path(tmp_dir) / "figure.png")
+        input_df = pd.DataFrame(["figure.png", "figure.jpg"], columns=["img_path"])
+
+        array_ds = EvalImageDataset(input_df, tmp_dir, transforms, fast_decode=False)
+        draft_ds = EvalImageDataset(input_df, tmp_dir, transforms)
+        assert draft_ds.draft_size == 272
+
+        assert torch.equal(array_ds[0], draft_ds[0])
+        assert list(draft_ds[1].shape) == [3, 240, 240]
+        assert (array_ds[1] - draft_ds[1]).abs().mean().item() < 0.02
@@ -3,11 +3,21 @@
 
 from pathlib import Path
 from os import listdir
+import tempfile
+import numpy as np
 import pandas as pd
+import pytest
+import pytorch_lightning as pl
+import torch
+from image_modalities_classifier.models.export import export_classifier
+from image_modalities_classifier.models.modality_module import ModalityModule
 from image_modalities_classifier.models.predict import (
+    HierarchicalPredictor,
     SingleModalityPredictor,
     RunConfig,
+    group_rows,
 )
+from image_modalities_classifier.models.registry import ModelRegistry
 
 
 def test_prediction():
@@ -25,3 +35,93 @@ def test_prediction():
 
     # print(predictions)
     # assert len(predictions) == 2
+
+
+class FakeClassifier:
+    """Predicts the class stored in the first pixel of its input size"""
+
+    def __init__(self, input_size, classes):
+        self.input_size = input_size
+        self.classes = classes
+
+    def predict_batch(self, images):
+        """class index from the image content"""
+        return images[:, 0, 0, 0].long().numpy()
+
+    def _as_classes(self, predictions):
+        return [self.classes[el] for el in predictions]
+
+
+def test_hierarchical_routing():
+    """Images are routed to the children matching the parent prediction"""
+    predictor = HierarchicalPredictor.__new__(HierarchicalPredictor)
+    predictor.nodes = [
+        ("", FakeClassifier((256, 224), ["exp", "mic"])),
+        ("exp", FakeClassifier((272, 240), ["exp.gel", "exp.pla"])),
+    ]
+    small = torch.zeros((3, 3, 224, 224))
+    small[1] = 1
+    large = torch.zeros((3, 3, 240, 240))
+    large[2] = 1
+    # pylint: disable=W0212:protected-access
+    labels = predictor._route({(256, 224): small, (272, 240): large})
+    assert list(labels) == ["exp.gel", "mic", "exp.pla"]
+
+
+def test_group_rows_by_label():
+    """Rows are grouped by label keeping their order"""
+    groups = group_rows(
+        np.array([4, 7, 9, 10]), np.array(["exp", "mic", "exp", "gra"], dtype=object)
+    )
+    assert {key: value.tolist() for key, value in groups.items()} == {
+        "exp": [4, 9],
+        "gra": [10],
+        "mic": [7],
+    }
+
+
+def _save_checkpoint(path: Path) -> ModalityModule:
+    module = ModalityModule(
+        ["exp", "mic"],
+        2,
+        name="resnet18",
+        pretrained=False,
+        mean_dataset=[0.5, 0.5, 0.5],
+        std_dataset=[0.2, 0.2, 0.2],
+    )
+    torch.save(
+        {
+            "state_dict": module.state_dict(),
+            "hyper_parameters": dict(module.hparams),
+            "pytorch-lightning_version": pl.__version__,
+        },
+        path,
+    )
+    return module.eval()
+
+
+@pytest.mark.parametrize("quantize", ["none", "dynamic"])
+def test_exported_classifier_matches_checkpoint(quantize):
+    """Exported classifiers load as a predictor backend on CPU, and predict as
+    the checkpoint when not quantized"""
+    config = RunConfig(batch_size=4, num_workers=0, device="cpu")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        checkpoint = Path(tmp_dir) / "classifier.ckpt"
+        module = _save_checkpoint(checkpoint)
+        exported = export_classifier(str(checkpoint), quantize=quantize)
+        assert exported.name == f"classifier.{quantize}.ts"
+
+        predictor = SingleModalityPredictor(str(exported), config, ModelRegistry())
+        assert predictor.input_size == (256, 224)
+        assert list(predictor.classes) == ["exp", "mic"]
+
+        images = torch.rand((4, 3, 224, 224))
+        with torch.no_grad():
+            expected = module(predictor.normalize(images)).argmax(dim=-1).numpy()
+        predictions = predictor.predict_batch(images)
+        assert predictions.shape == (4,)
+        if quantize == "none":
+            assert (predictions == expected).all()
+
+        with pytest.raises(ValueError):
+            SingleModalityPredictor(str(exported), RunConfig(4, 0, "cuda:0"))
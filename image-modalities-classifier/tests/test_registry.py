@@ -0,0 +1,48 @@
+""" Model registry tests
+"""
+
+from os import utime
+from pathlib import Path
+import tempfile
+from torch import nn
+from image_modalities_classifier.models.registry import ModelRegistry, module_size
+
+
+def _fake_checkpoints(tmp_dir: str, names):
+    paths = []
+    for name in names:
+        path = Path(tmp_dir) / f"{name}.ckpt"
+        path.touch()
+        paths.append(str(path))
+    return paths
+
+
+def test_registry_loads_once_and_evicts_lru():
+    """Checkpoints are loaded once, reloaded when modified, and the least
+    recently used module is evicted when the budget is exceeded"""
+    loaded = []
+
+    def loader(path):
+        loaded.append(Path(path).name)
+        return nn.Linear(10, 10)
+
+    size = module_size(nn.Linear(10, 10))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        first, second, third = _fake_checkpoints(tmp_dir, ["a", "b", "c"])
+        registry = ModelRegistry(max_bytes=2 * size, loader=loader)
+
+        module = registry.get(first, "cpu")
+        assert registry.get(first, "cpu") is module
+        assert not module.training
+        registry.get(second, "cpu")
+        registry.get(first, "cpu")
+        registry.get(third, "cpu")
+        # b was the least recently used
+        assert registry.get(first, "cpu") is module
+        registry.get(second, "cpu")
+        assert loaded == ["a.ckpt", "b.ckpt", "c.ckpt", "b.ckpt"]
+        assert registry.loaded_bytes == 2 * size
+
+        utime(first, (0, 1))
+        assert registry.get(first, "cpu") is not module
+        assert loaded[-1] == "a.ckpt"
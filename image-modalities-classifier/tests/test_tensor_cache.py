@@ -0,0 +1,64 @@
+""" Preprocessed tensor cache tests
+"""
+
+from os import listdir, utime
+from pathlib import Path
+import tempfile
+import pandas as pd
+import torch
+from image_modalities_classifier.dataset.image_dataset import (
+    EvalImageDataset,
+    MultiResolutionImageDataset,
+)
+from image_modalities_classifier.dataset.transforms import ModalityTransforms
+
+
+def test_cached_tensors_match_decoded_images():
+    """Cached images return the tensors of a fresh decode, are shared between
+    datasets with the same input and decode sizes, and are recomputed when
+    modified"""
+    base_img_dir = str(Path("./tests/sample_data").resolve())
+    img_paths = [x for x in listdir(base_img_dir) if x.endswith(".png")][:2]
+    input_df = pd.DataFrame(img_paths, columns=["img_path"])
+    transforms = ModalityTransforms("efficientnet-b1", [0.5] * 3, [0.2] * 3)
+    transforms = transforms.inference_transforms()
+    expected = EvalImageDataset(input_df, base_img_dir, transforms)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dataset = EvalImageDataset(
+            input_df, base_img_dir, transforms, cache_dir=tmp_dir
+        )
+        cache = dataset.cached.cache
+        assert cache.cache_dir.name == "272x272-240x240-draft272"
+        assert cache.get(Path(base_img_dir) / img_paths[0]) is None
+
+        for _ in range(2):
+            for idx in range(len(input_df)):
+                assert torch.equal(dataset[idx], expected[idx])
+        assert cache.get(Path(base_img_dir) / img_paths[0]) is not None
+
+        multi = MultiResolutionImageDataset(
+            input_df, base_img_dir, [(272, 240)], cache_dir=tmp_dir
+        )
+        unnormalized = multi[1][(272, 240)]
+        assert torch.allclose(unnormalized, expected[1] * 0.2 + 0.5, atol=1e-6)
+        assert multi.cached[(272, 240)].cache.cache_dir == cache.cache_dir
+
+        # a tree decoding at a larger size keeps its own copy of the size
+        tree = MultiResolutionImageDataset(
+            input_df, base_img_dir, [(272, 240), (300, 300)], cache_dir=tmp_dir
+        )
+        tree_dir = tree.cached[(272, 240)].cache.cache_dir
+        assert tree_dir.name == "272x272-240x240-draft300"
+
+        # a modified image is decoded again
+        with tempfile.NamedTemporaryFile(suffix=".png", dir=tmp_dir) as copy:
+            copy.write((Path(base_img_dir) / img_paths[0]).read_bytes())
+            copy.flush()
+            copy_df = pd.DataFrame([copy.name], columns=["img_path"])
+            copy_ds = EvalImageDataset(copy_df, "/", transforms, cache_dir=tmp_dir)
+            first = copy_ds[0]
+            utime(copy.name, ns=(0, 1))
+            assert copy_ds.cached.cache.get(Path(copy.name)) is None
+            assert torch.equal(copy_ds[0], first)
+            assert copy_ds.cached.cache.get(Path(copy.name)) is not None
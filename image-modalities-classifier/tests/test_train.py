@@ -12,7 +12,11 @@ img_path	label	is_gt	split_set
 import tempfile
 from os import makedirs
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pytest
+import torch
+from image_modalities_classifier.models.multi_head import FeatureCache, fit_linear_head
 from image_modalities_classifier.models.trainer import ModalityModelTrainer
 from image_modalities_classifier.train import parse_args
 
@@ -185,3 +189,43 @@ def test_parser_without_mean_and_std():
     parsed_args = parse_args(args)
     assert parsed_args.mean is None
     assert parsed_args.std is None
+
+
+def test_feature_cache_extracts_missing_only():
+    """Cached features are reused and only new paths are extracted"""
+    requested = []
+
+    def extract(paths):
+        requested.append(paths)
+        return np.array([[float(el[-1])] * 2 for el in paths], dtype=np.float32)
+
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        cache_path = Path(tmpdirname) / "features" / "backbone.npz"
+        features = FeatureCache(cache_path).get(["img1", "img2"], extract)
+        assert features[:, 0].tolist() == [1.0, 2.0]
+
+        features = FeatureCache(cache_path).get(["img3", "img1", "img3"], extract)
+        assert features[:, 0].tolist() == [3.0, 1.0, 3.0]
+        assert requested == [["img1", "img2"], ["img3"]]
+
+
+def test_fit_linear_head_separable_features():
+    """A head trained with the default rate and epochs on separable features
+    predicts the training classes"""
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+    labels = np.repeat([0, 1], 50)
+    features = rng.normal(size=(100, 8)).astype(np.float32)
+    features[:, 0] += 6 * labels
+    head = fit_linear_head((features, labels), (features, labels), 2)
+    predictions = head(torch.from_numpy(features)).argmax(dim=-1).numpy()
+    assert (predictions == labels).mean() > 0.95
+
+
+def test_fit_linear_head_empty_validation():
+    """An empty validation set is rejected before training"""
+    features = np.zeros((4, 8), dtype=np.float32)
+    labels = np.array([0, 1, 0, 1])
+    empty = (np.zeros((0, 8), dtype=np.float32), np.zeros(0, dtype=np.int64))
+    with pytest.raises(ValueError):
+        fit_linear_head((features, labels), empty, 2)